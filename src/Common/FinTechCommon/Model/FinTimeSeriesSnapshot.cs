@@ -0,0 +1,114 @@
+using System;
+using System.Collections.Generic;
+using System.IO;
+using System.Linq;
+using System.Runtime.InteropServices;
+using System.Text;
+using SqCommon;
+
+namespace FinTechCommon
+{
+    // .sqfts snapshot file of a FinTimeSeries<DateOnly, float, uint>. The format is in docs/Design/TimeSeries.txt. Python builder/reader: src/Common/PyCommon/SqFinTimeSeries.py
+    // The file has the same layout as FinTimeSeries: the key array and one array per TickType. So Load() is one file read and one block copy per column, no parsing.
+    // MemDb can warm-start from these, instead of waiting for the YahooFinance download of the whole history.
+    public static class FinTimeSeriesSnapshot
+    {
+        static readonly byte[] g_magic = Encoding.ASCII.GetBytes("SQFTSNAP");
+        const ushort g_formatVersion = 1;
+        const int g_headerSize = 64;
+        const int g_columnSize = 16;
+        const int g_alignment = 64;
+        const byte g_keyTypeDateOnly = 1, g_valueTypeFloat = 1, g_valueTypeUint = 3;
+
+        static int Align(int p_offset)
+        {
+            return (p_offset + g_alignment - 1) / g_alignment * g_alignment;
+        }
+
+        public static FinTimeSeries<DateOnly, float, uint> Load(string p_fileName, out string p_ticker)
+        {
+            if (!BitConverter.IsLittleEndian)
+                throw new NotSupportedException("FinTimeSeriesSnapshot: the .sqfts arrays are little-endian.");
+            byte[] file = File.ReadAllBytes(p_fileName);
+            ReadOnlySpan<byte> span = file;
+            if (span.Length < g_headerSize || !span.Slice(0, 8).SequenceEqual(g_magic))
+                throw new InvalidDataException($"FinTimeSeriesSnapshot: '{p_fileName}' is not a .sqfts file.");
+            ushort version = BitConverter.ToUInt16(file, 8);
+            byte keyType = file[10], value1Type = file[11], value2Type = file[12];
+            int nColumns = BitConverter.ToUInt16(file, 14);
+            int nRows = (int)BitConverter.ToUInt32(file, 16);
+            long fileSize = BitConverter.ToInt64(file, 24);
+            if (version > g_formatVersion)
+                throw new InvalidDataException($"FinTimeSeriesSnapshot: '{p_fileName}' has version {version}, newer than {g_formatVersion}.");
+            if (fileSize != file.Length)
+                throw new InvalidDataException($"FinTimeSeriesSnapshot: '{p_fileName}' is {file.Length} bytes, the header says {fileSize} (truncated?).");
+            if (keyType != g_keyTypeDateOnly || value1Type != g_valueTypeFloat || value2Type != g_valueTypeUint)
+                throw new InvalidDataException($"FinTimeSeriesSnapshot: '{p_fileName}' is not a FinTimeSeries<DateOnly, float, uint> (key type {keyType}, value types {value1Type}, {value2Type}).");
+            p_ticker = Encoding.UTF8.GetString(file, 32, 32).TrimEnd('\0');
+
+            int keyOffset = Align(g_headerSize + g_columnSize * nColumns);
+            DateOnly[] keys = MemoryMarshal.Cast<byte, DateOnly>(span.Slice(keyOffset, nRows * sizeof(ushort))).ToArray();    // DateOnly is a ushort day count, the same bits as in the file
+            var values1 = new List<KeyValuePair<TickType, float[]>>();
+            var values2 = new List<KeyValuePair<TickType, uint[]>>();
+            for (int i = 0; i < nColumns; i++)
+            {
+                int columnEntry = g_headerSize + i * g_columnSize;
+                var tickType = (TickType)BitConverter.ToUInt16(file, columnEntry);
+                byte valueSet = file[columnEntry + 2];
+                int offset = (int)BitConverter.ToInt64(file, columnEntry + 8);
+                if (valueSet == 1)
+                    values1.Add(new KeyValuePair<TickType, float[]>(tickType, MemoryMarshal.Cast<byte, float>(span.Slice(offset, nRows * sizeof(float))).ToArray()));
+                else
+                    values2.Add(new KeyValuePair<TickType, uint[]>(tickType, MemoryMarshal.Cast<byte, uint>(span.Slice(offset, nRows * sizeof(uint))).ToArray()));
+            }
+            return new FinTimeSeries<DateOnly, float, uint>(keys, values1.ToArray(), values2.ToArray());
+        }
+
+        // Writes to a temp file, then renames it, so a concurrent Load() never sees a half written file.
+        public static void Save(string p_fileName, string p_ticker, FinTimeSeries<DateOnly, float, uint> p_ts)
+        {
+            if (!BitConverter.IsLittleEndian)
+                throw new NotSupportedException("FinTimeSeriesSnapshot: the .sqfts arrays are little-endian.");
+            DateOnly[] keys = p_ts.GetKeyArrayDirect().AsSpan(0, p_ts.Count).ToArray();   // the arrays can be longer than Count (Capacity)
+            var columns1 = p_ts.values1.Select(r => (r.Key, Data: MemoryMarshal.AsBytes(r.Value.AsSpan(0, p_ts.Count)).ToArray())).ToList();
+            var columns2 = p_ts.values2.Select(r => (r.Key, Data: MemoryMarshal.AsBytes(r.Value.AsSpan(0, p_ts.Count)).ToArray())).ToList();
+            int nColumns = columns1.Count + columns2.Count;
+
+            int keyOffset = Align(g_headerSize + g_columnSize * nColumns);
+            int offset = Align(keyOffset + keys.Length * sizeof(ushort));
+            var columnOffsets = new List<int>();
+            foreach (var column in columns1.Concat(columns2))
+            {
+                columnOffsets.Add(offset);
+                offset = Align(offset + column.Data.Length);
+            }
+            byte[] file = new byte[offset];     // zero padding between the arrays
+            g_magic.CopyTo(file, 0);
+            BitConverter.GetBytes(g_formatVersion).CopyTo(file, 8);
+            file[10] = g_keyTypeDateOnly;
+            file[11] = g_valueTypeFloat;
+            file[12] = g_valueTypeUint;
+            BitConverter.GetBytes((ushort)nColumns).CopyTo(file, 14);
+            BitConverter.GetBytes((uint)keys.Length).CopyTo(file, 16);
+            BitConverter.GetBytes((long)file.Length).CopyTo(file, 24);
+            byte[] tickerBytes = Encoding.UTF8.GetBytes(p_ticker);
+            Array.Copy(tickerBytes, 0, file, 32, Math.Min(32, tickerBytes.Length));
+            MemoryMarshal.AsBytes(keys.AsSpan()).CopyTo(file.AsSpan(keyOffset));
+            int iColumn = 0;
+            foreach (var (tickType, data, valueSet) in columns1.Select(r => (r.Key, r.Data, (byte)1)).Concat(columns2.Select(r => (r.Key, r.Data, (byte)2))))
+            {
+                int columnEntry = g_headerSize + iColumn * g_columnSize;
+                BitConverter.GetBytes((ushort)tickType).CopyTo(file, columnEntry);
+                file[columnEntry + 2] = valueSet;
+                BitConverter.GetBytes((long)columnOffsets[iColumn]).CopyTo(file, columnEntry + 8);
+                data.CopyTo(file, columnOffsets[iColumn]);
+                iColumn++;
+            }
+            File.WriteAllBytes(p_fileName + ".tmp", file);
+            if (File.Exists(p_fileName))
+                File.Replace(p_fileName + ".tmp", p_fileName, null);
+            else
+                File.Move(p_fileName + ".tmp", p_fileName);
+        }
+    }
+}
@@ -0,0 +1,517 @@
+# Build helpers shared by the SqCore build scripts (BuildAllProd.py, and the node_modules bootstrap of PreDebugBuildDev.py, PreDebugWatchDev.py).
+# Functions that run on a process pool have to live in a module (not in the script), because on Windows the pool workers re-import the modules of the functions.
+
+import os
+import sys
+import json
+import gzip
+import hashlib
+import platform
+import subprocess
+import signal
+import time
+import queue
+import threading
+import traceback
+import fnmatch
+import re
+import posixpath
+import shutil
+import concurrent.futures
+import SqTiming
+
+try:
+    import msvcrt   # Windows: file lock of the npm install
+    fcntl = None
+except ImportError:
+    import fcntl
+    msvcrt = None
+
+try:
+    import brotli   # pip install brotli. In-process compression, no process start per file.
+except ImportError:
+    brotli = None   # fallback: brotli.exe per file (still on the process pool)
+
+brotliExeWithPath = "c:/windows/system32/brotli.exe" if platform.system() == "Windows" else "brotli"
+
+# Compress one file into .br and .gz siblings. Runs in a pool worker process.
+# If the content hash equals 'cachedHash' (and the expected outputs are still there), it does nothing.
+# A variant is only kept if it is smaller than the original. (CompressedStaticFileMiddleware would not serve it anyway)
+# Returns (fileName, sha256, {ext: compressedSize or None}, isCompressed)
+def compressFile(fileName, cachedHash, cachedVariants):
+    with open(fileName, "rb") as file:
+        data = file.read()
+    sha256 = hashlib.sha256(data).hexdigest()
+    if sha256 == cachedHash and all((os.path.isfile(fileName + ext) == (size is not None)) for ext, size in cachedVariants.items()):
+        return (fileName, sha256, cachedVariants, False)
+
+    variants = {}
+    for ext in [".br", ".gz"]:
+        if ext == ".br":
+            if brotli is not None:
+                compressed = brotli.compress(data, quality = 11)    # same as 'brotli.exe --best'
+            else:
+                compressed = subprocess.run([brotliExeWithPath, "--best", "--stdout", fileName], stdout = subprocess.PIPE, check = True).stdout
+        else:
+            compressed = gzip.compress(data, compresslevel = 9, mtime = 0)  # mtime = 0: the same input always gives the same output
+        if len(compressed) < len(data):
+            with open(fileName + ext, "wb") as file:
+                file.write(compressed)
+            variants[ext] = len(compressed)
+        else:
+            if os.path.isfile(fileName + ext):
+                os.remove(fileName + ext)   # stale variant from an earlier build
+            variants[ext] = None
+    return (fileName, sha256, variants, True)
+
+# Precompress the text files under 'rootDir' into .br and .gz variants on a process pool (all cores).
+# Files whose content hash didn't change since the last build (cache in 'cacheFileName') are skipped.
+def compressStaticFiles(rootDir, fileExts, cacheFileName):
+    cache = {}
+    if os.path.isfile(cacheFileName):
+        with open(cacheFileName, "r") as file:
+            cache = json.load(file)
+
+    fileNames = []
+    for dirPath, dirs, files in os.walk(rootDir):
+        for f in files:
+            if os.path.splitext(f)[1] in fileExts:
+                fileNames.append((dirPath + "/" + f).replace(os.path.sep, "/"))
+
+    newCache = {}
+    nCompressed = 0
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        futures = [executor.submit(compressFile, f, cache.get(f, {}).get("sha256"), cache.get(f, {}).get("variants", {})) for f in fileNames]
+        for future in concurrent.futures.as_completed(futures):
+            (fileName, sha256, variants, isCompressed) = future.result()
+            newCache[fileName] = {"sha256": sha256, "variants": variants}
+            if isCompressed:
+                nCompressed += 1
+                print("SqBuild: Compressed: " + fileName + " " + str(os.path.getsize(fileName)) + " -> br: " + str(variants[".br"]) + ", gz: " + str(variants[".gz"]))
+
+    os.makedirs(os.path.dirname(os.path.abspath(cacheFileName)), exist_ok = True)
+    with open(cacheFileName, "w") as file:
+        json.dump(newCache, file, indent = 0, sort_keys = True)
+    print("SqBuild: Compression: %d files compressed, %d unchanged (cached)." % (nCompressed, len(fileNames) - nCompressed))
+
+encodingsByExt = {".br": "br", ".gz": "gzip"}   # precompressed variant -> Content-Encoding
+fingerprintedNameRegex = re.compile(r"^(.+)\.[0-9a-f]{10}(\.[^.]+)$")     # 'name.<10 hex>.ext': written by an earlier fingerprintAssets() run
+htmlUrlRegex = re.compile(r"""(\s(?:src|href)\s*=\s*["'])([^"']+)(["'])""", re.IGNORECASE)
+
+# Renames the static assets under 'wwwrootDir' (in the published folder, not in the source tree) to content-hashed names 'name.<sha256[:10]>.ext', together with their .br/.gz variants,
+# and rewrites the src/href references to them in all the HTML files (then recompresses those HTML files).
+# Not renamed: the files in the wwwroot root (conventional URLs like /favicon.ico), HTML files (entry URLs), and 'excludedDirs' (Angular, webpack outputs: already hashed by their bundler).
+# Writes 'manifestFileName' (JSON): logical URL path -> {"path": served (hashed) URL path, "size", "encodings": {"br": size, "gzip": size}}, for every file, so
+# CompressedStaticFileMiddleware can choose the variant without probing the file system, and serve the hashed URLs as immutable.
+# A logical path of a renamed asset is still served (from the manifest), because JS/CSS files can also refer to them.
+def fingerprintAssets(wwwrootDir, fileExts, excludedDirs, manifestFileName):
+    excludedPrefixes = ["/" + d.strip("/") + "/" for d in excludedDirs]
+    manifestUrlPath = "/" + os.path.relpath(manifestFileName, wwwrootDir).replace(os.path.sep, "/")
+    files = {}  # URL path -> full file name
+    for dirPath, dirs, fileNames in os.walk(wwwrootDir):
+        for f in fileNames:
+            urlPath = "/" + os.path.relpath(os.path.join(dirPath, f), wwwrootDir).replace(os.path.sep, "/")
+            if os.path.splitext(f)[1] not in encodingsByExt and urlPath != manifestUrlPath:
+                files[urlPath] = (dirPath + "/" + f).replace(os.path.sep, "/")
+
+    def isFingerprinted(urlPath):
+        return urlPath.count("/") > 1 and os.path.splitext(urlPath)[1].lower() in fileExts and not any(urlPath.startswith(p) for p in excludedPrefixes)
+
+    # 'dotnet publish' copied the logical files again, so the hashed files of the earlier run are stale
+    for urlPath in [u for u in files if isFingerprinted(u) and fingerprintedNameRegex.match(posixpath.basename(u))]:
+        for ext in [""] + list(encodingsByExt.keys()):
+            if os.path.isfile(files[urlPath] + ext):
+                os.remove(files[urlPath] + ext)
+        del files[urlPath]
+
+    hashedPaths = {}
+    for urlPath, fileName in files.items():
+        if isFingerprinted(urlPath):
+            (stem, ext) = os.path.splitext(fileName)
+            with open(fileName, "rb") as file:
+                hashedFileName = stem + "." + hashlib.sha256(file.read()).hexdigest()[:10] + ext
+            for variantExt in [""] + list(encodingsByExt.keys()):
+                if os.path.isfile(fileName + variantExt):
+                    os.replace(fileName + variantExt, hashedFileName + variantExt)
+            hashedPaths[urlPath] = posixpath.dirname(urlPath) + "/" + os.path.basename(hashedFileName)
+
+    nRewrittenHtmls = 0
+    for urlPath in [u for u in files if u.lower().endswith((".html", ".htm"))]:
+        def replaceUrl(match):
+            url = match.group(2)
+            urlFilePart = re.split(r"[?#]", url)[0]
+            if urlFilePart == "" or re.match(r"^([a-z]+:|//)", urlFilePart, re.IGNORECASE):
+                return match.group(0)   # external, data:, mailto:, or a '#fragment'
+            logical = urlFilePart if urlFilePart.startswith("/") else posixpath.normpath(posixpath.join(posixpath.dirname(urlPath), urlFilePart))
+            prevHashedMatch = fingerprintedNameRegex.match(posixpath.basename(logical))
+            if logical not in hashedPaths and prevHashedMatch is not None:  # an HTML rewritten by an earlier run ('dotnet publish' doesn't overwrite it, as it is newer than its source)
+                logical = posixpath.dirname(logical) + "/" + prevHashedMatch.group(1) + prevHashedMatch.group(2)
+            if logical not in hashedPaths:
+                return match.group(0)
+            return match.group(1) + posixpath.dirname(urlFilePart) + ("/" if "/" in urlFilePart else "") + posixpath.basename(hashedPaths[logical]) + url[len(urlFilePart):] + match.group(3)
+        with open(files[urlPath], "r", encoding = "utf-8", errors = "surrogateescape") as file:
+            content = file.read()
+        newContent = htmlUrlRegex.sub(replaceUrl, content)
+        if newContent != content:
+            with open(files[urlPath], "w", encoding = "utf-8", errors = "surrogateescape") as file:
+                file.write(newContent)
+            compressFile(files[urlPath], None, {})   # the .br/.gz variants of the old content are stale
+            nRewrittenHtmls += 1
+
+    manifest = {}
+    for urlPath, fileName in files.items():
+        servedPath = hashedPaths.get(urlPath, urlPath)
+        servedFileName = wwwrootDir + servedPath
+        encodings = {enc: os.path.getsize(servedFileName + ext) for ext, enc in encodingsByExt.items() if os.path.isfile(servedFileName + ext)}
+        manifest[urlPath] = {"path": servedPath, "size": os.path.getsize(servedFileName), "encodings": encodings}
+    with open(manifestFileName, "w") as file:
+        json.dump({"assets": manifest}, file, indent = 0, sort_keys = True)
+    print("SqBuild: Fingerprinting: %d assets renamed to content-hashed names, %d HTML files rewritten, %d files in %s." % (len(hashedPaths), nRewrittenHtmls, len(manifest), manifestFileName))
+
+# A node of the build DAG: either a shell 'command' or a Python 'func'. 'memMB' is the estimated peak memory, used by the scheduler to not run e.g. two 'ng build' and a 'dotnet build' together on a small machine.
+# If 'inputs' and 'outputs' (file patterns, see expandFilePatterns()) are given, the step is cached: when the fingerprint of the inputs (+ the command, + the output of 'versionCommand')
+# matches an earlier successful run, the step doesn't run. Its outputs are kept if intact, or restored from the content-addressed cache.
+class BuildStep:
+    def __init__(self, name, command = None, func = None, dependsOn = None, memMB = 500, inputs = None, outputs = None, versionCommand = None):
+        self.name = name
+        self.command = command
+        self.func = func
+        self.dependsOn = dependsOn if dependsOn is not None else []
+        self.memMB = memMB
+        self.inputs = inputs
+        self.outputs = outputs
+        self.versionCommand = versionCommand
+        self.process = None
+
+buildCacheDir = "obj/SqBuild/cache"     # objects/<sha256[:2]>/<sha256>: file contents, steps/<stepName>.json: fingerprint -> outputs of the last few successful runs
+nKeptCacheEntriesPerStep = 5
+skippedDirNames = set(["node_modules", "bin", "obj", ".git", ".vs"])     # never walked into by a pattern, unless the pattern's fixed folder part is already inside them
+notOutputPatterns = ["!*.br", "!*.gz"]  # precompressed variants are made later by compressStaticFiles(), they are not outputs of the steps that wrote the original files
+
+# File patterns relative to the CWD. '*' matches across folders too, so 'projects/HealthMonitor/*' is the whole subtree. A pattern starting with '!' removes the matching files.
+# Returns the sorted list of matching files, with '/' separators.
+def expandFilePatterns(patterns):
+    fileNames = set()
+    for pattern in [p for p in patterns if not p.startswith("!")]:
+        if not any(c in pattern for c in "*?["):
+            if os.path.isfile(pattern):
+                fileNames.add(pattern)
+            continue
+        fixedParts = []
+        for part in pattern.split("/"):
+            if any(c in part for c in "*?["):
+                break
+            fixedParts.append(part)
+        baseDir = "/".join(fixedParts) if len(fixedParts) > 0 else "."
+        for dirPath, dirs, files in os.walk(baseDir):
+            dirs[:] = [d for d in dirs if d not in skippedDirNames]
+            for f in files:
+                relPath = os.path.normpath(os.path.join(dirPath, f)).replace(os.path.sep, "/")
+                if fnmatch.fnmatchcase(relPath, pattern):
+                    fileNames.add(relPath)
+    for pattern in [p[1:] for p in patterns if p.startswith("!")]:
+        fileNames = set(f for f in fileNames if not fnmatch.fnmatchcase(f, pattern))
+    return sorted(fileNames)
+
+# File hashes are cached by (size, mtime), so fingerprinting an unchanged tree doesn't read the files. Shared by the parallel step threads.
+hashCacheFileName = "obj/SqBuild/hashCache.json"
+hashCache = None
+hashCacheLock = threading.Lock()
+
+def getFileHash(fileName):
+    global hashCache
+    st = os.stat(fileName)
+    with hashCacheLock:
+        if hashCache is None:
+            hashCache = {}
+            if os.path.isfile(hashCacheFileName):
+                with open(hashCacheFileName, "r") as file:
+                    hashCache = json.load(file)
+        cached = hashCache.get(fileName)
+    if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+    hasher = hashlib.sha256()
+    with open(fileName, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    sha256 = hasher.hexdigest()
+    with hashCacheLock:
+        hashCache[fileName] = [st.st_size, st.st_mtime_ns, sha256]
+    return sha256
+
+def saveHashCache():
+    with hashCacheLock:
+        if hashCache is not None:
+            os.makedirs(os.path.dirname(hashCacheFileName), exist_ok = True)
+            with open(hashCacheFileName, "w") as file:
+                json.dump(hashCache, file)
+
+def calcStepFingerprint(step):
+    hasher = hashlib.sha256()
+    hasher.update((step.command or step.name).encode("utf-8"))
+    if step.versionCommand is not None:
+        hasher.update(subprocess.run(step.versionCommand, shell = True, stdout = subprocess.PIPE, stderr = subprocess.STDOUT).stdout)
+    for f in expandFilePatterns(step.inputs):
+        hasher.update((f + ":" + getFileHash(f) + "\n").encode("utf-8"))
+    return hasher.hexdigest()
+
+def getCacheObjectFileName(sha256):
+    return buildCacheDir + "/objects/" + sha256[:2] + "/" + sha256
+
+def loadStepCacheEntries(step):
+    fileName = buildCacheDir + "/steps/" + step.name + ".json"
+    if not os.path.isfile(fileName):
+        return []
+    with open(fileName, "r") as file:
+        return json.load(file)
+
+# Returns True if the step can be skipped: its outputs are intact or were restored from the cache.
+def tryRestoreStepOutputs(step, fingerprint, logFile):
+    entry = next((e for e in loadStepCacheEntries(step) if e["fingerprint"] == fingerprint), None)
+    if entry is None:
+        return False
+    currentOutputs = expandFilePatterns(step.outputs + notOutputPatterns)
+    if currentOutputs == sorted(entry["outputs"].keys()) and all(getFileHash(f) == entry["outputs"][f] for f in currentOutputs):
+        logFile.write("SqBuild: Inputs unchanged, outputs intact. Skipped.\n")
+        return True
+    if not all(os.path.isfile(getCacheObjectFileName(sha256)) for sha256 in entry["outputs"].values()):
+        return False    # the object store was cleaned
+    for f in currentOutputs:
+        if f not in entry["outputs"]:
+            os.remove(f)    # stale output of another input state
+    for f, sha256 in entry["outputs"].items():
+        os.makedirs(os.path.dirname(f) or ".", exist_ok = True)
+        shutil.copyfile(getCacheObjectFileName(sha256), f)
+    logFile.write("SqBuild: Inputs unchanged, %d output files restored from cache.\n" % len(entry["outputs"]))
+    return True
+
+def storeStepOutputs(step, fingerprint):
+    outputs = {}
+    for f in expandFilePatterns(step.outputs + notOutputPatterns):
+        sha256 = getFileHash(f)
+        outputs[f] = sha256
+        objectFileName = getCacheObjectFileName(sha256)
+        if not os.path.isfile(objectFileName):
+            os.makedirs(os.path.dirname(objectFileName), exist_ok = True)
+            shutil.copyfile(f, objectFileName + ".tmp")
+            os.replace(objectFileName + ".tmp", objectFileName)
+    entries = [e for e in loadStepCacheEntries(step) if e["fingerprint"] != fingerprint]
+    entries = [{"fingerprint": fingerprint, "outputs": outputs}] + entries[:nKeptCacheEntriesPerStep - 1]
+    os.makedirs(buildCacheDir + "/steps", exist_ok = True)
+    with open(buildCacheDir + "/steps/" + step.name + ".json", "w") as file:
+        json.dump(entries, file)
+
+def getAvailableMemoryMB():
+    try:
+        import psutil
+        return psutil.virtual_memory().available // (1024 * 1024)
+    except ImportError:
+        pass
+    if os.path.isfile("/proc/meminfo"):
+        with open("/proc/meminfo", "r") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    if platform.system() == "Windows":
+        import ctypes
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong), ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong), ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong), ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+        memStatus = MEMORYSTATUSEX()
+        memStatus.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(memStatus))
+        return memStatus.ullAvailPhys // (1024 * 1024)
+    return None     # unknown: only the CPU count limits the parallelism
+
+# 'ng', 'tsc', 'npx' are .cmd files on Windows, so commands go through the shell. That shell is killed together with its children at fail-fast.
+def killProcessTree(process):
+    if process is None or process.poll() is not None:
+        return
+    if platform.system() == "Windows":
+        subprocess.run("taskkill /F /T /PID " + str(process.pid), stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    else:
+        os.killpg(process.pid, signal.SIGKILL)    # the step was started in its own session (process group)
+
+def runBuildStep(step, logFileName, events, timingScript):
+    startTime = time.time()
+    isOk = False
+    isCached = False
+    with open(logFileName, "w") as logFile:
+        try:
+            fingerprint = None
+            if step.inputs is not None and step.outputs is not None:
+                fingerprint = calcStepFingerprint(step)
+                isCached = tryRestoreStepOutputs(step, fingerprint, logFile)
+            if isCached:
+                isOk = True
+            elif step.command is not None:
+                logFile.write("SqBuild: Executing '" + step.command + "'\n")
+                logFile.flush()
+                step.process = subprocess.Popen(step.command, shell = True, stdout = logFile, stderr = subprocess.STDOUT, start_new_session = (platform.system() != "Windows"))
+                isOk = (step.process.wait() == 0)
+            else:
+                step.func()
+                isOk = True
+            if isOk and not isCached and fingerprint is not None:
+                storeStepOutputs(step, fingerprint)
+        except Exception:
+            isOk = False
+            logFile.write(traceback.format_exc())
+    SqTiming.record(timingScript, step.name, time.time() - startTime, ok = isOk, cached = isCached)
+    events.put((step, isOk, time.time() - startTime))  # after the log file is closed (flushed), because the scheduler prints it
+
+# Runs the steps as a DAG: a step starts as soon as all its 'dependsOn' steps are finished, while the number of running steps is below the CPU count and their summed 'memMB' fits into the available memory.
+# The output of each step goes into its own log file in 'logDir' and is printed in one block when the step finishes. The first failure kills the running steps and nothing new is started.
+# Every step's time (and the total) is recorded into the SqTiming history under 'timingScript'. Returns True if all steps succeeded.
+def runBuildSteps(steps, logDir = "obj/SqBuild/logs", timingScript = "SqBuild"):
+    os.makedirs(logDir, exist_ok = True)
+    maxParallel = os.cpu_count() or 1
+    memBudgetMB = getAvailableMemoryMB()
+    print("SqBuild: Running %d build steps, max %d in parallel, memory budget: %s MB" % (len(steps), maxParallel, str(memBudgetMB)))
+
+    stepNames = set(s.name for s in steps)
+    for step in steps:
+        for dep in step.dependsOn:
+            if dep not in stepNames:
+                raise Exception("Build step '" + step.name + "' depends on unknown step '" + dep + "'")
+
+    pending = list(steps)
+    running = []
+    done = set()
+    failedStep = None
+    events = queue.Queue()
+    startTime = time.time()
+    while True:
+        if failedStep is None:
+            for step in list(pending):
+                if not all(dep in done for dep in step.dependsOn):
+                    continue
+                runningMemMB = sum(s.memMB for s in running)
+                if len(running) > 0 and (len(running) >= maxParallel or (memBudgetMB is not None and runningMemMB + step.memMB > memBudgetMB)):
+                    break   # keep the declaration order: later steps don't overtake a step that waits for resources
+                pending.remove(step)
+                running.append(step)
+                print("SqBuild: Starting step '" + step.name + "'")
+                threading.Thread(target = runBuildStep, args = (step, logDir + "/" + step.name + ".log", events, timingScript), daemon = True).start()
+        if len(running) == 0:
+            break
+
+        (step, isOk, duration) = events.get()
+        running.remove(step)
+        with open(logDir + "/" + step.name + ".log", "r", errors = "replace") as logFile:
+            for line in logFile:
+                print("[" + step.name + "] " + line, end = '')
+        print("SqBuild: Step '%s' %s in %.1f seconds." % (step.name, "finished" if isOk else "FAILED", duration))
+        if isOk:
+            done.add(step.name)
+        elif failedStep is None:
+            failedStep = step
+            for s in running:
+                killProcessTree(s.process)
+
+    saveHashCache()
+    SqTiming.record(timingScript, "total", time.time() - startTime, ok = (failedStep is None))
+    if failedStep is None and len(pending) > 0:
+        raise Exception("Build steps with circular dependencies: " + ", ".join(s.name for s in pending))
+    print("SqBuild: %d/%d build steps finished in %.1f seconds.%s" % (len(done), len(steps), time.time() - startTime, "" if failedStep is None else " First failed step: '" + failedStep.name + "'. See " + logDir))
+    return failedStep is None
+
+# ---------- node_modules bootstrap of the build and PreDebug scripts
+
+nodeModulesStampFileName = "node_modules/.sqInstall.json"   # the fingerprint of the last successful 'npm ci'. Inside node_modules: deleting the folder also invalidates it.
+toolProbeCacheFileName = "obj/SqBuild/toolProbes.json"      # '<tool> --version' outputs by the (path, size, mtime) of the tool's executable: no node/ng process start while the tools don't change
+npmInstallLockFileName = "obj/SqBuild/npmInstall.lock"      # the 2 PreDebug scripts start together: only one of them installs, the other waits for it, then finds the new stamp
+npmCacheDir = None      # None: npm's own per-user package cache (shared by all checkouts). 'npm ci --prefer-offline' takes the packages from there without revalidation, and only downloads the missing ones.
+
+# The version output of a tool on the PATH, or None if it is not installed. Cached by the tool's executable file, so it is only run again after the tool is reinstalled or upgraded.
+def probeToolVersion(toolName, probeCache):
+    exeFileName = shutil.which(toolName)    # finds the 'ng.cmd' shim on Windows too
+    if exeFileName is None:
+        return None
+    realFileName = os.path.realpath(exeFileName)
+    st = os.stat(realFileName)
+    cached = probeCache.get(toolName)
+    if cached is not None and cached["path"] == realFileName and cached["size"] == st.st_size and cached["mtimeNs"] == st.st_mtime_ns:
+        return cached["version"]
+    print("SqBuild: Probing '" + toolName + " --version' ...")
+    # no shell: it would split 'C:\Program Files\nodejs\node.EXE' at the space
+    result = subprocess.run([exeFileName, "--version"], stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True)
+    if result.returncode != 0:
+        return None
+    lines = [l.strip() for l in result.stdout.splitlines() if l.strip() != ""]
+    version = next((l for l in lines if l.startswith("Angular CLI:")), lines[-1] if len(lines) > 0 else "")     # 'ng --version' prints an ASCII art banner before the versions
+    probeCache[toolName] = {"path": realFileName, "size": st.st_size, "mtimeNs": st.st_mtime_ns, "version": version}
+    return version
+
+def writeJsonAtomic(fileName, data):    # temp file and rename: the parallel PreDebug script never reads a half written file
+    os.makedirs(os.path.dirname(fileName), exist_ok = True)
+    with open(fileName + "." + str(os.getpid()) + ".tmp", "w") as file:
+        json.dump(data, file, indent = 0, sort_keys = True)
+    os.replace(fileName + "." + str(os.getpid()) + ".tmp", fileName)
+
+def readJson(fileName, default):
+    try:
+        with open(fileName, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return default
+
+# Exclusive lock of the npm install between processes. The OS releases it when a process dies, so a killed PreDebug script doesn't leave a stale lock behind.
+def lockFile(file):
+    if msvcrt is not None:
+        while True:
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)   # retries for 10 sec, then raises
+                return
+            except OSError:
+                pass
+    else:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+def tryLockFile(file):
+    try:
+        if msvcrt is not None:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+# Makes sure that the tools are installed and node_modules matches package-lock.json, in the CWD (the project folder). The fingerprint is package-lock.json + the node and npm versions
+# (native packages are built for the node ABI). If it equals the stamp of the last install, nothing is run (F5 startup). Otherwise 'npm ci' reinstalls node_modules exactly from the lock file,
+# under a file lock. 'requiredTools': {toolName: message if it is missing}. Exits the script if a tool is missing or 'npm ci' fails. The time is recorded as the 'bootstrap' phase of 'timingScript'.
+def ensureNodeModules(requiredTools, timingScript):
+    startTime = time.time()
+    probeCache = readJson(toolProbeCacheFileName, {})
+    versions = {}
+    for toolName in ["node", "npm"] + [t for t in requiredTools if t not in ["node", "npm"]]:
+        versions[toolName] = probeToolVersion(toolName, probeCache)
+        if versions[toolName] is None:
+            sys.exit(requiredTools.get(toolName, "SqBuild: '" + toolName + "' is required to build and run this project."))
+    writeJsonAtomic(toolProbeCacheFileName, probeCache)
+    with open("package-lock.json", "rb") as file:
+        lockSha256 = hashlib.sha256(file.read()).hexdigest()
+    fingerprint = {"packageLockSha256": lockSha256, "node": versions["node"], "npm": versions["npm"], "platform": platform.system() + " " + platform.machine()}
+    isInstalled = False
+    if readJson(nodeModulesStampFileName, None) == fingerprint:
+        print("SqBuild: node_modules is up to date with package-lock.json (node " + versions["node"] + ")")
+    else:
+        os.makedirs(os.path.dirname(npmInstallLockFileName), exist_ok = True)
+        with open(npmInstallLockFileName, "a+") as lock:
+            lock.seek(0)    # msvcrt locks the byte at the file position: the same byte in both processes
+            if not tryLockFile(lock):
+                print("SqBuild: Another build script is installing node_modules. Waiting for it ...")
+                lockFile(lock)
+            if readJson(nodeModulesStampFileName, None) == fingerprint:     # the other script installed the same state while we waited
+                print("SqBuild: node_modules was installed by the other build script.")
+            else:
+                print("SqBuild: package-lock.json or the node/npm versions changed. Running 'npm ci' ...")
+                if os.path.isfile(nodeModulesStampFileName):
+                    os.remove(nodeModulesStampFileName)     # a failed or interrupted 'npm ci' leaves no valid stamp behind
+                command = "npm ci --prefer-offline --no-audit --no-fund" + (" --cache \"" + npmCacheDir + "\"" if npmCacheDir is not None else "")
+                if subprocess.run(command, shell = True).returncode != 0:
+                    sys.exit("SqBuild: '" + command + "' FAILED. (Is package-lock.json in sync with package.json? Run 'npm install' to update it.)")
+                writeJsonAtomic(nodeModulesStampFileName, fingerprint)
+                isInstalled = True
+    SqTiming.record(timingScript, "bootstrap", time.time() - startTime, installed = isInstalled)
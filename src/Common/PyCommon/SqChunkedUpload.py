@@ -0,0 +1,84 @@
+# Resumable, chunked, integrity checked upload of one big file (the deploy.7z of SqDeploy.py) over an SSH exec channel.
+# The file is sent in chunks, each with its sha256. The server writes a chunk into '<file>.part' only if its hash matches, and then records the verified length
+# in '<file>.part.json' and acknowledges it. After a dropped connection, a new upload of the same file (same size and sha256) continues from the last verified offset.
+# At the end, the server checks the sha256 of the whole file, and renames it into place: a half or corrupted upload never has the final name.
+# The server side is this same file: it is stdlib only (Python 3.5+), and SqDeploy.openHelperChannel() sends it with the command ('python3 -c').
+
+import os
+import sys
+import json
+import struct
+import hashlib
+
+chunkHeaderStruct = struct.Struct(">QI32s")     # offset, length (0: end of the file), sha256 of the chunk
+
+def readExactly(stream, n):
+    data = stream.read(n)
+    if len(data) != n:
+        raise EOFError("the upload stream ended in the middle of a chunk")
+    return data
+
+def writeState(stateFileName, state):   # temp file and rename: a crash never leaves a state that claims more than what is written
+    with open(stateFileName + ".tmp", "w") as file:
+        json.dump(state, file)
+    os.replace(stateFileName + ".tmp", stateFileName)
+
+# The verified length of an earlier upload of the same file, or 0. The bytes after it (a chunk that was in flight when the connection dropped) are cut off.
+def getResumeOffset(partFileName, stateFileName, size, sha256):
+    try:
+        with open(stateFileName, "r") as file:
+            state = json.load(file)
+        if state["size"] == size and state["sha256"] == sha256 and os.path.getsize(partFileName) >= state["offset"]:
+            with open(partFileName, "r+b") as file:
+                file.truncate(state["offset"])
+            return state["offset"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return 0
+
+# stdout: 'OFFSET n' (where to continue), then 'ACK n' after every verified chunk, 'DONE' after the rename. A bad chunk or whole file hash is an error exit:
+# the client reconnects, and continues from the last verified offset.
+def cmdReceive(fileName, size, sha256):
+    partFileName = fileName + ".part"
+    stateFileName = partFileName + ".json"
+    os.makedirs(os.path.dirname(os.path.abspath(fileName)), exist_ok = True)
+    offset = getResumeOffset(partFileName, stateFileName, size, sha256)
+    print("OFFSET %d" % offset)
+    sys.stdout.flush()
+    stdin = sys.stdin.buffer
+    with open(partFileName, "r+b" if offset > 0 else "wb") as file:
+        file.seek(offset)
+        while True:
+            (chunkOffset, length, chunkHash) = chunkHeaderStruct.unpack(readExactly(stdin, chunkHeaderStruct.size))
+            if length == 0:
+                break
+            data = readExactly(stdin, length)
+            if chunkOffset != offset or hashlib.sha256(data).digest() != chunkHash:
+                sys.exit("SqChunkedUpload: bad chunk at offset %d (expected offset %d)" % (chunkOffset, offset))
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+            offset += length
+            writeState(stateFileName, {"size": size, "sha256": sha256, "offset": offset})
+            print("ACK %d" % offset)
+            sys.stdout.flush()
+    hasher = hashlib.sha256()
+    with open(partFileName, "rb") as file:
+        for data in iter(lambda: file.read(1024 * 1024), b""):
+            hasher.update(data)
+    if offset != size or hasher.hexdigest() != sha256:
+        os.remove(stateFileName)    # the verified chunks did not add up to the file: start again from 0
+        sys.exit("SqChunkedUpload: %s is %d bytes with sha256 %s, expected %d bytes, %s" % (partFileName, offset, hasher.hexdigest(), size, sha256))
+    os.replace(partFileName, fileName)
+    os.remove(stateFileName)
+    print("DONE")
+    sys.stdout.flush()
+
+def main():
+    if len(sys.argv) >= 5 and sys.argv[1] == "receive":
+        cmdReceive(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+    else:
+        sys.exit("Usage (on the server, run by SqDeploy.py): 'receive <fileName> <size> <sha256>'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+# Concurrent load benchmark of PostgreSQL and Redis (the BenchmarkDB 'testtable' and Redis keys), to complement the single round trip tests of Tools/BenchmarkDB.
+# Every scenario is a closed loop of 'concurrency' asyncio workers for 'duration' seconds, sweeping the concurrency, the Redis pipelining depth (commands per round trip),
+# the PostgreSQL batch size (rows per statement), and pooled (a pool of 'poolSize' shared connections) vs unpooled (a new connection per operation, as a naive app does) connections.
+# The latencies go into the log-scale histograms of SqLogLatency (HDR histogram style, 1% precision). A sweep marks its 'knee': the first concurrency where the throughput stops growing (<10%) while the p99 grows (>50%).
+# That is where a bigger connection pool (or more concurrent requests) only adds queueing. Note: one Python process can drive about 20-50K Redis round trips/s; beyond that, the client is measured.
+# Results (throughput, percentiles, histogram per scenario) are appended to SqCore/logs/SqDbBench.jsonl (SqTiming format).
+# The connection strings are read from SqCore.Tools.BenchmarkDB.NoGitHub.json (RedisDefault, PostgreSqlDefault), as BenchmarkDB reads them. PostgreSQL needs the asyncpg package.
+# Usage:
+#   'python SqDbBench.py --scenarios redisGet,pgSelect --concurrency 1,4,16,64 --depth 1,16 --batchSize 1,100 --pool pool,noPool'
+#   'python SqDbBench.py --standIn'  Redis scenarios against the in-process stand-in server of SqRedisBackup.py (no server needed: a smoke test of the suite)
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import importlib.util
+import SqTiming
+import SqDbConfig
+import SqLogLatency
+import SqRedisBackup
+
+scenarioNames = ["redisGet", "redisSet", "pgSelect", "pgInsert"]
+redisKeyPrefix = "SqDbBench:"
+pgValuePrefix = "SqDbBench "    # testtable.column1 of the inserted rows, deleted at the end
+
+class AsyncRedisConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, connParams):
+        (reader, writer) = await asyncio.open_connection(connParams["host"], connParams["port"], ssl = True if connParams["ssl"] else None)
+        conn = cls(reader, writer)
+        if connParams["password"]:
+            await conn.execute("AUTH", connParams["password"])
+        if connParams["db"] != 0:
+            await conn.execute("SELECT", connParams["db"])
+        return conn
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def readReply(self):
+        line = await self.reader.readline()
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b"+":
+            return rest
+        if prefix == b"-":
+            return SqRedisBackup.RedisError(rest.decode("utf-8", "replace"))
+        if prefix == b":":
+            return int(rest)
+        if prefix == b"$":
+            length = int(rest)
+            return None if length < 0 else (await self.reader.readexactly(length + 2))[:-2]
+        if prefix == b"*":
+            length = int(rest)
+            return None if length < 0 else [await self.readReply() for i in range(length)]
+        raise ConnectionError("Redis connection closed" if line == b"" else "Unknown RESP reply: " + repr(line))
+
+    async def pipeline(self, commands):
+        self.writer.write(b"".join(SqRedisBackup.encodeCommand(c) for c in commands))
+        await self.writer.drain()
+        return [await self.readReply() for c in commands]
+
+    async def execute(self, *args):
+        reply = (await self.pipeline([args]))[0]
+        if isinstance(reply, SqRedisBackup.RedisError):
+            raise reply
+        return reply
+
+# 'poolSize' persistent connections shared by the workers: a worker waits for a free one (that wait is part of the measured latency, as in the app)
+class AsyncRedisPool:
+    def __init__(self, connParams, poolSize):
+        self.connParams = connParams
+        self.poolSize = poolSize
+        self.freeConns = asyncio.Queue()
+
+    async def open(self):
+        for conn in await asyncio.gather(*[AsyncRedisConnection.open(self.connParams) for i in range(self.poolSize)]):
+            self.freeConns.put_nowait(conn)
+
+    async def pipeline(self, commands):
+        conn = await self.freeConns.get()
+        try:
+            return await conn.pipeline(commands)
+        finally:
+            self.freeConns.put_nowait(conn)
+
+    async def close(self):
+        while not self.freeConns.empty():
+            await self.freeConns.get_nowait().close()
+
+class UnpooledRedis:
+    def __init__(self, connParams):
+        self.connParams = connParams
+
+    async def pipeline(self, commands):
+        conn = await AsyncRedisConnection.open(self.connParams)
+        try:
+            return await conn.pipeline(commands)
+        finally:
+            await conn.close()
+
+class BenchCase:
+    def __init__(self, scenario, poolMode, poolSize, concurrency, depth):
+        self.scenario = scenario
+        self.poolMode = poolMode
+        self.poolSize = poolSize
+        self.concurrency = concurrency
+        self.depth = depth      # Redis: commands per pipeline, PostgreSQL: rows per statement
+        self.stats = SqLogLatency.LatencyStats()
+        self.nUnits = 0         # commands or rows
+        self.sec = 0.0
+        self.isKnee = False
+
+    def getName(self):
+        return "%s/%s%s/c%d/%s%d" % (self.scenario, self.poolMode, self.poolSize if self.poolMode == "pool" else "", self.concurrency, "d" if self.scenario.startswith("redis") else "b", self.depth)
+
+# the closed loop: every worker runs 'operation()' back to back until the deadline. The operations of the warm-up period are not measured.
+async def runClosedLoop(case, operation, durationSec, warmupSec):
+    measureStart = time.perf_counter() + warmupSec
+    deadline = measureStart + durationSec
+    async def worker():
+        while True:
+            startTime = time.perf_counter()
+            if startTime >= deadline:
+                return
+            isError = False
+            try:
+                nUnits = await operation()
+            except Exception:
+                isError = True
+                nUnits = 0
+            endTime = time.perf_counter()
+            if startTime >= measureStart:
+                case.stats.add((endTime - startTime) * 1000.0, 0, isError)
+                case.nUnits += nUnits
+    await asyncio.gather(*[worker() for i in range(case.concurrency)])
+    case.sec = durationSec
+
+async def runRedisCase(case, connParams, nKeys, valueSize, durationSec, warmupSec):
+    if case.poolMode == "pool":
+        client = AsyncRedisPool(connParams, case.poolSize)
+        await client.open()
+    else:
+        client = UnpooledRedis(connParams)
+    value = b"x" * valueSize
+    counter = [0]
+    async def operation():
+        start = counter[0]
+        counter[0] += case.depth
+        keys = [b"%s%d" % (redisKeyPrefix.encode(), (start + i) % nKeys) for i in range(case.depth)]
+        commands = [("GET", k) for k in keys] if case.scenario == "redisGet" else [("SET", k, value) for k in keys]
+        replies = await client.pipeline(commands)
+        if any(isinstance(r, SqRedisBackup.RedisError) for r in replies):
+            raise next(r for r in replies if isinstance(r, SqRedisBackup.RedisError))
+        return len(commands)
+    try:
+        await runClosedLoop(case, operation, durationSec, warmupSec)
+    finally:
+        if case.poolMode == "pool":
+            await client.close()
+
+async def prepareRedis(connParams, nKeys, valueSize):
+    conn = await AsyncRedisConnection.open(connParams)
+    for start in range(0, nKeys, 1000):
+        await conn.pipeline([("SET", b"%s%d" % (redisKeyPrefix.encode(), i), b"x" * valueSize) for i in range(start, min(start + 1000, nKeys))])
+    await conn.close()
+
+async def cleanupRedis(connParams, nKeys):
+    conn = await AsyncRedisConnection.open(connParams)
+    for start in range(0, nKeys, 1000):
+        await conn.execute("DEL", *[b"%s%d" % (redisKeyPrefix.encode(), i) for i in range(start, min(start + 1000, nKeys))])
+    await conn.close()
+
+async def runPgCase(case, pgParams, durationSec, warmupSec):
+    import asyncpg
+    if case.poolMode == "pool":
+        pool = await asyncpg.create_pool(min_size = case.poolSize, max_size = case.poolSize, **pgParams)
+    insertValue = pgValuePrefix + SqTiming.runId
+    async def runStatement(conn):
+        if case.scenario == "pgSelect":
+            rows = await conn.fetch("SELECT column1 FROM testtable LIMIT $1", case.depth)
+            return max(len(rows), 1)
+        await conn.executemany("INSERT INTO testtable (column1) VALUES ($1)", [(insertValue,)] * case.depth)
+        return case.depth
+    async def operation():
+        if case.poolMode == "pool":
+            async with pool.acquire() as conn:
+                return await runStatement(conn)
+        conn = await asyncpg.connect(**pgParams)
+        try:
+            return await runStatement(conn)
+        finally:
+            await conn.close()
+    try:
+        await runClosedLoop(case, operation, durationSec, warmupSec)
+    finally:
+        if case.poolMode == "pool":
+            await pool.close()
+
+async def preparePg(pgParams):
+    import asyncpg
+    conn = await asyncpg.connect(**pgParams)
+    if await conn.fetchval("SELECT count(*) FROM (SELECT 1 FROM testtable LIMIT 100) t") < 100:    # pgSelect needs rows to read
+        await conn.executemany("INSERT INTO testtable (column1) VALUES ($1)", [(pgValuePrefix + SqTiming.runId,)] * 100)
+    await conn.close()
+
+async def cleanupPg(pgParams):
+    import asyncpg
+    conn = await asyncpg.connect(**pgParams)
+    await conn.execute("DELETE FROM testtable WHERE column1 = $1", pgValuePrefix + SqTiming.runId)
+    await conn.close()
+
+# with given pool sizes, a series is one pool size over the concurrencies. By default the pool grows with the concurrency.
+def markKnees(cases, isFixedPoolSize):
+    series = {}
+    for case in cases:
+        series.setdefault((case.scenario, case.poolMode, case.depth, case.poolSize if isFixedPoolSize else None), []).append(case)
+    for seriesCases in series.values():
+        seriesCases.sort(key = lambda c: (c.concurrency, c.poolSize))
+        for prev, case in zip(seriesCases, seriesCases[1:]):
+            prevThroughput = prev.nUnits / prev.sec
+            if case.nUnits / case.sec < prevThroughput * 1.1 and prev.stats.count > 0 and case.stats.count > 0 and case.stats.percentile(99) > prev.stats.percentile(99) * 1.5:
+                case.isKnee = True
+                break
+
+def printResults(cases):
+    print("")
+    print("%-34s %10s %10s %6s %9s %9s %9s %9s %9s" % ("scenario", "units/s", "ops/s", "err%", "p50 ms", "p90 ms", "p99 ms", "p99.9 ms", "max ms"))
+    for case in cases:
+        s = case.stats
+        if s.count == 0:
+            print("%-34s  no completed operation" % case.getName())
+            continue
+        print("%-34s %10.0f %10.0f %5.1f%% %9.3f %9.3f %9.3f %9.3f %9.3f%s" % (case.getName(), case.nUnits / case.sec, s.count / case.sec, 100.0 * s.nErrors / s.count,
+            s.percentile(50), s.percentile(90), s.percentile(99), s.percentile(99.9), s.maxMs, "  <- knee" if case.isKnee else ""))
+
+def recordResults(cases):
+    for case in cases:
+        s = case.stats
+        if s.count == 0:
+            continue
+        histogram = {"%.3f" % SqLogLatency.getBucketValue(b): n for b, n in sorted(s.histogram.items())}
+        SqTiming.record("DbBench", case.scenario, case.sec, case.getName(), poolMode = case.poolMode, poolSize = case.poolSize, concurrency = case.concurrency, depth = case.depth,
+            nOps = s.count, nErrors = s.nErrors, unitsPerSec = round(case.nUnits / case.sec, 1), opsPerSec = round(s.count / case.sec, 1), meanMs = round(s.sumMs / s.count, 4),
+            p50Ms = round(s.percentile(50), 4), p90Ms = round(s.percentile(90), 4), p99Ms = round(s.percentile(99), 4), p999Ms = round(s.percentile(99.9), 4), maxMs = round(s.maxMs, 4),
+            isKnee = case.isKnee, histogramMs = histogram)
+
+def parseIntList(text):
+    return [int(v) for v in text.split(",") if v.strip() != ""]
+
+async def runAll(args, redisParams, pgParams, scenarios):
+    cases = []
+    for scenario in scenarios:
+        for poolMode in args.pool.split(","):
+            for concurrency in parseIntList(args.concurrency):
+                for poolSize in (parseIntList(args.poolSize) if args.poolSize and poolMode == "pool" else [concurrency]):
+                    for depth in parseIntList(args.depth if scenario.startswith("redis") else args.batchSize):
+                        cases.append(BenchCase(scenario, poolMode, poolSize, concurrency, depth))
+    if any(c.scenario.startswith("redis") for c in cases):
+        await prepareRedis(redisParams, args.nKeys, args.valueSize)
+    if any(c.scenario.startswith("pg") for c in cases):
+        await preparePg(pgParams)
+    try:
+        for case in cases:
+            print("SqDbBench: running %s for %.0fs..." % (case.getName(), args.warmup + args.duration), flush = True)
+            if case.scenario.startswith("redis"):
+                await runRedisCase(case, redisParams, args.nKeys, args.valueSize, args.duration, args.warmup)
+            else:
+                await runPgCase(case, pgParams, args.duration, args.warmup)
+    finally:
+        if any(c.scenario.startswith("redis") for c in cases):
+            await cleanupRedis(redisParams, args.nKeys)
+        if any(c.scenario.startswith("pg") for c in cases):
+            await cleanupPg(pgParams)
+    return cases
+
+def main():
+    parser = argparse.ArgumentParser(description = "Concurrent load benchmark of PostgreSQL (testtable) and Redis.")
+    parser.add_argument("--scenarios", default = ",".join(scenarioNames), help = "comma separated: " + ", ".join(scenarioNames))
+    parser.add_argument("--concurrency", default = "1,4,16,64", help = "comma separated numbers of concurrent workers (a sweep)")
+    parser.add_argument("--depth", default = "1,16", help = "Redis: comma separated pipelining depths (commands per round trip)")
+    parser.add_argument("--batchSize", default = "1,100", help = "PostgreSQL: comma separated rows per statement (SELECT LIMIT, INSERT executemany)")
+    parser.add_argument("--pool", default = "pool,noPool", help = "'pool' (shared persistent connections), 'noPool' (new connection per operation), or both")
+    parser.add_argument("--poolSize", help = "comma separated pool sizes (default: the concurrency)")
+    parser.add_argument("--duration", type = float, default = 5.0, help = "measured seconds per case")
+    parser.add_argument("--warmup", type = float, default = 1.0, help = "not measured seconds before every case")
+    parser.add_argument("--nKeys", type = int, default = 10000, help = "Redis keys written before and deleted after the run")
+    parser.add_argument("--valueSize", type = int, default = 100, help = "Redis value bytes")
+    parser.add_argument("--redisConnString", help = "default: ConnectionStrings:RedisDefault of BenchmarkDB")
+    parser.add_argument("--pgConnString", help = "Npgsql connection string (default: ConnectionStrings:PostgreSqlDefault of BenchmarkDB)")
+    parser.add_argument("--standIn", action = "store_true", help = "Redis: the in-process stand-in server of SqRedisBackup.py. (PostgreSQL scenarios are skipped)")
+    parser.add_argument("--history", default = os.path.dirname(SqTiming.historyFileName) + "/SqDbBench.jsonl", help = "JSONL file of the results")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",")]
+    unknownScenarios = [s for s in scenarios if s not in scenarioNames]
+    if len(unknownScenarios) > 0:
+        sys.exit("Unknown scenario(s): " + ", ".join(unknownScenarios) + ". Known: " + ", ".join(scenarioNames))
+    redisParams = None
+    pgParams = None
+    if any(s.startswith("redis") for s in scenarios):
+        if args.standIn:
+            redisParams = SqRedisBackup.StandInRedisServer().start()
+        else:
+            redisParams = SqDbConfig.parseRedisConnString(args.redisConnString or SqDbConfig.getConnectionString("BenchmarkDB", "RedisDefault"))
+    if args.standIn:
+        scenarios = [s for s in scenarios if s.startswith("redis")]
+    if any(s.startswith("pg") for s in scenarios):
+        if importlib.util.find_spec("asyncpg") is None:     # the pg scenarios import it
+            sys.exit("The PostgreSQL scenarios need the asyncpg package: 'pip install asyncpg'")
+        pgParams = SqDbConfig.parseNpgsqlConnString(args.pgConnString or SqDbConfig.getConnectionString("BenchmarkDB", "PostgreSqlDefault"))
+
+    SqTiming.historyFileName = args.history
+    cases = asyncio.run(runAll(args, redisParams, pgParams, scenarios))
+    markKnees(cases, args.poolSize is not None)
+    printResults(cases)
+    recordResults(cases)
+    print("Results are appended to " + SqTiming.historyFileName)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Connection strings of the databases for the Python tools, from the same not committed config files as the C# apps use:
+# Utils.SensitiveConfigFolderPath() + 'SqCore.Tools.<appName>.NoGitHub.json', section "ConnectionStrings" (e.g. "RedisDefault", "PgDefault").
+
+import os
+import json
+import getpass
+import platform
+
+# = SqCommon Utils.SensitiveConfigFolderPath()
+def getSensitiveConfigDir():
+    if platform.system() != "Windows":
+        return "/home/sq-vnc-client/SQ/NonCommitedSensitiveData/"
+    userDirs = {
+        "gyantal": "g:/agy/Google Drive/GDriveHedgeQuant/shared/GitHubRepos/NonCommitedSensitiveData/",
+        "Balazs": "d:/GDrive/GDriveHedgeQuant/shared/GitHubRepos/NonCommitedSensitiveData/",
+        "Laci": "d:/ArchiData/GoogleDrive/GDriveHedgeQuant/shared/GitHubRepos/NonCommitedSensitiveData/",
+    }
+    userName = getpass.getuser()
+    if userName not in userDirs:
+        raise Exception("Windows user name '" + userName + "' is not recognized. Add your username and folder here!")
+    return userDirs[userName]
+
+def getConnectionString(appName, name):
+    fileName = getSensitiveConfigDir() + "SqCore.Tools." + appName + ".NoGitHub.json"
+    if not os.path.isfile(fileName):
+        raise Exception("Sensitive config file is not found: " + fileName)
+    with open(fileName, "r", encoding = "utf-8-sig") as file:
+        connStrings = json.load(file).get("ConnectionStrings", {})
+    if name not in connStrings:
+        raise Exception("ConnectionStrings:" + name + " is not in " + fileName)
+    return connStrings[name]
+
+# StackExchange.Redis format: 'host:port,password=...,defaultDatabase=0,ssl=False,...'. Returns {"host", "port", "password", "db", "ssl"}.
+def parseRedisConnString(connString):
+    result = {"host": "localhost", "port": 6379, "password": None, "db": 0, "ssl": False}
+    for part in connString.split(","):
+        part = part.strip()
+        if part == "":
+            continue
+        if "=" not in part:     # an endpoint. (Only the first one is used: no master/replica setups)
+            if ":" in part:
+                (result["host"], port) = part.rsplit(":", 1)
+                result["port"] = int(port)
+            else:
+                result["host"] = part
+            continue
+        (key, value) = part.split("=", 1)
+        key = key.strip().lower()
+        if key == "password":
+            result["password"] = value
+        elif key == "defaultdatabase":
+            result["db"] = int(value)
+        elif key == "ssl":
+            result["ssl"] = value.strip().lower() == "true"
+    return result
+
+# Npgsql format: 'Host=...;Port=5432;Username=...;Password=...;Database=...'. Returns the keyword arguments of asyncpg.connect()/create_pool().
+def parseNpgsqlConnString(connString):
+    keyNames = {"host": "host", "server": "host", "port": "port", "username": "user", "user id": "user", "userid": "user", "password": "password", "database": "database"}
+    result = {}
+    for part in connString.split(";"):
+        if "=" not in part:
+            continue
+        (key, value) = part.split("=", 1)
+        name = keyNames.get(key.strip().lower())
+        if name is not None:
+            result[name] = int(value) if name == "port" else value.strip()
+        elif key.strip().lower() == "ssl mode" and value.strip().lower() in ("require", "verifyca", "verifyfull"):
+            result["ssl"] = "require"
+    return result
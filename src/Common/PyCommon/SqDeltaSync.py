@@ -0,0 +1,213 @@
+# rsync-style block delta of changed files for SqDeploy.py. A rebuilt SqCoreWeb.dll or Angular bundle is mostly identical to the deployed one, so only the differing bytes are sent.
+# 1. The server splits its copy (the base) into fixed size blocks, and sends back a weak (rsync rolling checksum) and a strong (MD5) checksum per block: 20 bytes per block.
+# 2. Locally, the weak checksum is computed at every byte offset of the new file (numpy, vectorized), the candidates are verified by the strong checksum,
+#    and the new file is encoded as 'copy base blocks i..j' and 'literal bytes' instructions.
+# 3. The server rebuilds the file from its base and the instructions, and checks the sha256 of the result (a wrong file is never left in place: the caller re-sends it whole).
+# The server side is this same file: it is stdlib only (Python 3.5+), and SqDeploy.openHelperChannel() sends it with the command ('python3 -c'), so nothing has to be installed or kept in sync on the server.
+# The delta stream (per file: a length prefixed JSON header with the instructions, then the literal bytes) is zlib compressed.
+
+import os
+import sys
+import json
+import zlib
+import struct
+import hashlib
+import itertools
+
+try:
+    import numpy as np     # local side only: the rolling checksum at every offset. Without numpy, SqDeploy sends the changed files whole.
+except ImportError:
+    np = None
+
+minBlockSize = 2048
+maxBlockSize = 64 * 1024
+signatureStruct = struct.Struct(">I16s")    # weak, strong checksum of a block
+noBaseFile = 0xffffffff     # block count in the signatures: the base file does not exist on the server
+
+# ~sqrt(fileSize) as rsync: bigger blocks for bigger files keep the signature small, smaller blocks for smaller files find more matches. A multiple of 64.
+def getBlockSize(fileSize):
+    return max(minBlockSize, min(maxBlockSize, int(fileSize ** 0.5) // 64 * 64))
+
+# rsync weak checksum of a block: a = sum(x), b = sum((len - i) * x[i]), both mod 2^16. b is the sum of the prefix sums of the block.
+def getWeakChecksum(block):
+    return (sum(block) & 0xffff) | ((sum(itertools.accumulate(block)) & 0xffff) << 16)
+
+# ---------- Server side
+
+def readExactly(stream, n):
+    data = stream.read(n)
+    if len(data) != n:
+        raise EOFError("the delta stream ended in the middle of a record")
+    return data
+
+class DecompressingReader:
+    def __init__(self, stream):
+        self.stream = stream
+        self.decompressor = zlib.decompressobj()
+        self.buffer = b""
+
+    def read(self, n):
+        while len(self.buffer) < n:
+            chunk = self.stream.read(256 * 1024)
+            if chunk == b"":
+                self.buffer += self.decompressor.flush()
+                break
+            self.buffer += self.decompressor.decompress(chunk)
+        (data, self.buffer) = (self.buffer[:n], self.buffer[n:])
+        return data
+
+# stdin: JSON list of {"path", "blockSize"}. stdout: per file the block count, then the signature of every full block (the last partial block is not matched, it is sent as literal).
+def cmdSignatures(baseDir):
+    out = sys.stdout.buffer
+    for request in json.loads(sys.stdin.buffer.read().decode("utf-8")):
+        fileName = os.path.join(baseDir, request["path"])
+        blockSize = request["blockSize"]
+        if not os.path.isfile(fileName):
+            out.write(struct.pack(">I", noBaseFile))
+            continue
+        nBlocks = os.path.getsize(fileName) // blockSize
+        out.write(struct.pack(">I", nBlocks))
+        with open(fileName, "rb") as file:
+            for i in range(nBlocks):
+                block = file.read(blockSize)
+                out.write(signatureStruct.pack(getWeakChecksum(block), hashlib.md5(block).digest()))
+    out.flush()
+
+# stdin: the delta stream. The base is 'baseDir/path' (with release folders: the live release), the rebuilt file goes to 'newDir/path' (temp file, sha256 check, rename).
+# stdout: 'OK path' or 'FAILED path: reason' per file. A failed file does not stop the others.
+def cmdPatch(baseDir, newDir):
+    reader = DecompressingReader(sys.stdin.buffer)
+    baseDir = os.path.realpath(baseDir)    # 'publish' is a symlink to the live release. Resolve it once, so a concurrent switch cannot mix two releases.
+    while True:
+        headerSize = struct.unpack(">I", readExactly(reader, 4))[0]
+        if headerSize == 0:
+            break
+        header = json.loads(readExactly(reader, headerSize).decode("utf-8"))
+        relPath = header["path"]
+        nLiteralBytesLeft = sum(n for blockIndex, n in header["ops"] if blockIndex < 0)
+        newFileName = os.path.join(newDir, relPath)
+        tempFileName = newFileName + ".sqdelta.tmp"
+        try:
+            os.makedirs(os.path.dirname(newFileName), exist_ok = True)
+            hasher = hashlib.sha256()
+            with open(os.path.join(baseDir, relPath), "rb") as baseFile, open(tempFileName, "wb") as newFile:
+                for blockIndex, n in header["ops"]:
+                    if blockIndex < 0:
+                        data = readExactly(reader, n)
+                        nLiteralBytesLeft -= n
+                    else:
+                        baseFile.seek(blockIndex * header["blockSize"])
+                        data = baseFile.read(n * header["blockSize"])
+                        if len(data) != n * header["blockSize"]:
+                            raise Exception("the base file is shorter than in its signature")
+                    newFile.write(data)
+                    hasher.update(data)
+            if hasher.hexdigest() != header["sha256"]:
+                raise Exception("sha256 mismatch of the rebuilt file")
+            os.replace(tempFileName, newFileName)
+            print("OK " + relPath)
+        except Exception as e:
+            readExactly(reader, nLiteralBytesLeft)     # skip the rest of this file in the stream
+            if os.path.isfile(tempFileName):
+                os.remove(tempFileName)
+            print("FAILED %s: %s" % (relPath, e))
+        sys.stdout.flush()
+
+# ---------- Local side
+
+def getSignaturesRequest(relPaths, fileSizes):
+    return json.dumps([{"path": p, "blockSize": getBlockSize(s)} for p, s in zip(relPaths, fileSizes)]).encode("utf-8")
+
+# the output of cmdSignatures -> per file None (no base file) or (blockSize, weak checksums, strong checksums)
+def parseSignatures(data, relPaths, fileSizes):
+    signatures = []
+    offset = 0
+    for relPath, fileSize in zip(relPaths, fileSizes):
+        nBlocks = struct.unpack_from(">I", data, offset)[0]
+        offset += 4
+        if nBlocks == noBaseFile:
+            signatures.append(None)
+            continue
+        weaks = []
+        strongs = []
+        for i in range(nBlocks):
+            (weak, strong) = signatureStruct.unpack_from(data, offset)
+            offset += signatureStruct.size
+            weaks.append(weak)
+            strongs.append(strong)
+        signatures.append((getBlockSize(fileSize), weaks, strongs))
+    return signatures
+
+# the weak checksums of the windows starting at every offset of data[start:end], for the window size 'blockSize'. With prefix sums S (of x) and T (of j*x[j]):
+# a(k) = S[k+B] - S[k], b(k) = (k+B) * a(k) - (T[k+B] - T[k]). Computed in slices, so a big file does not need GBs of int64 temporaries.
+def getRollingChecksums(data, blockSize, start, end):
+    x = np.frombuffer(data, dtype = np.uint8, offset = start, count = end - start + blockSize - 1).astype(np.int64)
+    S = np.concatenate(([0], np.cumsum(x)))
+    T = np.concatenate(([0], np.cumsum(x * np.arange(len(x), dtype = np.int64))))
+    k = np.arange(end - start, dtype = np.int64)
+    a = S[k + blockSize] - S[k]
+    b = (k + blockSize) * a - (T[k + blockSize] - T[k])
+    return (a & 0xffff) | ((b & 0xffff) << 16)
+
+# the instructions to build 'data' from the base: [blockIndex, nBlocks] copies and [-1, nBytes] literals (the literal bytes in order: the returned 'literals').
+# Greedy as rsync: at the first offset where a block matches, the block is taken, and the search continues after it.
+def computeDelta(data, signature, sliceSize = 1024 * 1024):
+    (blockSize, weaks, strongs) = signature
+    blocksByWeak = {}
+    for i, weak in enumerate(weaks):
+        blocksByWeak.setdefault(weak, []).append(i)
+    ops = []
+    literals = []
+    literalStart = 0
+    pos = 0
+    nOffsets = len(data) - blockSize + 1
+    if len(weaks) > 0 and nOffsets > 0:
+        weakSet = np.array(sorted(blocksByWeak.keys()), dtype = np.int64)
+        for sliceStart in range(0, nOffsets, sliceSize):
+            sliceEnd = min(sliceStart + sliceSize, nOffsets)
+            if sliceEnd <= pos:
+                continue
+            checksums = getRollingChecksums(data, blockSize, sliceStart, sliceEnd)
+            for k in np.nonzero(np.isin(checksums, weakSet))[0]:
+                offset = sliceStart + int(k)
+                if offset < pos:
+                    continue
+                strong = hashlib.md5(data[offset:offset + blockSize]).digest()
+                blockIndex = next((i for i in blocksByWeak[int(checksums[k])] if strongs[i] == strong), None)
+                if blockIndex is None:
+                    continue    # weak checksum collision
+                if offset > literalStart:
+                    ops.append([-1, offset - literalStart])
+                    literals.append(data[literalStart:offset])
+                if len(ops) > 0 and ops[-1][0] >= 0 and ops[-1][0] + ops[-1][1] == blockIndex:
+                    ops[-1][1] += 1     # the next block of a copied run
+                else:
+                    ops.append([blockIndex, 1])
+                pos = offset + blockSize
+                literalStart = pos
+    if literalStart < len(data):
+        ops.append([-1, len(data) - literalStart])
+        literals.append(data[literalStart:])
+    return (ops, literals)
+
+# one file into the delta stream. Returns the number of literal bytes.
+def writeFileDelta(writer, compressor, relPath, data, blockSize, ops, literals):
+    header = json.dumps({"path": relPath, "blockSize": blockSize, "sha256": hashlib.sha256(data).hexdigest(), "ops": ops}).encode("utf-8")
+    writer.write(compressor.compress(struct.pack(">I", len(header)) + header))
+    for literal in literals:
+        writer.write(compressor.compress(literal))
+    return sum(len(l) for l in literals)
+
+def writeStreamEnd(writer, compressor):
+    writer.write(compressor.compress(struct.pack(">I", 0)) + compressor.flush())
+
+def main():
+    if len(sys.argv) >= 3 and sys.argv[1] == "signatures":
+        cmdSignatures(sys.argv[2])
+    elif len(sys.argv) >= 4 and sys.argv[1] == "patch":
+        cmdPatch(sys.argv[2], sys.argv[3])
+    else:
+        sys.exit("Usage (on the server, run by SqDeploy.py): 'signatures <baseDir>' or 'patch <baseDir> <newDir>'")
+
+if __name__ == "__main__":
+    main()
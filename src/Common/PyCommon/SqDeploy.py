@@ -0,0 +1,683 @@
+# Deploys any subset of the SqCore projects (targets) to the MTrader server, concurrently, over one authenticated SSH transport.
+# Usage: 'python SqDeploy.py' deploys all targets, 'python SqDeploy.py SqCoreWeb RedisManager' only those. The per-project Deploy.py files call this with their own target.
+# '--restart': after the deploy, restart the targets that have a restartCommand (SqCoreWeb: its screen session), wait until they answer and warm them up (SqWarmUp.py).
+# !!!!!!!!!!!!!     DO a FULL       BUILD ALL  before deploying SqCoreWeb to Linux (BuildAllProd.py). The Linux machine will not compile the TS files.
+
+import platform
+print("Python version: " + platform.python_version() + " (" + platform.architecture()[0] + ")")
+
+import os        # listdir, isfile
+import paramiko  # for sftp
+import colorama  # for colourful print
+import subprocess
+from colorama import Fore, Style
+import time
+import hashlib
+import json
+import sys
+import tarfile
+import gzip
+import threading
+import queue
+import posixpath
+import tempfile
+import zlib
+import base64
+import concurrent.futures
+import SqTiming
+import SqDeltaSync
+import SqChunkedUpload
+import SqWarmUp
+
+# Parameters to change:
+uploadMode = "stream"   # "stream": tar.gz is generated on the fly and piped into a remote 'tar -x' over one SSH channel (no 7z.exe, no temp archive on either side), "7zip": deploy.7z is created, uploaded, then unpacked, "perFile": sftp.put() file by file on parallel SFTP channels
+streamCompressLevel = 1    # "stream" mode: gzip level. Level 9 (the tarfile default) compresses ~2 MB/sec, slower than the network; level 1 is ~10x faster for a few percent bigger stream (the DLLs, images are not compressible anyway)
+nUploadWorkers = 8      # "perFile" mode: number of SFTP channels (and threads) uploading concurrently over the one SSH transport
+useIncremental = True   # keep a content-hash manifest of the deployed folder on both sides, and only transfer the added/changed files and delete the removed ones. If the remote manifest is missing, it falls back to a full deploy.
+useDelta = True        # incremental deploys: a changed file bigger than deltaMinFileSize is sent as an rsync-style block delta against its deployed version (SqDeltaSync.py). Needs numpy here and python3 on the server, otherwise the file is sent whole.
+deltaMinFileSize = 64 * 1024
+uploadMaxMBps = 0      # bandwidth cap of the resumable deploy.7z upload ("7zip" mode), 0: no cap. (E.g. to leave room for the VNC viewer on the throttled port 22)
+nUploadRetries = 5     # a dropped deploy.7z upload is resumed this many times (1, 2, 4... sec apart), from the last verified chunk
+chunkTargetSec = 1.0   # adaptive chunk size: about this much transfer time at the measured throughput. Slow link: small chunks, little to resend after a drop. Fast link: less per chunk overhead.
+minChunkSize = 256 * 1024
+maxChunkSize = 16 * 1024 * 1024
+restartAfterDeploy = False     # '--restart' arg: restart + warm-up phase after the deploy. Its timings (restart, ready, firstByte, warmUp) go to the deploy timing history.
+readyTimeoutSec = 120   # after the restart: the service has to answer its ping path in this time, or the deployment is FAILED
+nWarmUpThreads = 4      # parallel keep-alive connections of the warm-up requests
+nKeptPrevReleases = 3   # targets with useReleaseDirs: previous release folders kept next to 'publish' for instant rollback: 'ln -sfn publish-yyyyMMdd-HHmmss publish'
+
+runningEnvironmentComputerName = platform.node()    # 'gyantal-PC' or Balazs
+if runningEnvironmentComputerName == 'gyantal-PC':
+    serverRsaKeyFile = 'g:/work/Archi-data/HedgeQuant/src/Server/AmazonAWS/AwsMTrader/AwsMTrader,sq-vnc-client.pem'  # server
+else:   # TODO: Laci, Balazs, you have to add your IF here (based on the 'name' of your PC)
+    serverRsaKeyFile = 'd:/SVN/HedgeQuant/src/Server/AmazonAWS/AwsMTrader/AwsMTrader,sq-vnc-client.pem'  # server
+zipExeWithPath = 'c:/Program Files/7-Zip/7z.exe' if platform.system() == 'Windows' else '7z'    # on Linux build hosts 7z is expected on the PATH
+
+serverHost = "ec2-34-251-1-119.eu-west-1.compute.amazonaws.com"         # MTrader server
+serverPort = 122    # on MTraderServer, port 22 bandwidth throttled, because of VNC viewer usage, a secondary SSH port 122 has no bandwith limit
+serverUser = "sq-vnc-client"
+
+srcLocalDir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/../..").replace(os.path.sep, '/')     # the SqCore/src folder on this PC. os.walk() gives back in a way that the last character is not slash, so do that way
+localWorkDir = tempfile.gettempdir().replace(os.path.sep, '/') + "/SqDeploy"       # temporary 7z archives, list files and the local manifest (hash cache). Outside of the deployed trees, so concurrent targets never pick up each other's files.
+
+manifestFileName = "deployManifest.json"    # stored in the root of the deployed folder on the server (what is deployed there)
+excludeFileNames = set([manifestFileName, "deploy.7z", "deployList.txt"])    # temporary files of the old Deploy.py in the local folders
+
+class DeployTarget:
+    def __init__(self, name, rootLocalDir, acceptedSubTreeRoots, rootRemoteDir, excludeDirs, excludeFileExts, useReleaseDirs = False, restartCommand = None, warmUpUrl = None, warmUpPingPath = None, warmUpKeyPaths = None, warmUpManifest = None):
+        self.name = name
+        self.rootLocalDir = rootLocalDir
+        self.acceptedSubTreeRoots = [r.replace('\\', '/') for r in acceptedSubTreeRoots]     # everything under these relPaths is traversed: files or folders too
+        self.rootRemoteDir = rootRemoteDir
+        self.excludeDirs = excludeDirs
+        self.excludeFileExts = excludeFileExts
+        self.useReleaseDirs = useReleaseDirs  # deploy into a fresh 'publish-yyyyMMdd-HHmmss' folder (unchanged files hard-linked from the current one), then atomically switch the 'publish' symlink to it. No window when the running webserver misses files.
+        # release folders are siblings of 'publish' (and not in a subfolder), so NLog's '${basedir}/../logs' still points to the same logs folder
+        self.restartCommand = restartCommand    # remote shell command of the '--restart' phase. It returns when the new process is started (not when it is ready).
+        self.warmUpUrl = warmUpUrl      # the base URL of the restarted service, as seen on the server. None: no warm-up.
+        self.warmUpPingPath = warmUpPingPath   # polled until it answers: the time to ready
+        self.warmUpKeyPaths = warmUpKeyPaths if warmUpKeyPaths is not None else []   # requested before (cold) and after (warm) the static assets: their time to first byte
+        self.warmUpManifest = warmUpManifest    # relPath of the asset manifest (SqBuild.fingerprintAssets()) in rootLocalDir: every asset in it is requested in every encoding
+        self.releasesRemoteParentDir = posixpath.dirname(rootRemoteDir)
+        self.releaseNamePrefix = posixpath.basename(rootRemoteDir) + "-"
+        self.zipFileName = localWorkDir + "/deploy." + name + ".7z"
+        self.zipListFileName = localWorkDir + "/deployList." + name + ".txt"
+        self.manifestLocalFileName = localWorkDir + "/deployManifest." + name + ".json"
+
+deployTargets = [
+    DeployTarget("SqCoreWeb", srcLocalDir + "/WebServer/SqCoreWeb/bin/Release/netcoreapp3.1/publish", ["wwwroot"], "/home/" + serverUser + "/SQ/WebServer/SqCoreWeb/published/publish",
+        excludeDirs = set(["obj", ".vs", "artifacts", "Properties", "node_modules"]), excludeFileExts = set(["sln", "xproj", "log", "sqlog", "ps1", "sh", "user", "md"]), useReleaseDirs = True,
+        # SIGTERM: Kestrel drains the requests in flight and stops gracefully. Then the same screen session is started as by the crontab at reboot.
+        restartCommand = "pkill -TERM -f '[d]otnet SqCoreWeb.dll'; for i in $(seq 30); do pgrep -f '[d]otnet SqCoreWeb.dll' > /dev/null || break; sleep 1; done; pkill -KILL -f '[d]otnet SqCoreWeb.dll'; "
+            + "screen -S SqCoreWeb -X quit; /home/" + serverUser + "/SQ/admin/start-sqcoreweb-in-screen.sh",
+        warmUpUrl = "https://localhost:5001", warmUpPingPath = "/WebServer/Ping", warmUpKeyPaths = ["/", "/index.html", "/UserAccount/NoAuthNeedWebserviceSample", "/WebServer/ServerDiagnostics"],
+        warmUpManifest = "wwwroot/assetManifest.json"),
+    DeployTarget("RedisManager", srcLocalDir, ["Tools/RedisManager", "Common/SqCommon", "Common/DbCommon"], "/home/" + serverUser + "/SqCore/Tools/RedisManager/src",
+        excludeDirs = set(["bin", "obj", ".vs", "artifacts", "Properties", "__pycache__"]), excludeFileExts = set(["sln", "xproj", "log", "sqlog", "ps1", "py", "sh", "user", "md"])),
+    DeployTarget("BenchmarkDB", srcLocalDir, ["Tools/BenchmarkDB", "Common/SqCommon", "Common/DbCommon"], "/home/" + serverUser + "/SQ/Tools/BenchmarkDB/src",
+        excludeDirs = set(["bin", "obj", ".vs", "artifacts", "Properties", "__pycache__"]), excludeFileExts = set(["sln", "xproj", "log", "sqlog", "ps1", "py", "sh", "user", "md"])),
+]
+
+# "mkdir -p" means Create intermediate directories as required.
+# http://stackoverflow.com/questions/14819681/upload-files-using-sftp-in-python-but-create-directories-if-path-doesnt-exist
+def mkdir_p(sftp, remote_directory):
+    """Change to this directory, recursively making new folders if needed.     Returns True if any folders were created."""
+    if remote_directory == '/':
+        # absolute path so change directory to root
+        sftp.chdir('/')
+        return
+    if remote_directory == '':
+        # top-level relative directory must exist
+        return
+    try:
+        sftp.chdir(remote_directory) # sub-directory exists
+    except IOError:
+        dirname, basename = os.path.split(remote_directory.rstrip('/'))
+        mkdir_p(sftp, dirname) # make parent directories
+        sftp.mkdir(basename) # sub-directory missing, so created it
+        sftp.chdir(basename)
+        return True
+
+# all the output lines of the concurrently running targets are prefixed by the target name
+def printTarget(target, msg):
+    print(Fore.CYAN + Style.BRIGHT + "[" + target.name + "] " + msg)
+
+# collect the relative paths (Linux style, e.g. 'wwwroot/index.html', 'SqCoreWeb.dll') of all the files that should be deployed
+def getFileNamesToDeploy(target):
+    fileNames = []
+    for root, dirs, files in os.walk(target.rootLocalDir, topdown=True):
+        curRelPathLinux = os.path.relpath(root, target.rootLocalDir).replace(os.path.sep, '/')
+        # we have to visit all subdirectories
+        dirs[:] = [d for d in dirs if d not in target.excludeDirs]     #Modifying dirs in-place will prune the (subsequent) files and directories visited by os.walk
+
+        if curRelPathLinux != ".":    # root folder is always traversed
+            isFilesTraversed = False
+            for aSubTreeRoot in target.acceptedSubTreeRoots:
+                if curRelPathLinux.startswith(aSubTreeRoot):
+                    isFilesTraversed = True
+                    break
+            if not isFilesTraversed:
+                continue        # if none of the acceptedSubTreeRoots matched, skip to the next loop cycle
+
+        goodFiles = [f for f in files if os.path.splitext(f)[1][1:].strip().lower() not in target.excludeFileExts and not f.endswith(".lock.json") and f not in excludeFileNames]
+        for f in goodFiles:
+            if os.path.isfile(root + "/" + f):
+                fileNames.append(f if curRelPathLinux == "." else curRelPathLinux + "/" + f)
+    return fileNames
+
+def calcFileHash(fileName):
+    hasher = hashlib.sha256()
+    with open(fileName, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+# the local manifest is also a hash cache: if size and mtime didn't change since the last deploy, we don't re-hash the file
+def calcLocalManifest(target, fileNames):
+    prevManifest = {}
+    if os.path.isfile(target.manifestLocalFileName):
+        with open(target.manifestLocalFileName, "r") as file:
+            prevManifest = json.load(file)
+    manifest = {}
+    for relPath in fileNames:
+        st = os.stat(target.rootLocalDir + "/" + relPath)
+        prev = prevManifest.get(relPath)
+        if prev is not None and prev["size"] == st.st_size and prev["mtime"] == st.st_mtime_ns:
+            manifest[relPath] = prev
+        else:
+            manifest[relPath] = {"size": st.st_size, "mtime": st.st_mtime_ns, "sha256": calcFileHash(target.rootLocalDir + "/" + relPath)}
+    return manifest
+
+def readRemoteManifest(target, sftp):
+    try:
+        with sftp.open(target.rootRemoteDir + "/" + manifestFileName, "r") as file:
+            return json.loads(file.read().decode("utf-8"))
+    except IOError:
+        return {}   # first deploy, or the last deploy was a full (non-incremental) one
+
+def writeManifests(target, sftp, manifest, remoteDir):
+    with open(target.manifestLocalFileName, "w") as file:
+        json.dump(manifest, file, indent=0, sort_keys=True)
+    # write to a temp file and rename, so an interrupted write never leaves a corrupted manifest on the server
+    manifestRemoteFileName = remoteDir + "/" + manifestFileName
+    with sftp.open(manifestRemoteFileName + ".tmp", "w") as file:
+        file.write(json.dumps(manifest, indent=0, sort_keys=True))
+    sftp.posix_rename(manifestRemoteFileName + ".tmp", manifestRemoteFileName)
+
+# Reads the stderr of a channel on a thread, from the start of the remote command. Reading all stdout first and stderr only after it would hang, if the remote
+# process writes more than a channel window to stderr (a long traceback): it blocks on its stderr, while we wait for the end of its stdout.
+class StderrReader:
+    def __init__(self, channel):
+        self.channel = channel
+        self.lines = []
+        self.readerThread = threading.Thread(target = self.readLoop, daemon = True)
+        self.readerThread.start()
+
+    def readLoop(self):
+        self.lines = self.channel.makefile_stderr("r").readlines()
+
+    def getLines(self):
+        self.readerThread.join()
+        return self.lines
+
+# every remote command runs on its own channel of the shared transport. No extra SSH handshake.
+def execRemoteCommand(transport, command, stdinData = None):
+    print("SSH channel. Executing remote command: " + command)
+    channel = transport.open_session()
+    channel.exec_command(command)
+    stderrReader = StderrReader(channel)
+    if stdinData is not None:
+        channel.sendall(stdinData.encode("utf-8"))
+        channel.shutdown_write()  # signal EOF to the remote process
+    for line in channel.makefile("r").readlines():
+        print(line, end='') # tell print not to add any 'new line', because the input already contains that
+    for line in stderrReader.getLines():
+        print(Fore.RED + line, end='')
+    exitStatus = channel.recv_exit_status()
+    channel.close()
+    return exitStatus
+
+# File-like object for tarfile. It hands over the compressed chunks to a sender thread through a bounded queue, so
+# reading+compressing the local files overlaps with the network transfer (and with the remote extraction)
+class ChannelWriter:
+    def __init__(self, channel, maxQueuedChunks = 64):
+        self.channel = channel
+        self.chunks = queue.Queue(maxQueuedChunks)
+        self.nBytesWritten = 0
+        self.error = None
+        self.senderThread = threading.Thread(target = self.sendLoop, daemon = True)
+        self.senderThread.start()
+
+    def write(self, data):
+        if self.error is not None:
+            raise self.error
+        self.chunks.put(bytes(data))
+        self.nBytesWritten += len(data)
+        return len(data)
+
+    def sendLoop(self):
+        while True:
+            data = self.chunks.get()
+            if data is None:
+                break
+            if self.error is None:  # after an error we only drain the queue, so the writer never blocks
+                try:
+                    self.channel.sendall(data)
+                except Exception as e:
+                    self.error = e
+
+    def close(self):
+        self.chunks.put(None)
+        self.senderThread.join()
+        self.channel.shutdown_write()  # EOF for the remote 'tar'
+        if self.error is not None:
+            raise self.error
+
+# pack the files into a tar.gz stream and extract it on the server on the fly. Nothing is written to disk except the extracted files.
+def streamUpload(target, transport, fileNames, remoteDir):
+    command = "mkdir -p " + remoteDir + " && tar -xzf - -C " + remoteDir
+    print("SSH channel. Executing remote command: " + command)
+    channel = transport.open_session()
+    channel.exec_command(command)
+    stderrReader = StderrReader(channel)
+    writer = ChannelWriter(channel)
+    gzipWriter = gzip.GzipFile(fileobj = writer, mode = "wb", compresslevel = streamCompressLevel, mtime = 0)    # tarfile's own 'w|gz' stream mode has no compresslevel parameter (before Python 3.12)
+    with tarfile.open(fileobj = gzipWriter, mode = "w|", bufsize = 64 * 1024) as tar:
+        for f in fileNames:
+            tar.add(target.rootLocalDir + "/" + f, arcname = f, recursive = False)
+    gzipWriter.close()
+    writer.close()
+    errorLines = stderrReader.getLines()
+    exitStatus = channel.recv_exit_status()
+    channel.close()
+    if exitStatus != 0:
+        raise Exception("Streaming upload failed. Remote tar exit code %d: %s" % (exitStatus, ''.join(errorLines)))
+    printTarget(target, "Streamed %d files in %.2f MB" % (len(fileNames), writer.nBytesWritten / (1024 * 1024)))
+    return writer.nBytesWritten
+
+# "perFile" mode: remote folders are created up front by one 'mkdir -p', then the files are uploaded concurrently, each worker on its own SFTP channel.
+# Biggest files first, so a large DLL doesn't start last and keep the other channels idle at the end.
+def parallelUpload(target, transport, fileNames, remoteDir):
+    remoteDirs = sorted(set(posixpath.dirname(remoteDir + "/" + f) for f in fileNames))
+    execRemoteCommand(transport, "xargs -0 mkdir -p --", '\0'.join(remoteDirs))
+
+    nWorkers = max(1, min(nUploadWorkers, len(fileNames)))
+    sftpPool = queue.Queue()
+    for i in range(nWorkers):
+        sftpPool.put(paramiko.SFTPClient.from_transport(transport))
+
+    def uploadFile(f):
+        sftpChannel = sftpPool.get()
+        try:
+            sftpChannel.put(target.rootLocalDir + "/" + f, remoteDir + "/" + f, None, True) # Check FileSize after Put() = True
+        finally:
+            sftpPool.put(sftpChannel)
+
+    fileNamesBySize = sorted(fileNames, key = lambda f: os.path.getsize(target.rootLocalDir + "/" + f), reverse = True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers = nWorkers) as executor:
+        for ret in executor.map(uploadFile, fileNamesBySize):  # iterating the results re-raises the first upload exception
+            pass
+    while not sftpPool.empty():
+        sftpPool.get().close()
+    return sum(os.path.getsize(target.rootLocalDir + "/" + f) for f in fileNames)
+
+# Sends the chunks of 'file' from 'offset' on the SqChunkedUpload channel, at most 4 unacknowledged chunks ahead. The acknowledgements are read on a thread, and their rate
+# is the measured throughput that sizes the next chunks. With uploadMaxMBps, the sending is paced. Raises EOFError if the channel closes before the server's 'DONE'.
+def sendChunks(channel, file, offset, size, uploadState):
+    acks = {"offset": offset, "isDone": False, "isClosed": False, "time": time.time()}
+    ackCondition = threading.Condition()
+    def readAcks():
+        for line in channel.makefile("r"):
+            with ackCondition:
+                if line.startswith("ACK "):
+                    (newOffset, now) = (int(line[4:]), time.time())
+                    if now > acks["time"]:
+                        bytesPerSec = (newOffset - acks["offset"]) / (now - acks["time"])
+                        uploadState["bytesPerSec"] = bytesPerSec if uploadState["bytesPerSec"] is None else 0.7 * uploadState["bytesPerSec"] + 0.3 * bytesPerSec
+                    (acks["offset"], acks["time"]) = (newOffset, now)
+                elif line.startswith("DONE"):
+                    acks["isDone"] = True
+                ackCondition.notify_all()
+        with ackCondition:
+            acks["isClosed"] = True
+            ackCondition.notify_all()
+    ackThread = threading.Thread(target = readAcks, daemon = True)
+    ackThread.start()
+
+    paceStartTime = time.time()
+    nPacedBytes = 0
+    while offset < size:
+        with ackCondition:
+            while offset - acks["offset"] >= 4 * uploadState["chunkSize"] and not acks["isClosed"]:
+                ackCondition.wait()
+            if acks["isClosed"]:
+                break
+        file.seek(offset)
+        data = file.read(uploadState["chunkSize"])
+        channel.sendall(SqChunkedUpload.chunkHeaderStruct.pack(offset, len(data), hashlib.sha256(data).digest()))
+        for pieceStart in range(0, len(data), 64 * 1024):
+            piece = data[pieceStart:pieceStart + 64 * 1024]
+            channel.sendall(piece)
+            if uploadMaxMBps > 0:
+                nPacedBytes += len(piece)
+                waitSec = nPacedBytes / (uploadMaxMBps * 1024 * 1024) - (time.time() - paceStartTime)
+                if waitSec > 0:
+                    time.sleep(waitSec)
+        offset += len(data)
+        uploadState["nSentBytes"] += len(data)
+        if uploadState["bytesPerSec"] is not None:
+            uploadState["chunkSize"] = max(minChunkSize, min(maxChunkSize, int(uploadState["bytesPerSec"] * chunkTargetSec) // (64 * 1024) * (64 * 1024)))
+    if offset >= size:
+        channel.sendall(SqChunkedUpload.chunkHeaderStruct.pack(offset, 0, b"\0" * 32))
+    ackThread.join()
+    if not acks["isDone"]:
+        raise EOFError("the upload channel closed at the verified offset %d" % acks["offset"])
+
+# Uploads a big file in sha256 checked chunks, and resumes it after a dropped channel or connection: on the same transport if it is still alive, otherwise on a new one.
+# Returns (the transport it ended on, the number of resumes). If that is not 'transport', the caller closes it after use.
+def resumableUpload(target, transport, localFileName, remoteFileName):
+    size = os.path.getsize(localFileName)
+    sha256 = calcFileHash(localFileName)
+    uploadState = {"chunkSize": 1024 * 1024, "bytesPerSec": None, "nSentBytes": 0}
+    uploadTransport = transport
+    nResumes = 0
+    with open(localFileName, "rb") as file:
+        while True:
+            channel = None
+            try:
+                channel = openHelperChannel(uploadTransport, SqChunkedUpload, ["receive", remoteFileName, str(size), sha256])
+                stderrReader = StderrReader(channel)
+                firstLine = channel.makefile("r").readline()
+                if not firstLine.startswith("OFFSET "):
+                    raise EOFError("the upload helper did not start: " + firstLine + "".join(stderrReader.getLines()))
+                offset = int(firstLine[7:])
+                if nResumes > 0:
+                    printTarget(target, "Resuming the upload at %.2f MB of %.2f MB ..." % (offset / (1024 * 1024), size / (1024 * 1024)))
+                sendChunks(channel, file, offset, size, uploadState)
+                channel.close()
+                break
+            except (EOFError, OSError, paramiko.SSHException) as e:
+                errorLines = stderrReader.getLines() if channel is not None and uploadTransport.is_active() else []
+                if nResumes >= nUploadRetries:
+                    raise Exception("Upload of %s failed after %d resumes: %s %s" % (remoteFileName, nResumes, e, "".join(errorLines)))
+                printTarget(target, Fore.YELLOW + "Upload interrupted: %s %s. Resuming in %d sec ..." % (e, "".join(errorLines).strip(), 2 ** nResumes))
+                time.sleep(2 ** nResumes)
+                nResumes += 1
+                if not uploadTransport.is_active():
+                    if uploadTransport is not transport:
+                        uploadTransport.close()
+                    uploadTransport = connectTransport()
+    printTarget(target, "Uploaded %.2f MB (%.2f MB sent) with %d resumes, last chunk size %d KB." % (size / (1024 * 1024), uploadState["nSentBytes"] / (1024 * 1024), nResumes, uploadState["chunkSize"] // 1024))
+    return (uploadTransport, nResumes)
+
+# "7zip" mode: deploy.7z is created locally, uploaded (chunked, resumable), then unpacked on the server
+def zipUpload(target, transport, sftp, fileNames, remoteDir):
+    # Windows has an 8KB limit on command line length. SqCore Web all files with relative paths are 10KB. We cannot list all the files in the command line. We have to use a @listfile, which can be longer than the command line limit
+    for f in [target.zipFileName, target.zipListFileName]:
+        if os.path.isfile(f):
+            os.remove(f)    # remove old zip and zip list files if exist
+    with open(target.zipListFileName, "w") as zipListFile:
+        zipListFile.write('\n'.join(fileNames))         # concatenate them with a CRLF
+
+    printTarget(target, "Packing all files ...")
+    with SqTiming.PhaseTimer("Deploy", "pack", target.name):
+        cmd = [zipExeWithPath, 'a', target.zipFileName, '-spf2', '@' + target.zipListFileName]
+        # cmd = [zipExeWithPath, 'a', zipFileName, '-spf2', ' '.join(fileNamesToDeploy]  # file list on command line works only if command line is less than 8KB
+        subprocess.run(cmd, cwd = target.rootLocalDir, stderr=subprocess.STDOUT, stdout=subprocess.PIPE)    # run() reads the output while waiting (Popen.wait() with a PIPE can block on a full pipe). cwd instead of os.chdir(), because other targets run in parallel threads
+
+    printTarget(target, "Creating root directory on the server ...")
+    mkdir_p(sftp, remoteDir)
+
+    printTarget(target, "Sending packed file ...")
+    zipFileRemoteName = remoteDir + "/deploy.7z"
+    zipFileSize = os.path.getsize(target.zipFileName)
+    with SqTiming.PhaseTimer("Deploy", "upload", target.name) as timer:
+        timer.fields["bytes"] = zipFileSize
+        (uploadTransport, timer.fields["nResumes"]) = resumableUpload(target, transport, target.zipFileName, zipFileRemoteName)
+
+    printTarget(target, "Unpacking file on the server ...")
+    with SqTiming.PhaseTimer("Deploy", "unpack", target.name):
+        execRemoteCommand(uploadTransport, "cd " + remoteDir + " && 7z x -y " + zipFileRemoteName + " && rm -f " + zipFileRemoteName)   # -y: overwrite the changed files without asking
+    if uploadTransport is not transport:
+        uploadTransport.close()
+
+    os.remove(target.zipFileName)
+    os.remove(target.zipListFileName)
+    return zipFileSize
+
+# A channel running a stdlib only helper module (SqDeltaSync, SqChunkedUpload) on the server. Its source is in the command line itself ('python3 -c'), so there is nothing to install
+# or to keep in sync on the server. (The command line carries the whole helper source, so it is not printed.)
+def openHelperChannel(transport, helperModule, args):
+    print("SSH channel. Executing remote command: python3 -c <" + os.path.basename(helperModule.__file__) + "> " + " ".join(args))
+    with open(helperModule.__file__, "rb") as file:
+        source = base64.b64encode(zlib.compress(file.read(), 9)).decode("ascii")
+    channel = transport.open_session()
+    channel.exec_command("python3 -c \"import base64, zlib; exec(zlib.decompress(base64.b64decode('" + source + "')))\" " + " ".join("'" + a + "'" for a in args))
+    return channel
+
+# Changed files as block deltas: the server sends the block checksums of its copies in 'baseDir', we send back the copy/literal instructions, and the server rebuilds the files in 'remoteDir'.
+# Returns (nBytesSent, fileNames that could not be delta-updated: no base file, helper error, checksum mismatch). Those are sent whole by the caller.
+def deltaUpload(target, transport, fileNames, baseDir, remoteDir):
+    fileSizes = [os.path.getsize(target.rootLocalDir + "/" + f) for f in fileNames]
+    request = SqDeltaSync.getSignaturesRequest(fileNames, fileSizes)
+    channel = openHelperChannel(transport, SqDeltaSync, ["signatures", baseDir])
+    stderrReader = StderrReader(channel)
+    channel.sendall(request)
+    channel.shutdown_write()
+    signatureData = channel.makefile("rb").read()
+    errorLines = stderrReader.getLines()
+    exitStatus = channel.recv_exit_status()
+    channel.close()
+    if exitStatus != 0:
+        printTarget(target, Fore.RED + "Delta helper failed (exit code %d), the changed files are sent whole: %s" % (exitStatus, ''.join(errorLines)))
+        return (len(request), fileNames)
+    signatures = SqDeltaSync.parseSignatures(signatureData, fileNames, fileSizes)
+
+    failedFileNames = [f for f, signature in zip(fileNames, signatures) if signature is None]
+    channel = openHelperChannel(transport, SqDeltaSync, ["patch", baseDir, remoteDir])
+    stderrReader = StderrReader(channel)
+    writer = ChannelWriter(channel)
+    compressor = zlib.compressobj(6)
+    nLiteralBytes = 0
+    for f, signature in zip(fileNames, signatures):
+        if signature is not None:
+            with open(target.rootLocalDir + "/" + f, "rb") as file:
+                data = file.read()
+            (ops, literals) = SqDeltaSync.computeDelta(data, signature)
+            nLiteralBytes += SqDeltaSync.writeFileDelta(writer, compressor, f, data, signature[0], ops, literals)
+    SqDeltaSync.writeStreamEnd(writer, compressor)
+    writer.close()
+    resultLines = channel.makefile("r").readlines()
+    errorLines = stderrReader.getLines()
+    exitStatus = channel.recv_exit_status()
+    channel.close()
+    okFileNames = set(line[3:].rstrip("\n") for line in resultLines if line.startswith("OK "))
+    for line in resultLines + errorLines:
+        if not line.startswith("OK "):
+            printTarget(target, Fore.RED + line.rstrip())
+    failedFileNames += [f for f, signature in zip(fileNames, signatures) if signature is not None and f not in okFileNames]
+    nBytesSent = len(request) + writer.nBytesWritten
+    printTarget(target, "Delta: %d changed files of %.2f MB: %.2f MB literal bytes, %.2f MB sent, %d files to send whole." % (len(fileNames), sum(fileSizes) / (1024 * 1024),
+        nLiteralBytes / (1024 * 1024), nBytesSent / (1024 * 1024), len(failedFileNames)))
+    return (nBytesSent, failedFileNames)
+
+# Create the new release folder. With 'isHardLinkPrev', it starts as a hard-linked copy of the current release: no file content is copied or uploaded for the unchanged files.
+# The first time, a real 'publish' folder (from the pre-release-folder era) is moved into a release folder and replaced by a symlink.
+def prepareReleaseDir(target, transport, releaseDir, isHardLinkPrev):
+    migrateCmd = "if [ -d " + target.rootRemoteDir + " ] && [ ! -L " + target.rootRemoteDir + " ]; then mv " + target.rootRemoteDir + " " + releaseDir + "-migrated && ln -s " + posixpath.basename(releaseDir) + "-migrated " + target.rootRemoteDir + "; fi"
+    if isHardLinkPrev:
+        createCmd = "cp -al \"$(readlink -f " + target.rootRemoteDir + ")\" " + releaseDir
+    else:
+        createCmd = "mkdir -p " + releaseDir
+    return execRemoteCommand(transport, "mkdir -p " + target.releasesRemoteParentDir + " && " + migrateCmd + " && " + createCmd)
+
+# Atomic switch-over: rename(2) of a new symlink over the old one. (ln -sfn is unlink+symlink, with a short window without 'publish')
+# Then delete the oldest releases, but keep the new one and the 'nKeptPrevReleases' before it.
+def switchRelease(target, transport, releaseDir):
+    tmpLink = target.rootRemoteDir + ".new"
+    execRemoteCommand(transport, "ln -sfn " + posixpath.basename(releaseDir) + " " + tmpLink + " && mv -T " + tmpLink + " " + target.rootRemoteDir)
+    execRemoteCommand(transport, "cd " + target.releasesRemoteParentDir + " && ls -1d " + target.releaseNamePrefix + "*/ | sort | head -n -" + str(nKeptPrevReleases + 1) + " | xargs -r rm -rf --")
+
+# The warm-up requests: every asset of the manifest by its served path, uncompressed and in each of its precompressed encodings
+def getWarmUpAssets(target):
+    manifestFileName = target.rootLocalDir + "/" + target.warmUpManifest if target.warmUpManifest is not None else None
+    if manifestFileName is None or not os.path.isfile(manifestFileName):
+        return []
+    with open(manifestFileName, "r") as file:
+        assets = json.load(file)["assets"]
+    return [[a["path"], encoding] for a in assets.values() for encoding in ["identity"] + sorted(a["encodings"].keys())]
+
+# The optional '--restart' phase: restart the service, then (on the server, SqWarmUp.py) wait until it answers, and request the key paths and all the static assets,
+# so the first user doesn't pay for the JIT and the cold caches. The cold start timings go to the deploy timing history.
+def restartAndWarmUp(target, transport):
+    printTarget(target, "Restarting ...")
+    with SqTiming.PhaseTimer("Deploy", "restart", target.name):
+        exitStatus = execRemoteCommand(transport, target.restartCommand)
+    if exitStatus != 0:
+        raise Exception("the restart command failed with exit code %d" % exitStatus)
+    if target.warmUpUrl is None:
+        return
+    assets = getWarmUpAssets(target)
+    printTarget(target, "Waiting for '" + target.warmUpUrl + target.warmUpPingPath + "', then warming up %d key paths and %d asset requests ..." % (len(target.warmUpKeyPaths), len(assets)))
+    channel = openHelperChannel(transport, SqWarmUp, ["warm", target.warmUpUrl, str(readyTimeoutSec), str(nWarmUpThreads)])
+    stderrReader = StderrReader(channel)
+    channel.sendall(json.dumps({"pingPath": target.warmUpPingPath, "keyPaths": target.warmUpKeyPaths, "assets": assets}).encode("utf-8"))
+    channel.shutdown_write()
+    resultLines = channel.makefile("r").readlines()
+    errorLines = stderrReader.getLines()
+    exitStatus = channel.recv_exit_status()
+    channel.close()
+    if exitStatus != 0 or len(resultLines) == 0:
+        raise Exception("the warm-up helper failed (exit code %d): %s" % (exitStatus, ''.join(errorLines)))
+    result = json.loads(resultLines[-1])
+    if result["readySec"] is None:
+        raise Exception(result["error"])
+    SqTiming.record("Deploy", "ready", result["readySec"], target.name)
+    coldTtfbMs = result["coldTtfbMs"].get(target.warmUpKeyPaths[0]) if len(target.warmUpKeyPaths) > 0 else None
+    if coldTtfbMs is not None:  # the first request after the restart, of the first key path
+        SqTiming.record("Deploy", "firstByte", coldTtfbMs / 1000.0, target.name, path = target.warmUpKeyPaths[0], coldTtfbMs = result["coldTtfbMs"])
+    SqTiming.record("Deploy", "warmUp", result["warmSec"], target.name, nRequests = result["nRequests"], nErrors = result["nErrors"], bytes = result["bytes"],
+        assetTtfbMedianMs = result["assetTtfbMedianMs"], assetTtfbMaxMs = result["assetTtfbMaxMs"], warmTtfbMs = result["warmTtfbMs"])
+    printTarget(target, "Ready in %.2f sec. Time to first byte cold/warm (ms): %s. Warm-up: %d requests (%.2f MB) in %.2f sec, %d errors." % (result["readySec"],
+        ", ".join("%s %s/%s" % (p, result["coldTtfbMs"][p], result["warmTtfbMs"][p]) for p in target.warmUpKeyPaths), result["nRequests"], result["bytes"] / (1024 * 1024), result["warmSec"], result["nErrors"]))
+    for error in result["errors"]:
+        printTarget(target, Fore.RED + "Warm-up request failed: " + error)
+
+# deploys one target. Runs in its own thread, with its own SFTP channel on the shared transport. Returns (nDeployedFiles, nUploadedFiles)
+def deployTarget(target, transport):
+    with SqTiming.PhaseTimer("Deploy", "total", target.name):
+        result = deployTargetPhases(target, transport)
+    if restartAfterDeploy and target.restartCommand is not None:    # not in the 'total' of the target: that stays comparable with the deploys without restart
+        restartAndWarmUp(target, transport)
+    return result
+
+def deployTargetPhases(target, transport):
+    printTarget(target, "Start deploying '" + target.acceptedSubTreeRoots[0] + "' ...")
+    sftp = paramiko.SFTPClient.from_transport(transport)
+
+    with SqTiming.PhaseTimer("Deploy", "walk", target.name) as timer:
+        fileNamesToDeploy = getFileNamesToDeploy(target)
+        timer.fields["nFiles"] = len(fileNamesToDeploy)
+    remoteManifest = {}
+    deltaFileNames = []
+    if useIncremental:
+        with SqTiming.PhaseTimer("Deploy", "hash", target.name):
+            localManifest = calcLocalManifest(target, fileNamesToDeploy)
+        with SqTiming.PhaseTimer("Deploy", "readManifest", target.name):
+            remoteManifest = readRemoteManifest(target, sftp)
+
+    if target.useReleaseDirs:
+        targetRemoteDir = target.releasesRemoteParentDir + "/" + target.releaseNamePrefix + time.strftime("%Y%m%d-%H%M%S")
+        printTarget(target, "Creating release folder " + targetRemoteDir + " ...")
+        with SqTiming.PhaseTimer("Deploy", "remoteCleanup", target.name):
+            if prepareReleaseDir(target, transport, targetRemoteDir, len(remoteManifest) > 0) != 0:
+                raise Exception("Creating the release folder failed.")
+    else:
+        targetRemoteDir = target.rootRemoteDir
+
+    if len(remoteManifest) == 0:
+        if not target.useReleaseDirs:
+            #quicker to do one remote command then removing files/folders recursively one by one
+            with SqTiming.PhaseTimer("Deploy", "remoteCleanup", target.name):
+                execRemoteCommand(transport, "rm -rf " + target.rootRemoteDir)
+                mkdir_p(sftp, target.rootRemoteDir)
+        fileNamesToUpload = fileNamesToDeploy
+        fileNamesToRemove = []
+        dirNamesToPrune = []
+    else:
+        fileNamesToUpload = [f for f in fileNamesToDeploy if f not in remoteManifest or remoteManifest[f]["sha256"] != localManifest[f]["sha256"]]
+        fileNamesToRemove = [f for f in remoteManifest if f not in localManifest]
+        dirNamesToPrune = sorted(set(posixpath.dirname(f) for f in fileNamesToRemove) - {""})    # only the folders of the deleted files. Parents first: 'rmdir -p' of a child then removes the parent too, if that became empty
+        if useDelta and SqDeltaSync.np is not None:
+            deltaFileNames = [f for f in fileNamesToUpload if f in remoteManifest and localManifest[f]["size"] >= deltaMinFileSize]
+        printTarget(target, "Incremental deploy: %d files added/changed, %d removed, %d unchanged." % (len(fileNamesToUpload), len(fileNamesToRemove), len(fileNamesToDeploy) - len(fileNamesToUpload)))
+        if target.useReleaseDirs:
+            # the changed files in the new release are still hard links to the files of the live release. Unlink them, so the upload creates new inodes instead of overwriting the live files in place.
+            fileNamesToRemove = fileNamesToRemove + [f for f in fileNamesToUpload if f in remoteManifest]
+
+    if len(fileNamesToRemove) > 0:
+        printTarget(target, "Removing %d deleted/replaced files on the server ..." % len(fileNamesToRemove))
+        # file list goes on stdin (NUL separated), so it has no command line length limit. Then prune the folders emptied by the deletes (not the other empty folders of the server).
+        with SqTiming.PhaseTimer("Deploy", "remoteRemove", target.name):
+            execRemoteCommand(transport, "cd " + targetRemoteDir + " && xargs -0 rm -f --", '\0'.join(fileNamesToRemove))
+            if len(dirNamesToPrune) > 0:
+                execRemoteCommand(transport, "cd " + targetRemoteDir + " && xargs -0 rmdir -p --ignore-fail-on-non-empty --", '\0'.join(dirNamesToPrune))
+
+    for f in fileNamesToUpload:
+        printTarget(target, "Processing file: " + targetRemoteDir + "/" + f)
+
+    fileNamesToSend = fileNamesToUpload
+    if len(deltaFileNames) > 0:
+        printTarget(target, "Sending %d changed files as block deltas ..." % len(deltaFileNames))
+        # the base is the deployed version: with release folders the live release (the copies in the new release folder were unlinked above), otherwise the file itself
+        with SqTiming.PhaseTimer("Deploy", "deltaUpload", target.name) as timer:
+            (timer.fields["bytes"], failedFileNames) = deltaUpload(target, transport, deltaFileNames, target.rootRemoteDir if target.useReleaseDirs else targetRemoteDir, targetRemoteDir)
+            timer.fields["nFiles"] = len(deltaFileNames)
+        fileNamesToSend = [f for f in fileNamesToUpload if f not in deltaFileNames or f in failedFileNames]
+
+    if len(fileNamesToSend) > 0:
+        if uploadMode == "perFile":
+            printTarget(target, "Sending files on %d parallel SFTP channels ..." % min(nUploadWorkers, len(fileNamesToSend)))
+            with SqTiming.PhaseTimer("Deploy", "upload", target.name) as timer:
+                timer.fields["bytes"] = parallelUpload(target, transport, fileNamesToSend, targetRemoteDir)
+        elif uploadMode == "stream":
+            printTarget(target, "Packing, sending and unpacking files on the fly ...")
+            with SqTiming.PhaseTimer("Deploy", "packUploadUnpack", target.name) as timer:   # the 3 phases overlap in the stream mode
+                timer.fields["bytes"] = streamUpload(target, transport, fileNamesToSend, targetRemoteDir)
+        else:
+            zipUpload(target, transport, sftp, fileNamesToSend, targetRemoteDir)     # records its pack, upload, unpack phases
+
+    if useIncremental:
+        writeManifests(target, sftp, localManifest, targetRemoteDir)
+
+    if target.useReleaseDirs:
+        printTarget(target, "Switching '" + target.rootRemoteDir + "' symlink to the new release ...")
+        with SqTiming.PhaseTimer("Deploy", "switchRelease", target.name):
+            switchRelease(target, transport, targetRemoteDir)
+
+    sftp.close()
+    return (len(fileNamesToDeploy), len(fileNamesToUpload))
+
+# the authenticated SSH transport to the MTrader server (also used by SqLogTail.py)
+def connectTransport():
+    transport = paramiko.Transport((serverHost, serverPort))
+    transport.connect(username = serverUser, pkey = paramiko.RSAKey.from_private_key_file(serverRsaKeyFile))
+    return transport
+
+def main(args):
+    global restartAfterDeploy
+    start_time = time.time()
+    colorama.init()
+    restartAfterDeploy = restartAfterDeploy or "--restart" in args
+    targetNames = [a for a in args if not a.startswith("--")]
+    targets = [t for t in deployTargets if len(targetNames) == 0 or t.name in targetNames]
+    unknownNames = set(targetNames) - set(t.name for t in deployTargets)
+    if len(unknownNames) > 0:
+        sys.exit(Fore.RED + "Unknown deploy target(s): " + ', '.join(unknownNames) + ". Known targets: " + ', '.join(t.name for t in deployTargets))
+    os.makedirs(localWorkDir, exist_ok = True)
+
+    # one handshake, one key load for all the targets. Every SFTP session and remote command is a separate channel multiplexed on this transport.
+    print(Fore.MAGENTA + Style.BRIGHT + "SSH transport is connecting...")
+    with SqTiming.PhaseTimer("Deploy", "connect"):
+        transport = connectTransport()
+
+    isAllOk = True
+    with concurrent.futures.ThreadPoolExecutor(max_workers = len(targets)) as executor:
+        futures = [(t, executor.submit(deployTarget, t, transport)) for t in targets]
+        for target, future in futures:
+            try:
+                (nDeployed, nUploaded) = future.result()
+                print(Fore.MAGENTA + Style.BRIGHT + "Deployment '" + target.name + "' is OK. %d files (%d uploaded)." % (nDeployed, nUploaded))
+            except Exception as e:
+                isAllOk = False
+                print(Fore.RED + Style.BRIGHT + "Deployment '" + target.name + "' FAILED: " + str(e))
+
+    print(Fore.MAGENTA + Style.BRIGHT + "SSH transport is closing.")
+    transport.close()
+    SqTiming.record("Deploy", "total", time.time() - start_time, ok = isAllOk, nTargets = len(targets))
+    print("--- Deployment of %d target(s) ended in %03.2f seconds ---" % (len(targets), time.time() - start_time))    # SqCoreWeb 183 files: one by one upload: 38sec, 7zip: 4.8sec
+    if not isAllOk:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
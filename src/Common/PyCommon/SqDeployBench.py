@@ -0,0 +1,395 @@
+# Reproducible benchmark of the SqDeploy.py upload modes ("perFile", "7zip", "stream") against a local SSH/SFTP stand-in server, instead of the real MTrader server.
+# The stand-in is a paramiko server in a child process: SFTP on the local file system + 'exec' of the remote commands by the local shell (so it needs Linux or WSL, same as the remote commands of SqDeploy).
+# A throttling TCP proxy in front of it emulates the bandwidth and latency of the real server ports (port 22 is bandwidth throttled because of VNC, port 122 is not).
+# The deployed folder is a synthetic 'publish' tree (DLLs in the root, wwwroot with JS bundles and their .br/.gz, CSS, HTML, images), generated from a seed, so the runs are comparable.
+# Usage: 'python SqDeployBench.py --profile port122,port22 --nFiles 300 --repeat 3'. With '--changeKind patch --delta': the block delta transfer of the changed files.
+# Results are appended to SqCore/logs/SqDeployBench.jsonl (SqTiming format), so 'python SqTiming.py --file ../../../logs/SqDeployBench.jsonl' flags the regressions between CI runs.
+
+import os
+import sys
+import time
+import random
+import socket
+import shutil
+import queue
+import tempfile
+import argparse
+import statistics
+import threading
+import subprocess
+import paramiko
+import SqTiming
+import SqDeploy
+
+# (bandwidth in MB/s, round trip time in ms) of the emulated network. 0 bandwidth: not throttled.
+# Rough values of the MTrader server from a developer PC in Hungary. Refine them from the 'MBps' of the real 'Deploy' records in SqTimings.jsonl.
+throttleProfiles = {
+    "none": (0, 0),
+    "port122": (8.0, 40),
+    "port22": (0.5, 40),
+}
+
+# The file mix of SqCoreWeb/bin/Release/netcoreapp3.1/publish: (relDir, extension, share of the file count, minKB, maxKB, content kind)
+# '{i}' in relDir spreads the files over several subfolders. 'text' content compresses well, 'binary' (images, fonts, .br, .gz) not at all, 'dll' partly.
+fileMix = [
+    ("", "dll", 0.30, 5, 3000, "dll"),
+    ("", "json", 0.03, 1, 50, "text"),
+    ("wwwroot/webapps/App{i}", "js", 0.12, 10, 3000, "text"),
+    ("wwwroot/webapps/App{i}", "js.br", 0.12, 3, 600, "binary"),
+    ("wwwroot/webapps/App{i}", "js.gz", 0.12, 3, 800, "binary"),
+    ("wwwroot/webapps/App{i}", "css", 0.06, 1, 300, "text"),
+    ("wwwroot/webpages/Page{i}", "html", 0.12, 1, 40, "text"),
+    ("wwwroot/images", "png", 0.07, 1, 200, "binary"),
+    ("wwwroot/images/favicon", "ico", 0.03, 1, 30, "binary"),
+    ("wwwroot/fonts", "woff2", 0.03, 20, 150, "binary"),
+]
+nSubFolders = 8
+
+# ---------- Synthetic publish tree
+
+def generateContent(rng, kind, size):
+    if kind == "binary":
+        return rng.getrandbits(size * 8).to_bytes(size, "little")
+    if kind == "dll":   # half random (code, resources), half low entropy (metadata tables, padding): compresses about 2x, like the real DLLs
+        half = size // 2
+        return rng.getrandbits(half * 8).to_bytes(half, "little") + bytes(rng.randrange(4) for i in range(size - half))
+    words = ["function", "return", "const", "this", "subscribe", "Observable", "ngOnInit", "price", "quote", "=>", "{", "}", ";", "\n"]
+    text = " ".join(rng.choice(words) + str(rng.randrange(1000)) for i in range(size // 6 + 1))
+    return text.encode("ascii")[:size]
+
+# Returns the list of (relPath, kind) of the generated files. File sizes are log-uniform between minKB and maxKB.
+def generateTree(rootDir, nFiles, sizeScale, seed):
+    rng = random.Random(seed)
+    files = []
+    for relDir, ext, share, minKB, maxKB, kind in fileMix:
+        for i in range(max(1, round(nFiles * share))):
+            relPath = (relDir.replace("{i}", str(i % nSubFolders)) + "/" if relDir != "" else "") + ext.split(".")[0] + str(i) + "." + ext
+            size = int(1024 * sizeScale * minKB * (maxKB / minKB) ** rng.random())
+            os.makedirs(os.path.dirname(rootDir + "/" + relPath), exist_ok = True)
+            with open(rootDir + "/" + relPath, "wb") as file:
+                file.write(generateContent(rng, kind, size))
+            files.append((relPath, kind))
+    return files
+
+# the 'changed' scenario: a new build changes some of the files. changeKind "rewrite": same size, new content. "patch": a few small edits and insertions
+# in the old content (as a rebuilt DLL or bundle: most bytes are the same, but shifted), the case of the SqDeploy.useDelta block deltas.
+def changeFiles(rootDir, files, changePercent, rng, changeKind = "rewrite"):
+    changed = rng.sample(files, max(1, len(files) * changePercent // 100))
+    for relPath, kind in changed:
+        size = os.path.getsize(rootDir + "/" + relPath)
+        if changeKind == "patch":
+            with open(rootDir + "/" + relPath, "rb") as file:
+                content = file.read()
+            for i in range(rng.randint(1, 5)):
+                pos = rng.randrange(len(content) + 1)
+                edit = generateContent(rng, kind, rng.randint(1, 200))
+                content = content[:pos] + edit + content[pos + (len(edit) if rng.random() < 0.5 else 0):]   # overwrite or insert
+        else:
+            content = generateContent(rng, kind, size)
+        with open(rootDir + "/" + relPath, "wb") as file:
+            file.write(content)
+    return len(changed)
+
+# ---------- SSH/SFTP stand-in server (runs in the child process started by startServer())
+
+class LocalSftpHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+# the remote paths are local paths: the benchmark targets deploy into its temp folder
+class LocalSftpServer(paramiko.SFTPServerInterface):
+    def list_folder(self, path):
+        try:
+            out = []
+            for fileName in os.listdir(path):
+                attr = paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, fileName)))
+                attr.filename = fileName
+                out.append(attr)
+            return out
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(path, flags, getattr(attr, "st_mode", None) or 0o666)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        handle = LocalSftpHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def fsOp(self, func, *args):
+        try:
+            func(*args)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def remove(self, path):
+        return self.fsOp(os.remove, path)
+
+    def rename(self, oldPath, newPath):
+        return self.fsOp(os.rename, oldPath, newPath)
+
+    def posix_rename(self, oldPath, newPath):
+        return self.fsOp(os.replace, oldPath, newPath)
+
+    def mkdir(self, path, attr):
+        return self.fsOp(os.mkdir, path)
+
+    def rmdir(self, path):
+        return self.fsOp(os.rmdir, path)
+
+    def chattr(self, path, attr):
+        return paramiko.SFTP_OK
+
+    def symlink(self, targetPath, path):
+        return self.fsOp(os.symlink, targetPath, path)
+
+    def readlink(self, path):
+        try:
+            return os.readlink(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+class LocalSshServer(paramiko.ServerInterface):
+    def __init__(self, clientKey):
+        self.clientKey = clientKey
+
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL if key.get_base64() == self.clientKey.get_base64() else paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target = execCommand, args = (channel, command.decode("utf-8")), daemon = True).start()
+        return True
+
+# runs a remote command of SqDeploy with the local shell, and pumps the channel <-> process streams
+def execCommand(channel, command):
+    proc = subprocess.Popen(command, shell = True, executable = "/bin/bash", stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.PIPE, bufsize = 0)   # unbuffered stdin, as sshd: SqChunkedUpload waits for the acknowledgements of what it sent
+
+    def pumpStdin():
+        try:
+            for data in iter(lambda: channel.recv(64 * 1024), b""):
+                proc.stdin.write(data)
+            proc.stdin.close()  # EOF from the client (shutdown_write)
+        except (OSError, EOFError):
+            pass    # the process exited without reading all its input (e.g. 'rm -rf' gets no input at all)
+
+    def pumpOutput(stream, sendFunc):
+        for data in iter(lambda: os.read(stream.fileno(), 64 * 1024), b""):
+            sendFunc(data)
+
+    threading.Thread(target = pumpStdin, daemon = True).start()
+    stderrThread = threading.Thread(target = pumpOutput, args = (proc.stderr, channel.sendall_stderr), daemon = True)
+    stderrThread.start()
+    pumpOutput(proc.stdout, channel.sendall)
+    stderrThread.join()
+    channel.send_exit_status(proc.wait())
+    channel.close()
+
+# Forwards one direction of a TCP connection with a one way delay (RTT/2) and a bandwidth cap.
+# The reader timestamps the chunks, the writer sends them after the delay, paced to the bandwidth, so the delay doesn't limit the throughput (as on a real link).
+def throttledPipe(src, dst, bytesPerSec, delaySec):
+    chunks = queue.Queue()
+
+    def readLoop():
+        try:
+            for data in iter(lambda: src.recv(64 * 1024), b""):
+                chunks.put((time.time() + delaySec, data))
+        except OSError:
+            pass
+        chunks.put((time.time() + delaySec, b""))
+
+    threading.Thread(target = readLoop, daemon = True).start()
+    linkFreeTime = 0.0
+    try:
+        while True:
+            deadline, data = chunks.get()
+            time.sleep(max(0.0, deadline - time.time()))
+            if len(data) == 0:
+                dst.shutdown(socket.SHUT_WR)
+                break
+            if bytesPerSec > 0:
+                linkFreeTime = max(time.time(), linkFreeTime) + len(data) / bytesPerSec
+                time.sleep(max(0.0, linkFreeTime - time.time()))
+            dst.sendall(data)
+    except OSError:
+        pass
+
+def serveSshConnection(sock, hostKey, clientKey):
+    transport = paramiko.Transport(sock)
+    transport.add_server_key(hostKey)
+    transport.set_subsystem_handler("sftp", paramiko.SFTPServer, LocalSftpServer)
+    transport.start_server(server = LocalSshServer(clientKey))
+    while transport.is_active():
+        time.sleep(0.5)
+
+def proxyConnection(clientSock, sshPort, bytesPerSec, delaySec):
+    serverSock = socket.create_connection(("127.0.0.1", sshPort))
+    for s in [clientSock, serverSock]:
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    threading.Thread(target = throttledPipe, args = (clientSock, serverSock, bytesPerSec, delaySec), daemon = True).start()
+    threading.Thread(target = throttledPipe, args = (serverSock, clientSock, bytesPerSec, delaySec), daemon = True).start()
+
+def acceptLoop(listenSock, handler, *args):
+    while True:
+        sock, addr = listenSock.accept()
+        threading.Thread(target = handler, args = (sock,) + args, daemon = True).start()
+
+def listenOnFreePort():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+    return sock
+
+# child process main: the SSH server on an internal port, the throttling proxy on the port given back to the parent on stdout
+def runServer(clientKeyFile, profile):
+    clientKey = paramiko.RSAKey.from_private_key_file(clientKeyFile)
+    hostKey = paramiko.RSAKey.generate(2048)
+    sshSock = listenOnFreePort()
+    threading.Thread(target = acceptLoop, args = (sshSock, serveSshConnection, hostKey, clientKey), daemon = True).start()
+    (bandwidthMBps, rttMs) = throttleProfiles[profile]
+    proxySock = listenOnFreePort()
+    print("READY %d" % proxySock.getsockname()[1], flush = True)
+    acceptLoop(proxySock, proxyConnection, sshSock.getsockname()[1], bandwidthMBps * 1024 * 1024, rttMs / 2000.0)
+
+def startServer(clientKeyFile, profile):
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", "--clientKeyFile", clientKeyFile, "--profile", profile], stdout = subprocess.PIPE, universal_newlines = True)
+    for line in proc.stdout:
+        if line.startswith("READY "):
+            return (proc, int(line.split()[1]))
+    raise Exception("The SSH stand-in server didn't start.")
+
+# ---------- Benchmark runner (parent process)
+
+def isZipAvailable():
+    return shutil.which(SqDeploy.zipExeWithPath) is not None or os.path.isfile(SqDeploy.zipExeWithPath)
+
+# Returns (sec, the number of files the deploy uploaded)
+def runDeploy(target, transport, scenario):
+    if target.useReleaseDirs:   # release folders are named by the second. Start in a new second, so 2 quick deploys never get the same folder.
+        time.sleep(1.0 - time.time() % 1.0)
+    startTime = time.time()
+    (nDeployedFiles, nUploadedFiles) = SqDeploy.deployTarget(target, transport)
+    return (time.time() - startTime, nUploadedFiles)
+
+# Every mode, profile and repeat starts from the same pristine tree (regenerated from the seed), and the changes of repeat 'i' are the same in every mode and profile, so the runs are comparable.
+def benchProfile(args, profile, benchDir, localTreeDir, files, clientKeyFile):
+    results = []
+    (serverProc, port) = startServer(clientKeyFile, profile)
+    try:
+        (SqDeploy.serverHost, SqDeploy.serverPort, SqDeploy.serverUser, SqDeploy.serverRsaKeyFile) = ("127.0.0.1", port, "bench", clientKeyFile)    # a resumed upload reconnects with these
+        transport = SqDeploy.connectTransport()
+        for mode in args.modes.split(","):
+            if mode == "7zip" and not isZipAvailable():
+                print("Mode '7zip' skipped: " + SqDeploy.zipExeWithPath + " is not found.")
+                continue
+            SqDeploy.uploadMode = mode
+            target = SqDeploy.DeployTarget("Bench-" + mode + "-" + profile, localTreeDir, ["wwwroot"], benchDir + "/remote/" + mode + "-" + profile + "/publish", excludeDirs = set(), excludeFileExts = set(), useReleaseDirs = args.releaseDirs)
+            secs = {"full": [], "noChange": [], "changed": []}
+            nChanged = 0
+            for i in range(args.repeat):
+                shutil.rmtree(localTreeDir, ignore_errors = True)   # the previous 'changed' scenario edited the tree
+                generateTree(localTreeDir, args.nFiles, args.sizeScale, args.seed)
+                shutil.rmtree(os.path.dirname(target.rootRemoteDir), ignore_errors = True)   # empty server and no local manifest: full deploy
+                if os.path.isfile(target.manifestLocalFileName):
+                    os.remove(target.manifestLocalFileName)
+                secs["full"].append(runDeploy(target, transport, "full")[0])
+                secs["noChange"].append(runDeploy(target, transport, "noChange")[0])
+                changeFiles(localTreeDir, files, args.changePercent, random.Random("%d/%d" % (args.seed, i)), args.changeKind)
+                (sec, nChanged) = runDeploy(target, transport, "changed")    # the files the deploy found changed, not the files changeFiles() touched
+                secs["changed"].append(sec)
+            for scenario, values in secs.items():
+                results.append((profile, mode, scenario, statistics.median(values), min(values), nChanged if scenario == "changed" else len(files)))
+                SqTiming.record("DeployBench", scenario, statistics.median(values), mode + "/" + profile, nFiles = len(files), nChanged = nChanged if scenario == "changed" else None, repeat = args.repeat, releaseDirs = args.releaseDirs, delta = args.delta, changeKind = args.changeKind)
+        transport.close()
+    finally:
+        serverProc.kill()
+        serverProc.wait()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark of the SqDeploy upload modes against a local SSH/SFTP stand-in server.")
+    parser.add_argument("--modes", default = "perFile,7zip,stream", help = "comma separated SqDeploy.uploadMode values")
+    parser.add_argument("--profile", default = "none,port122,port22", help = "comma separated network profiles: " + ", ".join(throttleProfiles.keys()))
+    parser.add_argument("--nFiles", type = int, default = 300, help = "number of files in the synthetic publish tree")
+    parser.add_argument("--sizeScale", type = float, default = 1.0, help = "multiplier of the file sizes")
+    parser.add_argument("--changePercent", type = int, default = 5, help = "percent of the files changed in the 'changed' scenario")
+    parser.add_argument("--changeKind", choices = ["rewrite", "patch"], default = "rewrite", help = "'rewrite': new content, 'patch': small edits in the old content")
+    parser.add_argument("--delta", action = "store_true", help = "send the changed files as block deltas (SqDeploy.useDelta)")
+    parser.add_argument("--repeat", type = int, default = 3, help = "runs per mode and scenario. The median is reported")
+    parser.add_argument("--seed", type = int, default = 42, help = "random seed of the synthetic tree, so the runs are comparable")
+    parser.add_argument("--releaseDirs", action = "store_true", help = "deploy into release folders with symlink switch (as SqCoreWeb)")
+    parser.add_argument("--history", default = os.path.dirname(SqTiming.historyFileName) + "/SqDeployBench.jsonl", help = "JSONL file of the results")
+    parser.add_argument("--keep", action = "store_true", help = "don't delete the temp folder of the trees")
+    parser.add_argument("--serve", action = "store_true", help = argparse.SUPPRESS)    # internal: run as the stand-in server process
+    parser.add_argument("--clientKeyFile", help = argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        runServer(args.clientKeyFile, args.profile)
+        return
+
+    unknownProfiles = [p for p in args.profile.split(",") if p not in throttleProfiles]
+    if len(unknownProfiles) > 0:
+        sys.exit("Unknown profile(s): " + ", ".join(unknownProfiles))
+    SqDeploy.useDelta = args.delta
+    SqTiming.historyFileName = args.history     # the per phase 'Deploy' records and the 'DeployBench' summaries go to the benchmark history, not to the real deploy history
+    benchDir = tempfile.mkdtemp(prefix = "SqDeployBench-").replace(os.path.sep, '/')
+    SqDeploy.localWorkDir = benchDir + "/work"
+    os.makedirs(SqDeploy.localWorkDir)
+    try:
+        localTreeDir = benchDir + "/publish"
+        files = generateTree(localTreeDir, args.nFiles, args.sizeScale, args.seed)
+        treeMB = sum(os.path.getsize(localTreeDir + "/" + f) for f, kind in files) / (1024 * 1024)
+        print("Synthetic publish tree: %d files, %.1f MB in %s" % (len(files), treeMB, localTreeDir))
+
+        clientKeyFile = benchDir + "/client.pem"
+        paramiko.RSAKey.generate(2048).write_private_key_file(clientKeyFile)
+
+        results = []
+        for profile in args.profile.split(","):
+            results += benchProfile(args, profile, benchDir, localTreeDir, files, clientKeyFile)
+
+        print("")
+        print("%-9s %-8s %-9s %7s %10s %9s" % ("profile", "mode", "scenario", "files", "median", "best"))
+        for profile, mode, scenario, median, best, nFiles in results:
+            print("%-9s %-8s %-9s %7d %9.2fs %8.2fs" % (profile, mode, scenario, nFiles, median, best))
+        print("Results are appended to " + SqTiming.historyFileName)
+    finally:
+        if not args.keep:
+            shutil.rmtree(benchDir, ignore_errors = True)
+
+if __name__ == "__main__":
+    main()
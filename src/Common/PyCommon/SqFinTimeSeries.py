@@ -0,0 +1,191 @@
+# Builder and reader of the .sqfts FinTimeSeries snapshot files (format: docs/Design/TimeSeries.txt). One file per ticker: header, sorted DateOnly key column, one contiguous array per TickType.
+# read() maps the columns of a file as zero-copy np.memmap arrays, so a snapshot of decades of daily data opens in microseconds, and only the touched pages are loaded.
+# Usage:
+#   'python SqFinTimeSeries.py build AAPL.csv SPY.csv --outDir ../../../data/sqfts'   YahooFinance history CSV (Date,Open,High,Low,Close,Adj Close,Volume) or CSV with TickType named columns
+#   'python SqFinTimeSeries.py info ../../../data/sqfts/AAPL.sqfts'
+#   'python SqFinTimeSeries.py dump ../../../data/sqfts/AAPL.sqfts --from 2020-03-01 --to 2020-03-31'
+
+import os
+import csv
+import struct
+import argparse
+import numpy as np
+
+magic = b"SQFTSNAP"
+formatVersion = 1
+headerStruct = struct.Struct("<8sHBBBBHIIQ32s")     # 64 bytes
+columnStruct = struct.Struct("<HBxxxxxQ")            # 16 bytes
+alignment = 64
+tickTypes = ["Open", "Close", "High", "Low", "Volume", "Dividend", "SplitRatio", "SplitAdjClose", "SplitDivAdjClose", "Ask", "Bid", "Last", "OpenInterest", "Settle", "EFP", "SHIR", "SharesOutstanding"]  # = C# enum TickType
+keyTypes = {1: np.dtype("<u2"), 2: np.dtype("<i8")}     # 1: DateOnly, 2: DateTime Ticks
+valueTypes = {1: np.dtype("<f4"), 2: np.dtype("<f8"), 3: np.dtype("<u4"), 4: np.dtype("<i4"), 5: np.dtype("<u8")}
+dateOnlyEpoch = np.datetime64("1899-12-31", "D")
+yahooCsvColumns = {"Open": "Open", "High": "High", "Low": "Low", "Close": "Close", "Adj Close": "SplitDivAdjClose", "Volume": "Volume"}
+defaultValue2TickTypes = set(["Volume", "OpenInterest", "SharesOutstanding"])   # integer columns (values2), as in MemDb's FinTimeSeries<DateOnly, float, uint>
+
+def align(offset):
+    return (offset + alignment - 1) // alignment * alignment
+
+def getTypeCode(types, dtype):
+    return next(code for code, t in types.items() if t == np.dtype(dtype).newbyteorder("<"))
+
+# 'keys': DateOnly days (uint16) or DateTime Ticks (int64), strictly increasing. 'values1'/'values2': {tickTypeName: array of nRows}
+def write(fileName, ticker, keys, values1, values2):
+    keys = np.ascontiguousarray(keys)
+    if len(keys) > 1 and not np.all(keys[1:] > keys[:-1]):
+        raise ValueError(fileName + ": the keys must be strictly increasing")
+    keyType = getTypeCode(keyTypes, keys.dtype)
+    value1Dtype = next(iter(values1.values())).dtype if len(values1) > 0 else np.dtype("<f4")
+    value2Dtype = next(iter(values2.values())).dtype if len(values2) > 0 else np.dtype("<u4")
+    columns = [(tickTypes.index(t), 1, np.ascontiguousarray(a, dtype = value1Dtype)) for t, a in values1.items()] + [(tickTypes.index(t), 2, np.ascontiguousarray(a, dtype = value2Dtype)) for t, a in values2.items()]
+    for tickType, valueSet, array in columns:
+        if len(array) != len(keys):
+            raise ValueError("%s: column %s has %d values for %d keys" % (fileName, tickTypes[tickType], len(array), len(keys)))
+
+    offset = align(headerStruct.size + columnStruct.size * len(columns))
+    keyOffset = offset
+    offset = align(offset + keys.nbytes)
+    columnOffsets = []
+    for tickType, valueSet, array in columns:
+        columnOffsets.append(offset)
+        offset = align(offset + array.nbytes)
+    fileSize = offset
+    tempFileName = fileName + ".tmp"
+    with open(tempFileName, "wb") as file:
+        file.write(headerStruct.pack(magic, formatVersion, keyType, getTypeCode(valueTypes, value1Dtype), getTypeCode(valueTypes, value2Dtype), 0, len(columns), len(keys), 0, fileSize, ticker.encode("utf-8")[:32]))
+        for (tickType, valueSet, array), columnOffset in zip(columns, columnOffsets):
+            file.write(columnStruct.pack(tickType, valueSet, columnOffset))
+        for array, arrayOffset in [(keys, keyOffset)] + [(c[2], o) for c, o in zip(columns, columnOffsets)]:
+            file.write(b"\0" * (arrayOffset - file.tell()))
+            file.write(array.astype(array.dtype.newbyteorder("<"), copy = False).tobytes())
+        file.write(b"\0" * (fileSize - file.tell()))
+    os.replace(tempFileName, fileName)     # a reader (MemDb) never sees a half written file
+
+class Snapshot:
+    def __init__(self, fileName, ticker, keys, values1, values2):
+        self.fileName = fileName
+        self.ticker = ticker
+        self.keys = keys
+        self.values1 = values1  # {tickTypeName: np.memmap}
+        self.values2 = values2
+
+    def getDates(self):    # numpy datetime64[D] (a computed copy, the keys are the mapped DateOnly days)
+        if self.keys.dtype == keyTypes[1]:
+            return dateOnlyEpoch + self.keys.astype("timedelta64[D]")
+        return np.datetime64("0001-01-01", "us") + (self.keys // 10).astype("timedelta64[us]")  # .NET Ticks: 100ns since 0001-01-01
+
+    # the index range [start, end) of the DateOnly keys in [fromDate, toDate], by binary search
+    def getRange(self, fromDate = None, toDate = None):
+        start = 0 if fromDate is None else int(np.searchsorted(self.keys, toDateOnly(fromDate), "left"))
+        end = len(self.keys) if toDate is None else int(np.searchsorted(self.keys, toDateOnly(toDate), "right"))
+        return (start, end)
+
+def toDateOnly(date):
+    return (np.datetime64(date, "D") - dateOnlyEpoch).astype(np.int64)
+
+# Maps the file read only. The arrays stay valid while they are referenced (np.memmap keeps the mapping open).
+def read(fileName):
+    with open(fileName, "rb") as file:
+        header = file.read(headerStruct.size)
+        if len(header) < headerStruct.size:
+            raise ValueError(fileName + ": not a .sqfts file (too short)")
+        (fileMagic, version, keyType, value1Type, value2Type, reserved, nColumns, nRows, reserved2, fileSize, ticker) = headerStruct.unpack(header)
+        if fileMagic != magic or version > formatVersion:
+            raise ValueError(fileName + ": not a .sqfts file, or its version (%d) is newer than %d" % (version, formatVersion))
+        if os.fstat(file.fileno()).st_size != fileSize:
+            raise ValueError(fileName + ": the file size is %d, the header says %d (truncated?)" % (os.fstat(file.fileno()).st_size, fileSize))
+        columns = [columnStruct.unpack(file.read(columnStruct.size)) for i in range(nColumns)]
+    keyOffset = align(headerStruct.size + columnStruct.size * nColumns)
+    keys = np.memmap(fileName, dtype = keyTypes[keyType], mode = "r", offset = keyOffset, shape = (nRows,)) if nRows > 0 else np.empty(0, keyTypes[keyType])
+    values = {1: {}, 2: {}}
+    for tickType, valueSet, offset in columns:
+        dtype = valueTypes[value1Type if valueSet == 1 else value2Type]
+        values[valueSet][tickTypes[tickType]] = np.memmap(fileName, dtype = dtype, mode = "r", offset = offset, shape = (nRows,)) if nRows > 0 else np.empty(0, dtype)
+    return Snapshot(fileName, ticker.rstrip(b"\0").decode("utf-8"), keys, values[1], values[2])
+
+def parseCsvFloat(text):
+    return float(text) if text not in ("", "null", "NaN", "nan") else float("nan")
+
+# YahooFinance history CSV, or a CSV whose columns are 'Date' and TickType names. Returns (keys, values1, values2), sorted by date, a repeated date keeps its last row.
+def readCsv(fileName, value2TickTypes):
+    with open(fileName, "r", newline = "") as file:
+        reader = csv.DictReader(file)
+        columnTickTypes = {}
+        for column in reader.fieldnames:
+            tickType = yahooCsvColumns.get(column, column)
+            if tickType in tickTypes:
+                columnTickTypes[column] = tickType
+            elif column != "Date":
+                print("SqFinTimeSeries: %s: column '%s' is not a TickType, skipped." % (os.path.basename(fileName), column))
+        rows = {}
+        for row in reader:
+            rows[toDateOnly(row["Date"][:10])] = row
+    keys = np.array(sorted(rows.keys()), dtype = keyTypes[1])
+    sortedRows = [rows[k] for k in sorted(rows.keys())]
+    values1 = {}
+    values2 = {}
+    for column, tickType in columnTickTypes.items():
+        floats = np.array([parseCsvFloat(r[column]) for r in sortedRows], dtype = np.float64)
+        if tickType in value2TickTypes:
+            values2[tickType] = np.nan_to_num(floats, nan = 0.0).astype(valueTypes[3])
+        else:
+            values1[tickType] = np.round(floats, 4).astype(valueTypes[1])    # as MemDb: prices rounded to 4 digits, float
+    return (keys, values1, values2)
+
+def cmdBuild(args):
+    os.makedirs(args.outDir, exist_ok = True)
+    for csvFileName in args.csvFiles:
+        ticker = os.path.splitext(os.path.basename(csvFileName))[0]
+        (keys, values1, values2) = readCsv(csvFileName, defaultValue2TickTypes)
+        if args.columns:
+            wanted = set(c.strip() for c in args.columns.split(","))
+            values1 = {t: a for t, a in values1.items() if t in wanted}
+            values2 = {t: a for t, a in values2.items() if t in wanted}
+        outFileName = os.path.join(args.outDir, ticker + ".sqfts")
+        write(outFileName, ticker, keys, values1, values2)
+        print("SqFinTimeSeries: %s: %d days, columns %s -> %s (%d bytes)" % (ticker, len(keys), ", ".join(list(values1.keys()) + list(values2.keys())), outFileName, os.path.getsize(outFileName)))
+
+def cmdInfo(args):
+    for fileName in args.files:
+        snapshot = read(fileName)
+        dates = snapshot.getDates()
+        dateRange = "%s .. %s" % (dates[0], dates[-1]) if len(dates) > 0 else "empty"
+        print("%s: ticker %s, %d rows (%s)" % (fileName, snapshot.ticker, len(snapshot.keys), dateRange))
+        for valueSet, values in [(1, snapshot.values1), (2, snapshot.values2)]:
+            for tickType, array in values.items():
+                print("    values%d %-18s %s" % (valueSet, tickType, array.dtype))
+
+def cmdDump(args):
+    snapshot = read(args.file)
+    (start, end) = snapshot.getRange(args.fromDate, args.toDate)
+    columns = [(t, a) for t, a in list(snapshot.values1.items()) + list(snapshot.values2.items())]
+    dates = snapshot.getDates()
+    print(",".join(["Date"] + [t for t, a in columns]))
+    for i in range(start, end):
+        print(",".join([str(dates[i])] + [str(a[i]) for t, a in columns]))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Builder and reader of .sqfts FinTimeSeries snapshot files.")
+    subparsers = parser.add_subparsers(dest = "command")
+    buildParser = subparsers.add_parser("build", help = "one .sqfts per CSV file (the file name is the ticker)")
+    buildParser.add_argument("csvFiles", nargs = "+")
+    buildParser.add_argument("--outDir", default = ".")
+    buildParser.add_argument("--columns", help = "comma separated TickTypes to keep, e.g. SplitDivAdjClose,Volume (default: all)")
+    infoParser = subparsers.add_parser("info", help = "header and columns")
+    infoParser.add_argument("files", nargs = "+")
+    dumpParser = subparsers.add_parser("dump", help = "print the rows as CSV")
+    dumpParser.add_argument("file")
+    dumpParser.add_argument("--from", dest = "fromDate", help = "yyyy-MM-dd (inclusive)")
+    dumpParser.add_argument("--to", dest = "toDate", help = "yyyy-MM-dd (inclusive)")
+    args = parser.parse_args()
+    if args.command == "build":
+        cmdBuild(args)
+    elif args.command == "info":
+        cmdInfo(args)
+    elif args.command == "dump":
+        cmdDump(args)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,606 @@
+# HTTP load and compression benchmark of SqCoreWeb. The endpoints are in a scenario file (default: src/WebServer/SqCoreWeb/HttpBenchScenarios.json):
+# static files through CompressedStaticFileMiddleware with different Accept-Encodings, the controllers (UserAccount, JsLog), and the SignalR hubs (/hub/...).
+# Open loop: the requests arrive at a fixed rate (Poisson or uniform arrivals), whether the earlier ones are answered or not, as real browsers do. The latency is measured
+# from the scheduled arrival time, so a stalled server shows up as high latency, not as a lower request rate (no 'coordinated omission').
+# The requests go through a keep-alive connection pool (as a browser: a few persistent HTTP/1.1 connections per host), or --noKeepAlive: a new connection per request.
+# A redirect (3xx) is not followed, it is counted as an error (and reported separately): a benchmark of empty redirects means a wrong --url.
+# Per scenario and rate: achieved rate, errors, latency percentiles (SqLogLatency histograms), bytes on the wire per request, the served Content-Encodings and the compression ratio (decoded / wire body).
+# A signalr scenario opens a new hub connection per arrival (negotiate, WebSocket upgrade, protocol handshake: that is its latency), and holds it for 'holdSec', counting the pushed messages.
+# The arrival schedule has a fixed seed, and the results are appended to SqCore/logs/SqHttpBench.jsonl (SqTiming format) with the build (git commit) label, so builds can be compared: --compare.
+# Usage:
+#   'python SqHttpBench.py --rates 50,200,1000'   against a running server on https://localhost:5001 (the published SqCoreWeb redirects http://localhost:5000 to it: UseHttpsRedirection())
+#   'python SqHttpBench.py --url http://localhost:4201'   against the 'ng serve' dev server, that proxies /hub/ and /UserAccount/ (see angular.watch.proxy.conf.js)
+#   'python SqHttpBench.py --start --scenarios indexHtml-br,indexHtml-identity'   starts the published SqCoreWeb (bin/Release/netcoreapp3.1/publish) locally for the run
+#   'python SqHttpBench.py --compare'   the last two builds in the history side by side ('--compare 1a2b3c4,5d6e7f8' for given builds)
+
+import os
+import sys
+import ssl
+import json
+import time
+import zlib
+import base64
+import signal
+import socket
+import struct
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+import urllib.request
+import urllib.error
+import urllib.parse
+import SqTiming
+import SqLogLatency
+
+try:
+    import brotli   # pip install brotli. Without it, the 'br' responses are not decoded: their compression ratio is not reported.
+except ImportError:
+    brotli = None
+
+sqCoreWebDir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/../../WebServer/SqCoreWeb")
+defaultScenarioFileName = sqCoreWebDir + "/HttpBenchScenarios.json"
+defaultPublishDir = sqCoreWebDir + "/bin/Release/netcoreapp3.1/publish"
+pingPath = "/WebServer/Ping"
+signalRRecordSeparator = b"\x1e"
+signalRPingSec = 15.0   # = the default KeepAliveInterval of the SignalR server: the server drops a client that is silent for 30 sec
+maxInFlight = 10000     # an arrival beyond this many unfinished requests is dropped (counted as an error), so an overloaded server does not make the client run out of memory
+
+class HttpResponse:
+    def __init__(self, status, headers, body, headerBytes, bodyWireBytes, isReusable):
+        self.status = status
+        self.headers = headers      # lower case names
+        self.body = body            # as received: still Content-Encoded
+        self.headerBytes = headerBytes
+        self.bodyWireBytes = bodyWireBytes  # with the chunked framing
+        self.isReusable = isReusable
+
+class HttpConnection:
+    def __init__(self, reader, writer, hostHeader):
+        self.reader = reader
+        self.writer = writer
+        self.hostHeader = hostHeader
+
+    @staticmethod
+    async def open(target):
+        (reader, writer) = await asyncio.open_connection(target["host"], target["port"], ssl = target["sslContext"], server_hostname = target["host"] if target["sslContext"] else None)
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return HttpConnection(reader, writer, target["hostHeader"])
+
+    def close(self):    # not async: also called from a cancelled (timed out) request
+        self.writer.close()
+
+    def sendHead(self, method, path, headers, body):
+        head = "%s %s HTTP/1.1\r\nHost: %s\r\n" % (method, path, self.hostHeader)
+        for name, value in headers.items():
+            head += "%s: %s\r\n" % (name, value)
+        if body is not None:
+            head += "Content-Length: %d\r\n" % len(body)
+        self.writer.write((head + "\r\n").encode("latin-1") + (body or b""))
+
+    async def readHead(self):
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        (version, status) = lines[0].split(" ", 2)[:2]
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                (name, value) = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        return (int(status), headers, len(head), version)
+
+    async def request(self, method, path, headers, body, isKeepAlive):
+        if not isKeepAlive:
+            headers = dict(headers, Connection = "close")
+        if method == "POST" and body is None:
+            body = b""
+        self.sendHead(method, path, headers, body)
+        await self.writer.drain()
+        (status, responseHeaders, headerBytes, version) = await self.readHead()
+        bodyWireBytes = 0
+        isEof = False
+        if method == "HEAD" or status < 200 or status in (204, 304):
+            body = b""
+        elif responseHeaders.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                line = await self.reader.readuntil(b"\r\n")
+                size = int(line.split(b";")[0], 16)
+                bodyWireBytes += len(line) + size + 2
+                if size == 0:
+                    while True:     # trailers, up to the empty line
+                        line = await self.reader.readuntil(b"\r\n")
+                        if line == b"\r\n":
+                            break
+                        bodyWireBytes += len(line)
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in responseHeaders:
+            body = await self.reader.readexactly(int(responseHeaders["content-length"]))
+            bodyWireBytes = len(body)
+        else:
+            body = await self.reader.read()
+            bodyWireBytes = len(body)
+            isEof = True
+        connectionHeader = responseHeaders.get("connection", "").lower()
+        if version == "HTTP/1.0":   # HTTP/1.0 closes the connection after the response, unless the server explicitly keeps it alive
+            isReusable = isKeepAlive and not isEof and connectionHeader == "keep-alive"
+        else:
+            isReusable = isKeepAlive and not isEof and connectionHeader != "close"
+        return HttpResponse(status, responseHeaders, body, headerBytes, bodyWireBytes, isReusable)
+
+# At most 'maxConnections' requests are in flight. Keep-alive: the idle connections are reused, otherwise every request opens (and closes) its own connection.
+class HttpPool:
+    def __init__(self, target, maxConnections, isKeepAlive):
+        self.target = target
+        self.isKeepAlive = isKeepAlive
+        self.semaphore = asyncio.Semaphore(maxConnections)
+        self.idle = []
+        self.nNewConnections = 0
+
+    async def request(self, method, path, headers, body):
+        async with self.semaphore:
+            for attempt in range(2):
+                conn = self.idle.pop() if attempt == 0 and len(self.idle) > 0 else None   # the retry always gets a new connection: the other idle ones may be just as stale
+                isReused = conn is not None
+                if conn is None:
+                    conn = await HttpConnection.open(self.target)
+                    self.nNewConnections += 1
+                try:
+                    response = await conn.request(method, path, headers, body, self.isKeepAlive)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    conn.close()
+                    if isReused and attempt == 0:   # the server closed the idle keep-alive connection (KeepAliveTimeout): retry on a new one, as browsers do
+                        continue
+                    raise
+                except BaseException:
+                    conn.close()
+                    raise
+                if response.isReusable:
+                    self.idle.append(conn)
+                else:
+                    conn.close()
+                return response
+
+    def close(self):
+        for conn in self.idle:
+            conn.close()
+        self.idle = []
+
+def encodeWsFrame(opcode, payload):    # a client frame is always masked
+    mask = os.urandom(4)
+    n = len(payload)
+    if n < 126:
+        header = struct.pack(">BB", 0x80 | opcode, 0x80 | n)
+    elif n < 65536:
+        header = struct.pack(">BBH", 0x80 | opcode, 0x80 | 126, n)
+    else:
+        header = struct.pack(">BBQ", 0x80 | opcode, 0x80 | 127, n)
+    return header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+class WsConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.nReceivedBytes = 0
+
+    def send(self, opcode, payload):
+        self.conn.writer.write(encodeWsFrame(opcode, payload))
+
+    # the next data message (the fragments joined). Ping is answered, close returns None.
+    async def readMessage(self):
+        fragments = []
+        while True:
+            (b0, b1) = await self.conn.reader.readexactly(2)
+            n = b1 & 0x7f
+            headerBytes = 2
+            if n == 126:
+                n = struct.unpack(">H", await self.conn.reader.readexactly(2))[0]
+                headerBytes += 2
+            elif n == 127:
+                n = struct.unpack(">Q", await self.conn.reader.readexactly(8))[0]
+                headerBytes += 8
+            mask = await self.conn.reader.readexactly(4) if b1 & 0x80 else None
+            payload = await self.conn.reader.readexactly(n)
+            self.nReceivedBytes += headerBytes + (4 if mask else 0) + n
+            if mask:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            opcode = b0 & 0x0f
+            if opcode == 8:     # close
+                return None
+            if opcode == 9:     # ping
+                self.send(10, payload)
+                continue
+            if opcode == 10:    # pong
+                continue
+            fragments.append(payload)
+            if b0 & 0x80:       # FIN
+                return b"".join(fragments)
+
+    def close(self):
+        try:
+            self.send(8, struct.pack(">H", 1000))
+        except Exception:
+            pass
+        self.conn.close()
+
+# SignalR JSON protocol over WebSocket: negotiate, upgrade with the connection token, handshake. Returns the connection after the handshake response.
+async def openSignalR(pool, path):
+    response = await pool.request("POST", path + "/negotiate?negotiateVersion=1", {"Content-Type": "text/plain;charset=UTF-8"}, b"")
+    if response.status != 200:
+        raise Exception("SignalR negotiate: HTTP %d" % response.status)
+    negotiation = json.loads(decodeBody(response.body, response.headers.get("content-encoding", "")))
+    if "error" in negotiation:
+        raise Exception("SignalR negotiate: " + negotiation["error"])
+    token = negotiation.get("connectionToken") or negotiation["connectionId"]
+    conn = await HttpConnection.open(pool.target)
+    try:
+        conn.sendHead("GET", path + "?id=" + urllib.parse.quote(token), {"Upgrade": "websocket", "Connection": "Upgrade", "Sec-WebSocket-Key": base64.b64encode(os.urandom(16)).decode(),
+            "Sec-WebSocket-Version": "13"}, None)
+        (status, headers, headerBytes, version) = await conn.readHead()
+        if status != 101:
+            raise Exception("SignalR WebSocket upgrade: HTTP %d" % status)
+        ws = WsConnection(conn)
+        ws.send(1, b'{"protocol":"json","version":1}' + signalRRecordSeparator)
+        handshake = await ws.readMessage()
+        if handshake is None or json.loads(handshake.split(signalRRecordSeparator)[0]).get("error"):
+            raise Exception("SignalR handshake failed: %r" % handshake)
+        return ws
+    except BaseException:
+        conn.close()
+        raise
+
+def decodeBody(body, encoding):    # None if it cannot be decoded here
+    if encoding in ("", "identity"):
+        return body
+    if encoding == "gzip":
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return zlib.decompress(body)
+    if encoding == "br" and brotli is not None:
+        return brotli.decompress(body)
+    return None
+
+class BenchCase:
+    def __init__(self, scenario, rate):
+        self.scenario = scenario
+        self.rate = rate
+        self.stats = SqLogLatency.LatencyStats()
+        self.sec = 0.0
+        self.nDropped = 0
+        self.nOk = 0
+        self.n3xx = 0           # redirects: counted as errors too
+        self.headerBytes = 0
+        self.bodyWireBytes = 0
+        self.decodedBytes = 0       # of the bodies that could be decoded...
+        self.decodedWireBytes = 0   # ...and their wire size
+        self.encodings = {}         # served Content-Encoding -> count
+        self.nNewConnections = 0
+        self.nMessages = 0          # signalr: pushed messages...
+        self.messageBytes = 0       # ...and WebSocket bytes received
+        self.holdSec = 0.0          # signalr: sum of the connection hold times
+        self.decodedSizes = {}      # (encoding, wire size) -> decoded size: a static file is decoded once, not at every response
+
+    def getName(self):
+        return "%s/r%g" % (self.scenario["name"], self.rate)
+
+    def addResponse(self, response):
+        encoding = response.headers.get("content-encoding", "").lower()
+        self.encodings[encoding or "identity"] = self.encodings.get(encoding or "identity", 0) + 1
+        self.headerBytes += response.headerBytes
+        self.bodyWireBytes += response.bodyWireBytes
+        key = (encoding, len(response.body))
+        if key not in self.decodedSizes:
+            try:
+                decoded = decodeBody(response.body, encoding)
+                self.decodedSizes[key] = len(decoded) if decoded is not None else None
+            except Exception:
+                self.decodedSizes[key] = None
+        if self.decodedSizes[key] is not None:
+            self.decodedBytes += self.decodedSizes[key]
+            self.decodedWireBytes += len(response.body)
+
+    def getCompressionRatio(self):
+        return self.decodedBytes / self.decodedWireBytes if self.decodedWireBytes > 0 else None
+
+# Arrivals from a fixed seed, so every build gets the same schedule. Every arrival is a new task: a slow response does not delay the next arrival.
+async def runOpenLoop(case, sendOne, durationSec, warmupSec, arrival, timeoutSec):
+    rng = random.Random(1)
+    startTime = time.perf_counter()
+    measureStart = startTime + warmupSec
+    deadline = measureStart + durationSec
+    tasks = set()
+    async def runOne(intendedTime, isMeasured):
+        status = 0
+        isError = False
+        try:
+            status = await asyncio.wait_for(sendOne(isMeasured), timeoutSec)
+        except Exception:
+            isError = True
+        if isMeasured:
+            isRedirect = 300 <= status < 400
+            case.stats.add((time.perf_counter() - intendedTime) * 1000.0, status, isError or isRedirect)
+            if isRedirect:
+                case.n3xx += 1
+            elif not isError and status < 400:
+                case.nOk += 1
+    nextTime = startTime
+    while nextTime < deadline:
+        await asyncio.sleep(max(nextTime - time.perf_counter(), 0.0))
+        if len(tasks) >= maxInFlight:
+            if nextTime >= measureStart:
+                case.nDropped += 1
+        else:
+            task = asyncio.ensure_future(runOne(nextTime, nextTime >= measureStart))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        nextTime += rng.expovariate(case.rate) if arrival == "poisson" else 1.0 / case.rate
+    if len(tasks) > 0:
+        await asyncio.wait(list(tasks))
+    case.sec = durationSec
+
+async def runHttpCase(case, target, args):
+    scenario = case.scenario
+    pool = HttpPool(target, args.maxConnections, not args.noKeepAlive)
+    body = scenario.get("body")
+    if body is not None and not isinstance(body, str):
+        body = json.dumps(body)
+    body = body.encode("utf-8") if body is not None else None
+    headers = dict({"Accept-Encoding": "br, gzip"}, **scenario.get("headers", {}))
+    async def sendOne(isMeasured):
+        response = await pool.request(scenario.get("method", "GET"), scenario["path"], headers, body)
+        if isMeasured:
+            case.addResponse(response)
+        return response.status
+    try:
+        await runOpenLoop(case, sendOne, args.duration, args.warmup, args.arrival, args.timeout)
+    finally:
+        pool.close()
+    case.nNewConnections = pool.nNewConnections
+
+async def runSignalRCase(case, target, args):
+    scenario = case.scenario
+    holdSec = float(scenario.get("holdSec", 10))
+    pool = HttpPool(target, args.maxConnections, not args.noKeepAlive)
+    holdTasks = []
+    async def hold(ws, isMeasured):
+        holdStart = time.perf_counter()
+        holdEnd = holdStart + holdSec
+        nextPing = holdStart + signalRPingSec
+        try:
+            while True:
+                now = time.perf_counter()
+                if now >= holdEnd:
+                    break
+                if now >= nextPing:
+                    ws.send(1, b'{"type":6}' + signalRRecordSeparator)
+                    nextPing += signalRPingSec
+                try:
+                    message = await asyncio.wait_for(ws.readMessage(), min(holdEnd, nextPing) - now)
+                except asyncio.TimeoutError:
+                    continue
+                if message is None:
+                    break
+                if isMeasured:
+                    case.nMessages += sum(1 for r in message.split(signalRRecordSeparator) if len(r) > 0 and r != b'{"type":6}')   # the keep-alive pings are not pushes
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if isMeasured:
+                case.messageBytes += ws.nReceivedBytes
+                case.holdSec += time.perf_counter() - holdStart
+            ws.close()
+    async def sendOne(isMeasured):
+        ws = await openSignalR(pool, scenario["path"])
+        holdTasks.append(asyncio.ensure_future(hold(ws, isMeasured)))
+        return 101
+    try:
+        await runOpenLoop(case, sendOne, args.duration, args.warmup, args.arrival, args.timeout)
+        if len(holdTasks) > 0:
+            await asyncio.wait(holdTasks)
+    finally:
+        pool.close()
+    case.nNewConnections = pool.nNewConnections + len(holdTasks)
+
+def parseTarget(url):
+    parts = urllib.parse.urlsplit(url)
+    isHttps = parts.scheme == "https"
+    sslContext = None
+    if isHttps:
+        sslContext = ssl.create_default_context()
+        if parts.hostname in ("localhost", "127.0.0.1", "::1"):    # the ASP.NET dev certificate (or the sqcore.net certificate) is not valid for localhost
+            sslContext.check_hostname = False
+            sslContext.verify_mode = ssl.CERT_NONE
+    port = parts.port or (443 if isHttps else 80)
+    return {"host": parts.hostname, "port": port, "sslContext": sslContext, "hostHeader": parts.netloc, "url": url.rstrip("/")}
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None     # the 3xx response is raised as HTTPError
+
+# The status of the ping path, without following a redirect: (status, Location header), or (None, None) if nothing answers.
+def getPingStatus(target):
+    handlers = [NoRedirectHandler()] + ([urllib.request.HTTPSHandler(context = target["sslContext"])] if target["sslContext"] is not None else [])
+    try:
+        with urllib.request.build_opener(*handlers).open(target["url"] + pingPath, timeout = 5) as response:
+            return (response.status, None)
+    except urllib.error.HTTPError as e:
+        return (e.code, e.headers.get("Location"))
+    except Exception:
+        return (None, None)
+
+def isServerUp(target):
+    return getPingStatus(target)[0] == 200
+
+# the server answers, but not on this URL (the published SqCoreWeb redirects HTTP to HTTPS): exits with the right --url
+def exitIfRedirected(target):
+    (status, location) = getPingStatus(target)
+    if status is not None and 300 <= status < 400:
+        locationParts = urllib.parse.urlsplit(location or "")
+        sys.exit("SqHttpBench: %s%s redirects (HTTP %d) to %s. Benchmark that server: --url %s://%s" % (target["url"], pingPath, status, location, locationParts.scheme, locationParts.netloc))
+
+# The published SqCoreWeb in its own process group, with its output into the logs folder. It listens on localhost:5000 (HTTP) and localhost:5001 (HTTPS).
+def startServer(publishDir, target, timeoutSec):
+    if not os.path.isfile(publishDir + "/SqCoreWeb.dll"):
+        sys.exit("SqHttpBench: %s/SqCoreWeb.dll is not found. Run BuildAllProd.py first (or give --serverDir)." % publishDir)
+    if isServerUp(target):
+        sys.exit("SqHttpBench: a server already answers on %s. Stop it, or run without --start." % target["url"])
+    logFileName = os.path.dirname(SqTiming.historyFileName) + "/SqHttpBench.server.log"
+    os.makedirs(os.path.dirname(logFileName), exist_ok = True)
+    logFile = open(logFileName, "w")
+    kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if platform.system() == "Windows" else {"start_new_session": True}
+    process = subprocess.Popen(["dotnet", "SqCoreWeb.dll"], cwd = publishDir, stdout = logFile, stderr = subprocess.STDOUT, **kwargs)
+    startTime = time.time()
+    while not isServerUp(target):
+        exitIfRedirected(target)
+        if process.poll() is not None:
+            sys.exit("SqHttpBench: SqCoreWeb exited with code %d at startup. See %s" % (process.returncode, logFileName))
+        if time.time() - startTime > timeoutSec:
+            stopServer(process)
+            sys.exit("SqHttpBench: SqCoreWeb did not answer %s in %.0f sec. See %s" % (pingPath, timeoutSec, logFileName))
+        time.sleep(0.5)
+    print("SqHttpBench: SqCoreWeb started in %.1f sec (output: %s)" % (time.time() - startTime, logFileName))
+    return process
+
+def stopServer(process):
+    if process.poll() is not None:
+        return
+    if platform.system() == "Windows":
+        subprocess.run("taskkill /F /T /PID " + str(process.pid), stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+        return
+    os.killpg(process.pid, signal.SIGTERM)     # Kestrel shuts down gracefully on SIGTERM
+    try:
+        process.wait(15)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+def getBuildLabel():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = sqCoreWebDir, stdout = subprocess.PIPE, stderr = subprocess.DEVNULL, check = True).stdout.decode().strip()
+        isDirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd = sqCoreWebDir, stdout = subprocess.PIPE, stderr = subprocess.DEVNULL).stdout.strip() != b""
+        return commit + ("-dirty" if isDirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def formatEncodings(case):
+    return ",".join("%s:%d%%" % (e, round(100.0 * n / sum(case.encodings.values()))) for e, n in sorted(case.encodings.items(), key = lambda r: -r[1]))
+
+def printResults(cases):
+    print("")
+    print("%-30s %8s %8s %6s %9s %9s %9s %9s %9s %9s %6s %6s  %s" % ("scenario", "offer/s", "ok/s", "err%", "p50 ms", "p90 ms", "p99 ms", "p99.9 ms", "max ms", "wireB/req", "ratio", "conns", "encodings / pushes"))
+    for case in cases:
+        s = case.stats
+        if s.count == 0:
+            print("%-30s  no completed request" % case.getName())
+            continue
+        nRequests = s.count
+        ratio = case.getCompressionRatio()
+        if case.scenario.get("type") == "signalr":
+            details = "%.1f msg/s, %.1f KB/s per connection" % (case.nMessages / case.holdSec, case.messageBytes / 1024.0 / case.holdSec) if case.holdSec > 0 else ""
+        else:
+            details = formatEncodings(case) + ("  %d redirects (3xx)!" % case.n3xx if case.n3xx > 0 else "")
+        print("%-30s %8g %8.1f %5.1f%% %9.3f %9.3f %9.3f %9.3f %9.3f %9.0f %6s %6d  %s%s" % (case.getName(), case.rate, case.nOk / case.sec, 100.0 * (s.nErrors + case.nDropped) / (nRequests + case.nDropped),
+            s.percentile(50), s.percentile(90), s.percentile(99), s.percentile(99.9), s.maxMs, (case.headerBytes + case.bodyWireBytes) / nRequests,
+            "%.2f" % ratio if ratio is not None else "-", case.nNewConnections, details, "  <- saturated" if case.nOk / case.sec < 0.95 * case.rate else ""))
+
+def recordResults(cases, buildLabel, url, args):
+    for case in cases:
+        s = case.stats
+        if s.count == 0:
+            continue
+        histogram = {"%.3f" % SqLogLatency.getBucketValue(b): n for b, n in sorted(s.histogram.items())}
+        ratio = case.getCompressionRatio()
+        SqTiming.record("HttpBench", case.scenario["name"], case.sec, case.getName(), build = buildLabel, url = url, path = case.scenario["path"], rate = case.rate, arrival = args.arrival,
+            isKeepAlive = not args.noKeepAlive, maxConnections = args.maxConnections, nRequests = s.count, nErrors = s.nErrors, n3xx = case.n3xx, n4xx = s.n4xx, nDropped = case.nDropped,
+            okPerSec = round(case.nOk / case.sec, 1), meanMs = round(s.sumMs / s.count, 4), p50Ms = round(s.percentile(50), 4), p90Ms = round(s.percentile(90), 4), p99Ms = round(s.percentile(99), 4),
+            p999Ms = round(s.percentile(99.9), 4), maxMs = round(s.maxMs, 4), headerBytesPerReq = round(case.headerBytes / s.count, 1), bodyWireBytesPerReq = round(case.bodyWireBytes / s.count, 1),
+            compressionRatio = round(ratio, 3) if ratio is not None else None, encodings = case.encodings, nNewConnections = case.nNewConnections,
+            nMessages = case.nMessages, messageBytes = case.messageBytes, histogramMs = histogram)
+
+# The last record of every case of two builds (by default the last two builds in the history), side by side. A regression: p99 +20% (and +1 ms), or +5% bytes on the wire.
+def compareBuilds(fileName, builds):
+    records = [r for r in SqTiming.readHistory(fileName) if r.get("script") == "HttpBench"]
+    if builds is None:
+        builds = []
+        for rec in reversed(records):
+            if rec["build"] not in builds:
+                builds.insert(0, rec["build"])
+            if len(builds) == 2:
+                break
+    if len(builds) != 2:
+        sys.exit("SqHttpBench: two builds are needed for --compare, found in %s: %s" % (fileName, ", ".join(builds) or "none"))
+    lastRecords = [{}, {}]
+    for rec in records:
+        if rec["build"] in builds:
+            lastRecords[builds.index(rec["build"])][rec["target"]] = rec
+    print("SqHttpBench: %s -> %s" % (builds[0], builds[1]))
+    print("%-30s %19s %19s %19s %17s %11s" % ("scenario", "p50 ms", "p99 ms", "ok/s", "wireB/req", "ratio"))
+    for target in sorted(set(lastRecords[0].keys()) & set(lastRecords[1].keys())):
+        (old, new) = (lastRecords[0][target], lastRecords[1][target])
+        oldWire = old["headerBytesPerReq"] + old["bodyWireBytesPerReq"]
+        newWire = new["headerBytesPerReq"] + new["bodyWireBytesPerReq"]
+        isRegression = (new["p99Ms"] > old["p99Ms"] * 1.2 and new["p99Ms"] - old["p99Ms"] > 1.0) or newWire > oldWire * 1.05
+        print("%-30s %9.3f %9.3f %9.3f %9.3f %9.1f %9.1f %8.0f %8.0f %5s %5s%s" % (target, old["p50Ms"], new["p50Ms"], old["p99Ms"], new["p99Ms"], old["okPerSec"], new["okPerSec"], oldWire, newWire,
+            "%.2f" % old["compressionRatio"] if old["compressionRatio"] else "-", "%.2f" % new["compressionRatio"] if new["compressionRatio"] else "-", "  <- regression" if isRegression else ""))
+
+async def runAll(cases, target, args):
+    for case in cases:
+        print("SqHttpBench: running %s for %.0fs..." % (case.getName(), args.warmup + args.duration), flush = True)
+        if case.scenario.get("type", "http") == "signalr":
+            await runSignalRCase(case, target, args)
+        else:
+            await runHttpCase(case, target, args)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Open-loop HTTP load and compression benchmark of SqCoreWeb.")
+    parser.add_argument("--url", default = "https://localhost:5001", help = "base URL of the server (localhost: the certificate is not verified)")
+    parser.add_argument("--scenarioFile", default = defaultScenarioFileName)
+    parser.add_argument("--scenarios", help = "comma separated scenario names (default: all in the scenario file)")
+    parser.add_argument("--rates", default = "20,100,500", help = "comma separated arrival rates (requests or connections per sec), every scenario is run at every rate")
+    parser.add_argument("--arrival", choices = ["poisson", "uniform"], default = "poisson")
+    parser.add_argument("--duration", type = float, default = 10.0, help = "measured seconds per case")
+    parser.add_argument("--warmup", type = float, default = 2.0, help = "not measured seconds before every case")
+    parser.add_argument("--maxConnections", type = int, default = 32, help = "size of the keep-alive connection pool (max requests in flight on the wire)")
+    parser.add_argument("--noKeepAlive", action = "store_true", help = "a new connection per request ('Connection: close')")
+    parser.add_argument("--timeout", type = float, default = 10.0, help = "seconds, a slower request is an error")
+    parser.add_argument("--start", action = "store_true", help = "start the published SqCoreWeb locally for the run (the --url should be its https://localhost:5001, http://localhost:5000 only redirects there)")
+    parser.add_argument("--serverDir", default = defaultPublishDir, help = "the published SqCoreWeb folder for --start")
+    parser.add_argument("--build", help = "label of the tested build in the results (default: the git commit, '-dirty' if there are local changes)")
+    parser.add_argument("--history", default = os.path.dirname(SqTiming.historyFileName) + "/SqHttpBench.jsonl", help = "JSONL file of the results")
+    parser.add_argument("--compare", nargs = "?", const = "", help = "only compare the results of two builds: 'build1,build2' (default: the last two)")
+    args = parser.parse_args()
+
+    SqTiming.historyFileName = args.history
+    if args.compare is not None:
+        compareBuilds(args.history, args.compare.split(",") if args.compare else None)
+        return
+    with open(args.scenarioFile, "r", encoding = "utf-8") as file:
+        scenarios = json.load(file)["scenarios"]
+    if args.scenarios:
+        names = [s.strip() for s in args.scenarios.split(",")]
+        unknownNames = [n for n in names if n not in [s["name"] for s in scenarios]]
+        if len(unknownNames) > 0:
+            sys.exit("Unknown scenario(s): " + ", ".join(unknownNames) + ". In " + args.scenarioFile + ": " + ", ".join(s["name"] for s in scenarios))
+        scenarios = [s for s in scenarios if s["name"] in names]
+    if brotli is None and any("br" in s.get("headers", {}).get("Accept-Encoding", "br") for s in scenarios):
+        print("SqHttpBench: the brotli package is not installed ('pip install brotli'): the compression ratio of the 'br' responses is not reported.")
+    target = parseTarget(args.url)
+    cases = [BenchCase(s, float(r)) for s in scenarios for r in args.rates.split(",") if r.strip() != ""]
+
+    serverProcess = startServer(args.serverDir, target, 180.0) if args.start else None
+    try:
+        if not isServerUp(target):
+            exitIfRedirected(target)
+            sys.exit("SqHttpBench: the server does not answer on %s%s" % (target["url"], pingPath))
+        asyncio.run(runAll(cases, target, args))
+    finally:
+        if serverProcess is not None:
+            stopServer(serverProcess)
+    printResults(cases)
+    recordResults(cases, args.build or getBuildLabel(), args.url, args)
+    print("Results are appended to " + SqTiming.historyFileName)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# Parsing helpers for the NLog .sqlog files of the SqCore apps (e.g. SqCore/logs/SqCoreWeb.2020-03-15.sqlog, one file per day).
+# NLog.config layout: '${NoYearDate}${time}#${threadid}|${level:uppercase=true}|${logger}: ${message} ${exception}', e.g.
+# '03-15T14:22:01.1234#12|INFO|SqFirewallMiddlewarePreAuthLogger: PreAuth.Postprocess: Returning ...'
+# The line has no year: it comes from the file name. Lines not starting with a timestamp are the continuation lines of a multi-line message (exception stack traces).
+
+import os
+import re
+import glob
+import datetime
+
+defaultLogsDir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/../../../logs")     # the SqCore/logs folder (not in GitHub)
+fileDateRegex = re.compile(r"\.(\d{4}-\d{2}-\d{2})\.sqlog(\.sqz)?$")    # '.sqz': compressed archive of a closed day (SqLogArchive.py)
+lineRegex = re.compile(r"^(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d+))?#(\d+)\|([A-Z]+)\|([^:]*): ")
+levels = ["TRACE", "DEBUG", "INFO", "WARN", "ERROR", "FATAL"]
+
+# the day of the file from its name, or None if the name has no date
+def getFileDate(fileName):
+    match = fileDateRegex.search(fileName)
+    return datetime.datetime.strptime(match.group(1), "%Y-%m-%d").date() if match else None
+
+# Returns (time, threadId, level, logger, message) of a line, or None for a continuation line. 'fileDate' gives the year.
+def parseLine(fileDate, line):
+    match = lineRegex.match(line)
+    if match is None:
+        return None
+    (month, day, hour, minute, second, fraction, threadId, level, logger) = match.groups()
+    year = fileDate.year if fileDate is not None else datetime.date.today().year     # the date of the file name and the line are from the same NLog event time
+    time = datetime.datetime(year, int(month), int(day), int(hour), int(minute), int(second), int((fraction or "0").ljust(6, "0")[:6]))
+    return (time, int(threadId), level, logger, line[match.end():].rstrip("\r\n"))
+
+# The .sqlog files (and .sqlog.sqz archives) of 'paths' (files, folders or glob patterns), sorted by day. With 'fromDate'/'toDate', the days outside the window are skipped without opening the files.
+# If a day has both, the plain .sqlog is used (no decompression).
+def findLogFiles(paths, prefix = "", fromDate = None, toDate = None):
+    fileNames = set()
+    for path in paths:
+        if os.path.isdir(path):
+            fileNames.update(glob.glob(os.path.join(path, prefix + "*.sqlog")))
+            fileNames.update(glob.glob(os.path.join(path, prefix + "*.sqlog.sqz")))
+        else:
+            fileNames.update(glob.glob(path))
+    result = []
+    for fileName in fileNames:
+        if fileName.endswith(".sqz") and fileName[:-len(".sqz")] in fileNames:
+            continue
+        fileDate = getFileDate(fileName)
+        if fileDate is not None and ((fromDate is not None and fileDate < fromDate) or (toDate is not None and fileDate > toDate)):
+            continue
+        result.append(fileName)
+    return sorted(result, key = lambda f: (getFileDate(f) or datetime.date.min, f))
+
+# command line time arguments: '2020-03-15', '2020-03-15T14:00', '2020-03-15 14:00:30'
+def parseTimeArg(text):
+    for fmt in ["%Y-%m-%d", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S"]:
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError("Unknown time format: '" + text + "'. Use yyyy-MM-dd[THH:mm[:ss]]")
@@ -0,0 +1,246 @@
+# Compressed, indexed archive of the closed (not today's) .sqlog days, and time range + level + logger queries on them.
+# 'SqCoreWeb.2020-03-15.sqlog' -> 'SqCoreWeb.2020-03-15.sqlog.sqz' (independently compressed blocks of about 'blockSize' raw bytes, never splitting a multi-line record)
+# + 'SqCoreWeb.2020-03-15.sqlog.sqz.json' (index: per block its file offset, sizes, first/last record time, and the record counts per level and per logger).
+# A query decompresses only the blocks overlapping the time range that also contain the wanted level/logger. Not yet archived .sqlog files are queried too (by scanning).
+# Usage:
+#   'python SqLogArchive.py archive'      archives the closed days in SqCore/logs (verified, then the .sqlog is deleted, unless --keepSource)
+#   'python SqLogArchive.py query --from "2020-03-15 14:00" --to "2020-03-15 14:30" --level WARN --logger PreAuth --grep "timeout"'
+#   'python SqLogArchive.py stats'
+
+import os
+import re
+import sys
+import json
+import zlib
+import lzma
+import hashlib
+import argparse
+import datetime
+import SqLog
+
+blockSize = 1024 * 1024     # raw bytes per block. Smaller: finer seeks, worse compression ratio
+codecs = {
+    "zlib": (lambda data: zlib.compress(data, 9), zlib.decompress),    # fast decompression, about 8x on logs
+    "lzma": (lambda data: lzma.compress(data, preset = 6), lzma.decompress),    # about 1.5x smaller than zlib, slower
+}
+indexVersion = 1
+
+def getIndexFileName(archiveFileName):
+    return archiveFileName + ".json"
+
+class BlockBuilder:
+    def __init__(self):
+        self.lines = []
+        self.rawSize = 0
+        self.firstTime = None
+        self.lastTime = None
+        self.nRecords = 0
+        self.levels = {}
+        self.loggers = {}
+
+    def addLine(self, line, parsed):
+        self.lines.append(line)
+        self.rawSize += len(line)
+        if parsed is not None:
+            timeStr = parsed[0].isoformat()
+            if self.firstTime is None or timeStr < self.firstTime:
+                self.firstTime = timeStr
+            if self.lastTime is None or timeStr > self.lastTime:
+                self.lastTime = timeStr
+            self.nRecords += 1
+            self.levels[parsed[2]] = self.levels.get(parsed[2], 0) + 1
+            self.loggers[parsed[3]] = self.loggers.get(parsed[3], 0) + 1
+
+# Writes the archive and its index (to temp names, renamed at the end), and verifies that the blocks decompress to the original. Returns (rawSize, archiveSize)
+def archiveFile(fileName, codec):
+    archiveFileName = fileName + ".sqz"
+    fileDate = SqLog.getFileDate(fileName)
+    compress, decompress = codecs[codec]
+    sourceHasher = hashlib.sha256()
+    blocks = []
+
+    def flushBlock(out, block):
+        compressed = compress(b"".join(block.lines))
+        blocks.append({"offset": out.tell(), "compressedSize": len(compressed), "rawSize": block.rawSize, "firstTime": block.firstTime, "lastTime": block.lastTime,
+            "nRecords": block.nRecords, "levels": block.levels, "loggers": block.loggers})
+        out.write(compressed)
+
+    with open(fileName, "rb") as src, open(archiveFileName + ".tmp", "wb") as out:
+        block = BlockBuilder()
+        for line in src:
+            sourceHasher.update(line)
+            parsed = SqLog.parseLine(fileDate, line.decode("utf-8", "replace"))
+            if parsed is not None and block.rawSize >= blockSize:     # a block ends only before a record start, so a stack trace stays with its record
+                flushBlock(out, block)
+                block = BlockBuilder()
+            block.addLine(line, parsed)
+        if block.rawSize > 0:
+            flushBlock(out, block)
+
+    verifyHasher = hashlib.sha256()
+    with open(archiveFileName + ".tmp", "rb") as archive:
+        for b in blocks:
+            archive.seek(b["offset"])
+            verifyHasher.update(decompress(archive.read(b["compressedSize"])))
+    if verifyHasher.hexdigest() != sourceHasher.hexdigest():
+        os.remove(archiveFileName + ".tmp")
+        raise Exception("Verification of " + archiveFileName + " failed. The source is kept.")
+
+    index = {"version": indexVersion, "codec": codec, "sourceFileName": os.path.basename(fileName), "sourceSha256": sourceHasher.hexdigest(), "blocks": blocks}
+    with open(getIndexFileName(archiveFileName) + ".tmp", "w") as file:
+        json.dump(index, file, indent = 0)
+    os.replace(archiveFileName + ".tmp", archiveFileName)
+    os.replace(getIndexFileName(archiveFileName) + ".tmp", getIndexFileName(archiveFileName))   # the index last: an archive without index is an unfinished one
+    return (sum(b["rawSize"] for b in blocks), os.path.getsize(archiveFileName))
+
+def readIndex(archiveFileName):
+    with open(getIndexFileName(archiveFileName), "r") as file:
+        return json.load(file)
+
+# the blocks that can contain matching records: overlapping the time range, and containing the wanted level and logger
+def selectBlocks(index, fromTime, toTime, minLevel, loggerFilter):
+    fromStr = fromTime.isoformat() if fromTime is not None else None
+    toStr = toTime.isoformat() if toTime is not None else None
+    wantedLevels = set(SqLog.levels[SqLog.levels.index(minLevel):]) if minLevel is not None else None
+    selected = []
+    for b in index["blocks"]:
+        if b["firstTime"] is None:
+            continue    # only continuation lines (a file starting mid-record): no timestamps to query by
+        if (fromStr is not None and b["lastTime"] < fromStr) or (toStr is not None and b["firstTime"] >= toStr):
+            continue
+        if wantedLevels is not None and not any(level in wantedLevels for level in b["levels"]):
+            continue
+        if loggerFilter is not None and not any(loggerFilter in logger for logger in b["loggers"]):
+            continue
+        selected.append(b)
+    return selected
+
+# Yields the raw lines of a .sqlog or (only the 'blocks' of) a .sqlog.sqz file
+def iterLines(fileName, blocks = None):
+    if not fileName.endswith(".sqz"):
+        with open(fileName, "rb") as file:
+            for line in file:
+                yield line
+        return
+    index = readIndex(fileName)
+    decompress = codecs[index["codec"]][1]
+    with open(fileName, "rb") as archive:
+        for b in (blocks if blocks is not None else index["blocks"]):
+            archive.seek(b["offset"])
+            for line in decompress(archive.read(b["compressedSize"])).splitlines(keepends = True):
+                yield line
+
+# Yields the records (parsed first line + all the lines) of the lines. Continuation lines before the first record start are dropped.
+def iterRecords(fileDate, lines):
+    parsed = None
+    recordLines = []
+    for line in lines:
+        text = line.decode("utf-8", "replace")
+        lineParsed = SqLog.parseLine(fileDate, text)
+        if lineParsed is not None:
+            if parsed is not None:
+                yield (parsed, recordLines)
+            parsed = lineParsed
+            recordLines = [text]
+        elif parsed is not None:
+            recordLines.append(text)
+    if parsed is not None:
+        yield (parsed, recordLines)
+
+def cmdArchive(args):
+    today = datetime.date.today()
+    nArchived = 0
+    for fileName in SqLog.findLogFiles(args.paths):
+        fileDate = SqLog.getFileDate(fileName)
+        if fileName.endswith(".sqz") or fileDate is None or fileDate >= today - datetime.timedelta(days = args.keepDays):
+            continue    # today's file is still being written by NLog (keepFileOpen)
+        if os.path.isfile(getIndexFileName(fileName + ".sqz")):
+            continue    # archived earlier, with --keepSource
+        (rawSize, archiveSize) = archiveFile(fileName, args.codec)
+        nArchived += 1
+        print("SqLogArchive: %s: %.2f MB -> %.2f MB (%.1fx)" % (os.path.basename(fileName), rawSize / (1024 * 1024), archiveSize / (1024 * 1024), rawSize / max(archiveSize, 1)))
+        if not args.keepSource:
+            os.remove(fileName)
+    print("SqLogArchive: %d day(s) archived." % nArchived)
+
+def cmdQuery(args):
+    fromTime = SqLog.parseTimeArg(args.fromTime) if args.fromTime else None
+    toTime = SqLog.parseTimeArg(args.toTime) if args.toTime else None
+    minLevel = args.level.upper() if args.level else None
+    if minLevel is not None and minLevel not in SqLog.levels:
+        sys.exit("Unknown level: " + args.level + ". Known: " + ", ".join(SqLog.levels))
+    wantedLevels = set(SqLog.levels[SqLog.levels.index(minLevel):]) if minLevel is not None else None
+    grepRegex = re.compile(args.grep) if args.grep else None
+    nRecords = 0
+    nBlocksRead = 0
+    nBlocksTotal = 0
+    for fileName in SqLog.findLogFiles(args.paths, args.prefix, fromTime.date() if fromTime else None, toTime.date() if toTime else None):
+        blocks = None
+        if fileName.endswith(".sqz"):
+            index = readIndex(fileName)
+            blocks = selectBlocks(index, fromTime, toTime, minLevel, args.logger)
+            nBlocksRead += len(blocks)
+            nBlocksTotal += len(index["blocks"])
+        for parsed, recordLines in iterRecords(SqLog.getFileDate(fileName), iterLines(fileName, blocks)):
+            (time, threadId, level, logger, message) = parsed
+            if (fromTime is not None and time < fromTime) or (toTime is not None and time >= toTime):
+                continue
+            if (wantedLevels is not None and level not in wantedLevels) or (args.logger is not None and args.logger not in logger):
+                continue
+            if grepRegex is not None and not any(grepRegex.search(l) for l in recordLines):
+                continue
+            nRecords += 1
+            if nRecords <= args.limit:
+                sys.stdout.write("".join(recordLines))
+    print("SqLogArchive: %d matching record(s)%s. Decompressed %d of %d archive blocks." % (nRecords, " (first %d printed)" % args.limit if nRecords > args.limit else "", nBlocksRead, nBlocksTotal), file = sys.stderr)
+
+def cmdStats(args):
+    nRaw = 0
+    nArchived = 0
+    for fileName in SqLog.findLogFiles(args.paths):
+        if fileName.endswith(".sqz"):
+            index = readIndex(fileName)
+            rawSize = sum(b["rawSize"] for b in index["blocks"])
+            levels = {}
+            for b in index["blocks"]:
+                for level, n in b["levels"].items():
+                    levels[level] = levels.get(level, 0) + n
+            nRaw += rawSize
+            nArchived += os.path.getsize(fileName)
+            print("%-40s %8.2f MB -> %7.2f MB  %4d blocks  %s" % (os.path.basename(fileName), rawSize / (1024 * 1024), os.path.getsize(fileName) / (1024 * 1024), len(index["blocks"]),
+                " ".join("%s:%d" % (l, levels[l]) for l in SqLog.levels if l in levels)))
+        else:
+            print("%-40s %8.2f MB (not archived)" % (os.path.basename(fileName), os.path.getsize(fileName) / (1024 * 1024)))
+    if nArchived > 0:
+        print("Archived: %.2f MB -> %.2f MB (%.1fx)" % (nRaw / (1024 * 1024), nArchived / (1024 * 1024), nRaw / nArchived))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Compressed, indexed archive of the .sqlog files, and time range queries on it.")
+    subparsers = parser.add_subparsers(dest = "command")
+    archiveParser = subparsers.add_parser("archive", help = "compress and index the closed log days")
+    archiveParser.add_argument("--codec", default = "zlib", choices = list(codecs.keys()))
+    archiveParser.add_argument("--keepDays", type = int, default = 0, help = "also leave the last N closed days as plain text")
+    archiveParser.add_argument("--keepSource", action = "store_true", help = "don't delete the .sqlog after the verified archiving")
+    queryParser = subparsers.add_parser("query", help = "print the records of a time range, level, logger")
+    queryParser.add_argument("--from", dest = "fromTime", help = "e.g. 2020-03-15 or '2020-03-15 14:00' (inclusive)")
+    queryParser.add_argument("--to", dest = "toTime", help = "exclusive end of the time range")
+    queryParser.add_argument("--level", help = "minimum level: " + ", ".join(SqLog.levels))
+    queryParser.add_argument("--logger", help = "substring of the logger name")
+    queryParser.add_argument("--grep", help = "regex on the record lines")
+    queryParser.add_argument("--prefix", default = "", help = "log file name prefix, e.g. 'SqCoreWeb.'")
+    queryParser.add_argument("--limit", type = int, default = 1000, help = "max printed records")
+    subparsers.add_parser("stats", help = "sizes and level counts of the archived days")
+    for p in [archiveParser, queryParser, subparsers.choices["stats"]]:
+        p.add_argument("paths", nargs = "*", default = [SqLog.defaultLogsDir], help = "log files, folders or glob patterns (default: SqCore/logs)")
+    args = parser.parse_args()
+    if args.command == "archive":
+        cmdArchive(args)
+    elif args.command == "query":
+        cmdQuery(args)
+    elif args.command == "stats":
+        cmdStats(args)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# Request latency report from the SqCoreWeb .sqlog files: count, error rates, mean, p50/p95/p99, max per path, host, client IP, user, status, or method, optionally per time window.
+# Source: the one line per request of SqFirewallMiddlewarePreAuthLogger:
+# "PreAuth.Postprocess: Returning 14:22:01.1#[ERROR in ]HTTPS GET 'sqcore.net /index.html' from 1.2.3.4 (u: a@b.com) ret: 200 in 12.34ms"
+# The files (days) are processed in parallel on a process pool. Each file is streamed line by line, and the latencies go into fixed precision log-scale histograms
+# (HDR histogram style, 1% relative error), so the memory doesn't depend on the number of requests, and the histograms of the days are merged exactly.
+# Usage: 'python SqLogLatency.py --from 2020-01-01 --to 2020-03-31 --by path,client --sort p95 --top 20'  (default: all SqCoreWeb.*.sqlog files in SqCore/logs)
+
+import os
+import re
+import sys
+import math
+import argparse
+import datetime
+import concurrent.futures
+import SqLog
+import SqLogArchive
+
+requestRegex = re.compile(r"PreAuth\.Postprocess: Returning \S+#(ERROR in )?(HTTPS?) (\S+) '(\S*) (.*?)' from (\S*) \(u: (.*?)\) ret: (\d*) in ([\d.,]+)ms")
+dimensions = ["path", "host", "client", "user", "status", "method"]
+minMs = 0.01            # the histogram resolution starts here (smaller latencies go into the first bucket)
+relPrecision = 0.01     # bucket width: 1% of the value
+logBase = math.log(1 + relPrecision)
+
+def getBucket(ms):
+    return 0 if ms <= minMs else int(math.log(ms / minMs) / logBase) + 1
+
+def getBucketValue(bucket):    # the middle of the bucket
+    return minMs if bucket == 0 else minMs * math.exp((bucket - 0.5) * logBase)
+
+# aggregated latencies of one group. 'histogram' is sparse: bucket -> count
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.nErrors = 0    # 5xx, or 'ERROR in' (exception in the pipeline)
+        self.n4xx = 0
+        self.sumMs = 0.0
+        self.maxMs = 0.0
+        self.histogram = {}
+
+    def add(self, ms, status, isError):
+        self.count += 1
+        if isError or status >= 500:
+            self.nErrors += 1
+        elif status >= 400:
+            self.n4xx += 1
+        self.sumMs += ms
+        self.maxMs = max(self.maxMs, ms)
+        bucket = getBucket(ms)
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.nErrors += other.nErrors
+        self.n4xx += other.n4xx
+        self.sumMs += other.sumMs
+        self.maxMs = max(self.maxMs, other.maxMs)
+        for bucket, n in other.histogram.items():
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + n
+
+    def percentile(self, p):
+        rank = p / 100.0 * self.count
+        cumulated = 0
+        for bucket in sorted(self.histogram.keys()):
+            cumulated += self.histogram[bucket]
+            if cumulated >= rank:
+                return min(getBucketValue(bucket), self.maxMs)
+        return self.maxMs
+
+def getWindowKey(time, window):
+    if window == "hour":
+        return time.strftime("%Y-%m-%d %H:00")
+    if window == "day":
+        return time.strftime("%Y-%m-%d")
+    if window == "week":
+        return (time - datetime.timedelta(days = time.weekday())).strftime("%Y-%m-%d") + " week"
+    if window == "month":
+        return time.strftime("%Y-%m")
+    return ""
+
+# collapse the paths to their first 'pathDepth' segments ('/webapps/HealthMonitor/main.1234.js' -> '/webapps/HealthMonitor/*' at depth 2), so the many distinct URLs don't explode the groups
+def normalizePath(path, pathDepth):
+    if pathDepth <= 0:
+        return path
+    segments = path.split("/")
+    return path if len(segments) <= pathDepth + 1 else "/".join(segments[:pathDepth + 1]) + "/*"
+
+# Runs in a pool worker: one .sqlog file or .sqlog.sqz archive (one day). Returns (nRequests, {(dimension, windowKey, value): LatencyStats})
+def analyzeFile(fileName, fromTime, toTime, byDims, window, pathDepth):
+    fileDate = SqLog.getFileDate(fileName)
+    groups = {}
+    nRequests = 0
+    blocks = None
+    if fileName.endswith(".sqz"):   # an archived day: only its blocks overlapping the time window are decompressed
+        blocks = SqLogArchive.selectBlocks(SqLogArchive.readIndex(fileName), fromTime, toTime, None, None)
+    for rawLine in SqLogArchive.iterLines(fileName, blocks):
+        if b"PreAuth.Postprocess: Returning" not in rawLine:  # cheap filter before any decode or regex: most lines are not request lines
+            continue
+        line = rawLine.decode("utf-8", "replace")
+        parsed = SqLog.parseLine(fileDate, line)
+        match = requestRegex.search(line)
+        if parsed is None or match is None:
+            continue
+        time = parsed[0]
+        if (fromTime is not None and time < fromTime) or (toTime is not None and time >= toTime):
+            continue
+        (errorFlag, scheme, method, host, path, clientIp, user, status, ms) = match.groups()
+        ms = float(ms.replace(",", "."))    # {0:0.00} is culture dependent
+        status = int(status) if status != "" else 0
+        values = {"path": normalizePath(path, pathDepth), "host": host, "client": clientIp, "user": user or "-", "status": str(status), "method": method}
+        windowKey = getWindowKey(time, window)
+        nRequests += 1
+        for dim in byDims:
+            key = (dim, windowKey, values[dim])
+            stats = groups.get(key)
+            if stats is None:
+                stats = groups[key] = LatencyStats()
+            stats.add(ms, status, errorFlag is not None)
+    return (nRequests, groups)
+
+def printReport(groups, byDims, sortBy, top):
+    sortKeys = {"count": lambda s: s.count, "p50": lambda s: s.percentile(50), "p95": lambda s: s.percentile(95), "p99": lambda s: s.percentile(99),
+        "max": lambda s: s.maxMs, "errors": lambda s: s.nErrors, "total": lambda s: s.sumMs}
+    for dim in byDims:
+        windowKeys = sorted(set(k[1] for k in groups if k[0] == dim))
+        for windowKey in windowKeys:
+            rows = [(k[2], s) for k, s in groups.items() if k[0] == dim and k[1] == windowKey]
+            rows.sort(key = lambda r: sortKeys[sortBy](r[1]), reverse = True)
+            print("")
+            print("--- by %s%s: %d groups, top %d by %s ---" % (dim, (" in " + windowKey) if windowKey != "" else "", len(rows), min(top, len(rows)), sortBy))
+            print("%-60s %9s %7s %6s %9s %9s %9s %9s %10s" % (dim, "count", "err%", "4xx%", "mean ms", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+            for value, s in rows[:top]:
+                print("%-60s %9d %6.2f%% %5.1f%% %9.2f %9.2f %9.2f %9.2f %10.2f" % (value[:60], s.count, 100.0 * s.nErrors / s.count, 100.0 * s.n4xx / s.count,
+                    s.sumMs / s.count, s.percentile(50), s.percentile(95), s.percentile(99), s.maxMs))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Request latency report from SqCoreWeb .sqlog files.")
+    parser.add_argument("paths", nargs = "*", default = [SqLog.defaultLogsDir], help = ".sqlog files, folders or glob patterns (default: SqCore/logs)")
+    parser.add_argument("--from", dest = "fromTime", help = "start of the time window, e.g. 2020-03-01 or 2020-03-01T14:00 (inclusive)")
+    parser.add_argument("--to", dest = "toTime", help = "end of the time window (exclusive)")
+    parser.add_argument("--by", default = "path", help = "comma separated dimensions: " + ", ".join(dimensions))
+    parser.add_argument("--window", default = "none", choices = ["none", "hour", "day", "week", "month"], help = "separate tables per time window")
+    parser.add_argument("--pathDepth", type = int, default = 0, help = "group the paths by their first N segments (0: full path)")
+    parser.add_argument("--sort", default = "count", choices = ["count", "p50", "p95", "p99", "max", "errors", "total"])
+    parser.add_argument("--top", type = int, default = 30, help = "rows per table")
+    parser.add_argument("--workers", type = int, default = None, help = "process pool size (default: number of CPUs)")
+    args = parser.parse_args()
+
+    byDims = [d.strip() for d in args.by.split(",")]
+    unknownDims = [d for d in byDims if d not in dimensions]
+    if len(unknownDims) > 0:
+        sys.exit("Unknown dimension(s): " + ", ".join(unknownDims) + ". Known: " + ", ".join(dimensions))
+    fromTime = SqLog.parseTimeArg(args.fromTime) if args.fromTime else None
+    toTime = SqLog.parseTimeArg(args.toTime) if args.toTime else None
+    fileNames = SqLog.findLogFiles(args.paths, "SqCoreWeb.", fromTime.date() if fromTime else None, toTime.date() if toTime else None)
+    if len(fileNames) == 0:
+        sys.exit("No .sqlog files found in " + ", ".join(args.paths))
+
+    groups = {}
+    nRequests = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers = args.workers) as executor:
+        futures = [executor.submit(analyzeFile, f, fromTime, toTime, byDims, args.window, args.pathDepth) for f in fileNames]
+        for future in concurrent.futures.as_completed(futures):
+            (nFileRequests, fileGroups) = future.result()
+            nRequests += nFileRequests
+            for key, stats in fileGroups.items():
+                if key in groups:
+                    groups[key].merge(stats)
+                else:
+                    groups[key] = stats
+    print("%d requests in %d log files (%s .. %s)." % (nRequests, len(fileNames), os.path.basename(fileNames[0]), os.path.basename(fileNames[-1])))
+    if nRequests > 0:
+        printReport(groups, byDims, args.sort, args.top)
+
+# the guard is needed, because the process pool workers import this script again on Windows
+if __name__ == "__main__":
+    main()
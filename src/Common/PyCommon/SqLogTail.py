@@ -0,0 +1,200 @@
+# Incremental tail of the .sqlog files on the MTrader server, over the SSH connection of SqDeploy.py (same host, user, key), without logging in by hand.
+# The remote files are mirrored into SqCore/logs/remote/. The size of the local copy is the read offset of the remote file: every poll reads only the bytes appended since the last one,
+# by SFTP ranged reads (readv(): pipelined requests on the one persistent SFTP channel). Only complete lines are copied, so a line being written is read in full next time.
+# Daily rollover: a new day's file is read from its start, and the previous day's file is finished up to its end. A remote file smaller than its copy (replaced, truncated) is fetched again.
+# The mirrored files are normal .sqlog days for SqLogLatency.py and SqLogArchive.py ('python SqLogLatency.py ../../../logs/remote').
+# Usage: 'python SqLogTail.py' (one fetch of all the sources), 'python SqLogTail.py SqCoreWeb --follow --print --level WARN' (near real time monitoring)
+
+import os
+import sys
+import time
+import datetime
+import argparse
+import posixpath
+import paramiko
+import colorama
+from colorama import Fore, Style
+import SqLog
+import SqDeploy
+
+followIntervalSec = 5.0     # --follow: poll period
+reconnectMaxSec = 120.0     # after a lost connection, the reconnect delay doubles up to this
+readChunkSize = 4 * 1024 * 1024     # the new bytes of a file are read (and written) in chunks of this size
+
+# NLog.config: fileName="${basedir}/<logsRelDir>/<App>.${date:format=yyyy-MM-dd}.sqlog". The logs folder is relative to the running binary on the server.
+nlogSourceLogsRelDir = "../../../../../../logs"     # NLog.config in the source tree (and the apps built on the server from the deployed sources)
+nlogPublishedLogsRelDir = "../logs"     # the published NLog.config, rewritten by BuildAllProd.py (modifyPublishedNLogConfig()): next to the 'publish' folder (and its release folders)
+
+def getNLogLogsDir(baseDir, logsRelDir):
+    return posixpath.normpath(baseDir + "/" + logsRelDir)
+
+class LogSource:
+    def __init__(self, name, remoteLogsDir):
+        self.name = name
+        self.remoteLogsDir = remoteLogsDir
+        self.prefix = name + "."
+
+def getDeployRemoteDir(targetName):
+    return next(t.rootRemoteDir for t in SqDeploy.deployTargets if t.name == targetName)
+
+logSources = [
+    LogSource("SqCoreWeb", getNLogLogsDir(getDeployRemoteDir("SqCoreWeb"), nlogPublishedLogsRelDir)),    # runs from the published folder
+    LogSource("RedisManager", getNLogLogsDir(getDeployRemoteDir("RedisManager") + "/Tools/RedisManager/bin/Release/netcoreapp3.1", nlogSourceLogsRelDir)),   # built on the server from the deployed sources
+    LogSource("BenchmarkDB", getNLogLogsDir(getDeployRemoteDir("BenchmarkDB") + "/Tools/BenchmarkDB/bin/Release/netcoreapp3.1", nlogSourceLogsRelDir)),
+]
+
+# Keeps the local mirror of the sources' log files up to date. 'onLines(source, fileName, fileDate, lines)' gets the new complete lines (str) of every poll.
+class LogTailer:
+    def __init__(self, sources, mirrorDir, nDays, onLines = None):
+        self.sources = sources
+        self.mirrorDir = mirrorDir
+        self.nDays = nDays
+        self.onLines = onLines
+        self.transport = None
+        self.sftp = None
+        self.missingSourceNames = set()    # sources whose logs folder is missing on the server
+
+    def connect(self):
+        self.transport = SqDeploy.connectTransport()
+        self.transport.set_keepalive(30)    # the idle periods of --follow don't get the connection dropped by NAT/firewalls
+        self.sftp = paramiko.SFTPClient.from_transport(self.transport)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+        self.transport = None
+        self.sftp = None
+
+    # The files to read in this poll: the last 'nDays' days of the source, plus the older ones whose copy is not complete yet (yesterday's last lines after the rollover).
+    # A missing logs folder is an error (wrong path, the app never ran there): raises FileNotFoundError.
+    def getFilesToRead(self, source):
+        attrs = self.sftp.listdir_attr(source.remoteLogsDir)
+        files = [(a.filename, a.st_size, SqLog.getFileDate(a.filename)) for a in attrs if a.filename.startswith(source.prefix) and a.filename.endswith(".sqlog")]
+        files = [f for f in files if f[2] is not None]
+        if len(files) == 0:
+            return []
+        firstDate = max(f[2] for f in files) - datetime.timedelta(days = self.nDays - 1)     # relative to the newest remote day, not to the local clock (time zones)
+        result = []
+        for fileName, remoteSize, fileDate in sorted(files, key = lambda f: f[2]):
+            localFileName = self.mirrorDir + "/" + fileName
+            if os.path.isfile(localFileName + ".sqz"):
+                continue    # the copy is complete and archived already
+            isMirrored = os.path.isfile(localFileName)
+            if fileDate >= firstDate or (isMirrored and os.path.getsize(localFileName) != remoteSize):
+                result.append((fileName, remoteSize, fileDate))
+        return result
+
+    # Appends the new complete lines of one remote file to its copy. Returns the number of bytes read.
+    def readNewBytes(self, source, fileName, remoteSize, fileDate):
+        localFileName = self.mirrorDir + "/" + fileName
+        offset = os.path.getsize(localFileName) if os.path.isfile(localFileName) else 0
+        if remoteSize < offset:
+            print(Fore.YELLOW + "SqLogTail: %s got smaller on the server (%d < %d bytes). Fetching it again." % (fileName, remoteSize, offset) + Style.RESET_ALL)
+            offset = 0
+            os.remove(localFileName)
+        if remoteSize == offset:
+            return 0
+        nRead = 0
+        with self.sftp.open(source.remoteLogsDir + "/" + fileName, "rb") as remoteFile, open(localFileName, "ab") as localFile:
+            carry = b""     # the end of the previous chunk after its last newline
+            while offset + len(carry) < remoteSize:
+                chunkStart = offset + len(carry)
+                data = b"".join(remoteFile.readv([(chunkStart, min(readChunkSize, remoteSize - chunkStart))]))
+                nRead += len(data)
+                data = carry + data
+                lastNewLine = data.rfind(b"\n")
+                if lastNewLine < 0:
+                    carry = data    # no complete line in this chunk yet. (The incomplete last line of the file is read again next time.)
+                    continue
+                localFile.write(data[:lastNewLine + 1])
+                if self.onLines is not None:
+                    self.onLines(source, fileName, fileDate, data[:lastNewLine + 1].decode("utf-8", "replace").splitlines())
+                offset += lastNewLine + 1
+                carry = data[lastNewLine + 1:]
+        return nRead
+
+    def poll(self):
+        nBytes = 0
+        for source in self.sources:
+            try:
+                filesToRead = self.getFilesToRead(source)
+            except FileNotFoundError:   # reported (once per source in --follow), not retried as a connection error. The other sources are still read.
+                if source.name not in self.missingSourceNames:
+                    print(Fore.RED + "SqLogTail: [%s] ERROR: the logs folder '%s' does not exist on the server." % (source.name, source.remoteLogsDir) + Style.RESET_ALL)
+                    self.missingSourceNames.add(source.name)
+                continue
+            self.missingSourceNames.discard(source.name)
+            for fileName, remoteSize, fileDate in filesToRead:
+                nBytes += self.readNewBytes(source, fileName, remoteSize, fileDate)
+        return nBytes
+
+    # polls until Ctrl-C. A lost connection is reopened with backoff, and the tail continues from the offsets (the sizes of the copies).
+    def follow(self, intervalSec):
+        reconnectSec = 1.0
+        while True:
+            try:
+                if self.transport is None or not self.transport.is_active():
+                    self.close()
+                    self.connect()
+                    reconnectSec = 1.0
+                self.poll()
+                time.sleep(intervalSec)
+            except (OSError, EOFError, paramiko.SSHException) as e:
+                print(Fore.RED + "SqLogTail: connection error: %s. Reconnecting in %.0f seconds." % (e, reconnectSec) + Style.RESET_ALL)
+                self.close()
+                time.sleep(reconnectSec)
+                reconnectSec = min(reconnectMaxSec, reconnectSec * 2)
+
+levelColors = {"WARN": Fore.YELLOW, "ERROR": Fore.RED, "FATAL": Fore.RED + Style.BRIGHT}
+
+# --print: the record lines of the wanted levels. The continuation lines (stack traces) follow the level of their record.
+def createLinePrinter(minLevel):
+    wantedLevels = set(SqLog.levels[SqLog.levels.index(minLevel):])
+    state = {"isPrinted": False, "color": ""}
+    def onLines(source, fileName, fileDate, lines):
+        for line in lines:
+            parsed = SqLog.parseLine(fileDate, line)
+            if parsed is not None:
+                state["isPrinted"] = parsed[2] in wantedLevels
+                state["color"] = levelColors.get(parsed[2], "")
+            if state["isPrinted"]:
+                print(state["color"] + "[" + source.name + "] " + line + (Style.RESET_ALL if state["color"] != "" else ""))
+    return onLines
+
+def main():
+    parser = argparse.ArgumentParser(description = "Incremental copy (tail) of the .sqlog files of the MTrader server.")
+    parser.add_argument("sources", nargs = "*", help = "default: all of " + ", ".join(s.name for s in logSources))
+    parser.add_argument("--mirrorDir", default = SqLog.defaultLogsDir + "/remote", help = "local copies of the remote files (default: SqCore/logs/remote)")
+    parser.add_argument("--days", type = int, default = 1, help = "days (files) to copy per source, counting back from the newest remote file")
+    parser.add_argument("--follow", action = "store_true", help = "keep polling for the new lines")
+    parser.add_argument("--interval", type = float, default = followIntervalSec, help = "--follow: seconds between the polls")
+    parser.add_argument("--print", dest = "isPrinted", action = "store_true", help = "print the new lines")
+    parser.add_argument("--level", default = "TRACE", help = "--print: minimum level: " + ", ".join(SqLog.levels))
+    args = parser.parse_args()
+
+    colorama.init()
+    sources = [s for s in logSources if len(args.sources) == 0 or s.name in args.sources]
+    unknownNames = set(args.sources) - set(s.name for s in logSources)
+    if len(unknownNames) > 0:
+        sys.exit("Unknown log source(s): " + ", ".join(unknownNames) + ". Known: " + ", ".join(s.name for s in logSources))
+    if args.level.upper() not in SqLog.levels:
+        sys.exit("Unknown level: " + args.level + ". Known: " + ", ".join(SqLog.levels))
+    os.makedirs(args.mirrorDir, exist_ok = True)
+    tailer = LogTailer(sources, args.mirrorDir, args.days, createLinePrinter(args.level.upper()) if args.isPrinted else None)
+    try:
+        if args.follow:
+            tailer.follow(args.interval)
+        else:
+            startTime = time.time()
+            tailer.connect()
+            nBytes = tailer.poll()
+            print("SqLogTail: %.1f KB new log data in %.2f seconds, in %s" % (nBytes / 1024.0, time.time() - startTime, args.mirrorDir))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tailer.close()
+    if len(tailer.missingSourceNames) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
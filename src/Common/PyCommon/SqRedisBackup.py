@@ -0,0 +1,521 @@
+# Fast bulk backup and restore of a Redis server, without blocking it (unlike SAVE) and without file access on the server (unlike copying the BGSAVE dump.rdb).
+# Backup: one connection iterates the keyspace with SCAN (a few keys per call, the server keeps serving the others), and the key batches are spread over parallel worker connections,
+# which fetch them with pipelined 'PTTL, DUMP' commands (one round trip per batch). Restore: pipelined 'RESTORE' batches on parallel connections.
+# DUMP gives the value in the server's own serialization (any type: string, hash, list, set, zset, stream), so the backup is type independent and compact.
+# The backup file is a stream of batches (gzip compressed by default):
+#   header: 'SQREDIS1', uint64 creation time (Unix ms)
+#   batch:  'B', uint16 db, uint32 nKeys, nKeys * (uint32 keyLength, key, int64 expireAt (Unix ms, -1: no expiry), uint32 dumpLength, dump)
+#   footer: 'E', uint64 nKeys, uint64 nBatches    (a file without footer is truncated: restore() reads the whole file first, and restores nothing from a truncated or inconsistent one)
+# The redis connection string is read from SqCore.Tools.RedisManager.NoGitHub.json (ConnectionStrings:RedisDefault), as RedisManager reads it.
+# Usage:
+#   'python SqRedisBackup.py backup redis-20200315.sqredis [--dbs 0] [--batchSize 1000] [--workers 4]'
+#   'python SqRedisBackup.py restore redis-20200315.sqredis [--replace]'
+#   'python SqRedisBackup.py selftest [--nKeys 100000]'   backup + restore round trip against an in-process stand-in server (or with --connString against an empty db of a local redis-server)
+
+import os
+import sys
+import ssl
+import gzip
+import time
+import queue
+import struct
+import socket
+import fnmatch
+import argparse
+import threading
+import socketserver
+import SqTiming
+import SqDbConfig
+
+fileMagic = b"SQREDIS1"
+batchHeaderStruct = struct.Struct("<HI")
+keyHeaderStruct = struct.Struct("<I")
+expireStruct = struct.Struct("<q")
+footerStruct = struct.Struct("<QQ")
+
+class RedisError(Exception):
+    pass
+
+# RESP2 array of bulk strings (also used by the asyncio client of SqDbBench.py)
+def encodeCommand(args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n" % len(arg))
+        parts.append(arg)
+        parts.append(b"\r\n")
+    return b"".join(parts)
+
+# Minimal RESP2 client. pipeline() sends all the commands in one write, then reads all the replies: one round trip for a batch. The error replies of a pipeline are returned as RedisError objects.
+class RedisConnection:
+    def __init__(self, host, port, password = None, db = 0, useSsl = False, timeoutSec = 60.0):
+        self.sock = socket.create_connection((host, port), timeout = timeoutSec)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if useSsl:
+            self.sock = ssl.create_default_context().wrap_socket(self.sock, server_hostname = host)
+        self.reader = self.sock.makefile("rb", buffering = 256 * 1024)
+        self.db = None
+        if password:
+            self.execute("AUTH", password)
+        self.select(db)
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+    def readReply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Redis connection closed")
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b"+":
+            return rest
+        if prefix == b"-":
+            return RedisError(rest.decode("utf-8", "replace"))
+        if prefix == b":":
+            return int(rest)
+        if prefix == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) < length + 2:
+                raise ConnectionError("Redis connection closed")
+            return data[:-2]
+        if prefix == b"*":
+            length = int(rest)
+            return None if length < 0 else [self.readReply() for i in range(length)]
+        raise RedisError("Unknown RESP reply: " + repr(line))
+
+    def pipeline(self, commands):
+        self.sock.sendall(b"".join(encodeCommand(c) for c in commands))
+        return [self.readReply() for c in commands]
+
+    def execute(self, *args):
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    def select(self, db):
+        if db != self.db:
+            self.execute("SELECT", db)
+            self.db = db
+
+def connect(connParams):
+    return RedisConnection(connParams["host"], connParams["port"], connParams["password"], connParams["db"], connParams["ssl"])
+
+# the dbs with keys, from 'INFO keyspace' ('db0:keys=12,expires=0,avg_ttl=0')
+def getNonEmptyDbs(conn):
+    dbs = []
+    for line in conn.execute("INFO", "keyspace").decode("utf-8").splitlines():
+        if line.startswith("db") and ":" in line:
+            dbs.append(int(line[2:line.index(":")]))
+    return sorted(dbs)
+
+# reads the exact number of bytes (gzip and plain files alike)
+def readExact(file, n):
+    data = file.read(n)
+    if len(data) != n:
+        raise EOFError("The backup file is truncated.")
+    return data
+
+def openBackupFile(fileName):
+    with open(fileName, "rb") as file:
+        isGzip = file.read(2) == b"\x1f\x8b"
+    return gzip.open(fileName, "rb") if isGzip else open(fileName, "rb", buffering = 1024 * 1024)
+
+class TransferStats:
+    def __init__(self):
+        self.nKeys = 0
+        self.nBytes = 0     # key + dump bytes
+        self.nBatches = 0
+        self.nSkipped = 0   # deleted or expired between SCAN and DUMP, or expired before the restore
+        self.nErrors = 0
+        self.firstErrors = []
+        self.lock = threading.Lock()
+
+    def addError(self, message):
+        with self.lock:
+            self.nErrors += 1
+            if len(self.firstErrors) < 5:
+                self.firstErrors.append(message)
+
+# Runs 'func(conn, item)' for the items of 'inQueue' on 'nWorkers' threads, each with its own connection. A None item stops one worker.
+def startWorkers(connParams, nWorkers, inQueue, func, workerErrors):
+    def workerLoop():
+        conn = None
+        try:
+            conn = connect(connParams)
+            while True:
+                item = inQueue.get()
+                if item is None:
+                    break
+                func(conn, item)
+        except Exception as e:
+            workerErrors.append(e)
+            while inQueue.get() is not None:   # drain, so the producer never blocks on the full queue
+                pass
+        finally:
+            if conn is not None:
+                conn.close()
+    threads = [threading.Thread(target = workerLoop, daemon = True) for i in range(nWorkers)]
+    for t in threads:
+        t.start()
+    return threads
+
+def backup(connParams, fileName, dbs, batchSize, nWorkers, isCompressed):
+    startTime = time.time()
+    stats = TransferStats()
+    keyQueue = queue.Queue(maxsize = nWorkers * 4)
+    outQueue = queue.Queue(maxsize = nWorkers * 4)
+    workerErrors = []
+
+    def dumpBatch(conn, item):
+        (db, keys) = item
+        conn.select(db)
+        replies = conn.pipeline([c for key in keys for c in (("PTTL", key), ("DUMP", key))])
+        nowMs = int(time.time() * 1000)
+        records = []
+        for i, key in enumerate(keys):
+            (pttl, dump) = (replies[2 * i], replies[2 * i + 1])
+            if isinstance(pttl, RedisError) or isinstance(dump, RedisError):
+                stats.addError("%s: %s" % (key, pttl if isinstance(pttl, RedisError) else dump))
+                continue
+            if dump is None or pttl == -2:
+                with stats.lock:
+                    stats.nSkipped += 1
+                continue
+            records.append((key, nowMs + pttl if pttl >= 0 else -1, dump))
+        outQueue.put((db, records))
+
+    def writeBatches(file):
+        nDone = 0
+        while nDone < nWorkers:
+            item = outQueue.get()
+            if item is None:
+                nDone += 1
+                continue
+            (db, records) = item
+            if len(records) == 0:
+                continue
+            parts = [b"B", batchHeaderStruct.pack(db, len(records))]
+            for key, expireAt, dump in records:
+                parts += [keyHeaderStruct.pack(len(key)), key, expireStruct.pack(expireAt), keyHeaderStruct.pack(len(dump)), dump]
+                stats.nBytes += len(key) + len(dump)
+            file.write(b"".join(parts))
+            stats.nKeys += len(records)
+            stats.nBatches += 1
+
+    tempFileName = fileName + ".tmp"
+    file = gzip.open(tempFileName, "wb", compresslevel = 1) if isCompressed else open(tempFileName, "wb", buffering = 1024 * 1024)     # level 1: the DUMP payloads are LZF compressed already
+    try:
+        file.write(fileMagic + struct.pack("<Q", int(startTime * 1000)))
+        writerThread = threading.Thread(target = writeBatches, args = (file,), daemon = True)
+        writerThread.start()
+        workers = startWorkers(connParams, nWorkers, keyQueue, lambda conn, item: dumpBatch(conn, item), workerErrors)
+        for w in workers:   # every worker puts a None on the outQueue when it finished
+            threading.Thread(target = lambda t = w: (t.join(), outQueue.put(None)), daemon = True).start()
+
+        scanConn = connect(connParams)
+        try:
+            for db in (dbs if dbs is not None else getNonEmptyDbs(scanConn)):
+                scanConn.select(db)
+                seenKeys = set()    # SCAN can return a key more than once (during a rehash)
+                cursor = b"0"
+                while True:
+                    (cursor, keys) = scanConn.execute("SCAN", cursor, "COUNT", batchSize)
+                    keys = [k for k in keys if k not in seenKeys]
+                    seenKeys.update(keys)
+                    for i in range(0, len(keys), batchSize):
+                        keyQueue.put((db, keys[i:i + batchSize]))
+                    if cursor == b"0" or len(workerErrors) > 0:
+                        break
+        finally:
+            scanConn.close()
+            for i in range(nWorkers):
+                keyQueue.put(None)
+        writerThread.join()
+        if len(workerErrors) > 0:
+            raise workerErrors[0]
+        file.write(b"E" + footerStruct.pack(stats.nKeys, stats.nBatches))
+        file.close()
+    except:
+        file.close()
+        os.remove(tempFileName)     # no half backup file is left, that could be mistaken for a complete one
+        raise
+    os.replace(tempFileName, fileName)
+    return finishStats("backup", stats, time.time() - startTime, os.path.getsize(fileName))
+
+# Yields the (db, [(key, expireAt, dump)]) batches of a backup file. After the last batch, the footer is checked: a truncated file raises EOFError, wrong counts raise an Exception.
+def readBatches(fileName):
+    nFileKeys = 0
+    nFileBatches = 0
+    with openBackupFile(fileName) as file:
+        header = readExact(file, len(fileMagic) + 8)
+        if header[:len(fileMagic)] != fileMagic:
+            raise Exception(fileName + " is not a SqRedisBackup file.")
+        while True:
+            recordType = readExact(file, 1)
+            if recordType == b"E":
+                (nKeys, nBatches) = footerStruct.unpack(readExact(file, footerStruct.size))
+                if (nKeys, nBatches) != (nFileKeys, nFileBatches):
+                    raise Exception("The footer of %s says %d keys in %d batches, the file has %d in %d." % (fileName, nKeys, nBatches, nFileKeys, nFileBatches))
+                return
+            if recordType != b"B":
+                raise Exception("Corrupt backup file %s: unknown record type %r" % (fileName, recordType))
+            (db, nKeys) = batchHeaderStruct.unpack(readExact(file, batchHeaderStruct.size))
+            records = []
+            for i in range(nKeys):
+                key = readExact(file, keyHeaderStruct.unpack(readExact(file, 4))[0])
+                expireAt = expireStruct.unpack(readExact(file, 8))[0]
+                dump = readExact(file, keyHeaderStruct.unpack(readExact(file, 4))[0])
+                records.append((key, expireAt, dump))
+            nFileKeys += nKeys
+            nFileBatches += 1
+            yield (db, records)
+
+# The whole file is read (and decompressed) once before the restore, so a truncated or corrupt file is refused before any key is written. (The check pass is local, much faster than the RESTOREs.)
+def restore(connParams, fileName, nWorkers, isReplace):
+    startTime = time.time()
+    stats = TransferStats()
+    batchQueue = queue.Queue(maxsize = nWorkers * 4)
+    workerErrors = []
+
+    def restoreBatch(conn, item):
+        (db, records) = item
+        conn.select(db)
+        nowMs = int(time.time() * 1000)
+        commands = []
+        for key, expireAt, dump in records:
+            if expireAt >= 0 and expireAt <= nowMs:
+                with stats.lock:
+                    stats.nSkipped += 1
+                continue
+            commands.append(("RESTORE", key, expireAt - nowMs if expireAt >= 0 else 0, dump) + (("REPLACE",) if isReplace else ()))
+        if len(commands) == 0:
+            return
+        replies = conn.pipeline(commands)
+        nOk = 0
+        for command, reply in zip(commands, replies):
+            if isinstance(reply, RedisError):
+                stats.addError("%s: %s" % (command[1], reply))
+            else:
+                nOk += 1
+        with stats.lock:
+            stats.nKeys += nOk
+            stats.nBytes += sum(len(c[1]) + len(c[3]) for c in commands)
+            stats.nBatches += 1
+
+    print("SqRedisBackup: checking %s..." % fileName)
+    nFileKeys = sum(len(records) for db, records in readBatches(fileName))
+    print("SqRedisBackup: %d keys in %s, the footer matches. Restoring..." % (nFileKeys, fileName))
+    workers = startWorkers(connParams, nWorkers, batchQueue, restoreBatch, workerErrors)
+    try:
+        for item in readBatches(fileName):
+            if len(workerErrors) > 0:
+                break
+            batchQueue.put(item)
+    finally:
+        for i in range(nWorkers):
+            batchQueue.put(None)
+        for w in workers:
+            w.join()
+    if len(workerErrors) > 0:
+        raise workerErrors[0]
+    return finishStats("restore", stats, time.time() - startTime, os.path.getsize(fileName))
+
+def finishStats(phase, stats, sec, fileSize):
+    mb = stats.nBytes / (1024 * 1024)
+    print("SqRedisBackup: %s: %d keys, %.2f MB (file %.2f MB) in %.2fs: %.0f keys/s, %.2f MB/s. %d skipped (expired/deleted), %d errors." % (phase, stats.nKeys, mb, fileSize / (1024 * 1024),
+        sec, stats.nKeys / max(sec, 1e-6), mb / max(sec, 1e-6), stats.nSkipped, stats.nErrors))
+    for message in stats.firstErrors:
+        print("    " + message)
+    SqTiming.record("SqRedisBackup", phase, sec, ok = (stats.nErrors == 0), nKeys = stats.nKeys, bytes = stats.nBytes, fileBytes = fileSize)
+    return stats
+
+# ---------- In-process stand-in server (the subset of Redis commands that this tool, its selftest and SqDbBench.py use). DUMP payloads are its own format: only it can RESTORE them.
+
+class StandInDb:
+    def __init__(self):
+        self.values = {}    # key -> (value, expireAtMs or None)
+
+    def get(self, key):
+        item = self.values.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.time() * 1000:
+            del self.values[key]
+            return None
+        return item
+
+class StandInRedisHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        socketserver.StreamRequestHandler.setup(self)
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)    # as redis-server: the replies of a pipeline are not delayed by Nagle + delayed ACK (40ms)
+
+    def handle(self):
+        server = self.server
+        db = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = [self.rfile.read(int(self.rfile.readline()[1:-2]) + 2)[:-2] for i in range(int(line[1:-2]))]
+            with server.lock:
+                (reply, db) = self.runCommand(server, db, [args[0].upper()] + args[1:])
+            self.wfile.write(reply)
+
+    def runCommand(self, server, db, args):
+        def bulk(data):
+            return b"$-1\r\n" if data is None else b"$%d\r\n%s\r\n" % (len(data), data)
+        dbData = server.dbs.setdefault(db, StandInDb())
+        cmd = args[0]
+        if cmd == b"PING":
+            return (b"+PONG\r\n", db)
+        if cmd == b"AUTH":
+            return (b"+OK\r\n" if args[1].decode() == server.password else b"-WRONGPASS invalid password\r\n", db)
+        if cmd == b"SELECT":
+            return (b"+OK\r\n", int(args[1]))
+        if cmd == b"SET":
+            expireAt = time.time() * 1000 + int(args[4]) if len(args) >= 5 and args[3].upper() == b"PX" else None
+            dbData.values[args[1]] = (args[2], expireAt)
+            return (b"+OK\r\n", db)
+        if cmd == b"GET":
+            item = dbData.get(args[1])
+            return (bulk(item[0] if item else None), db)
+        if cmd == b"DEL":
+            nDeleted = sum(1 for k in args[1:] if dbData.values.pop(k, None) is not None)
+            return (b":%d\r\n" % nDeleted, db)
+        if cmd == b"DBSIZE":
+            return (b":%d\r\n" % len(dbData.values), db)
+        if cmd == b"FLUSHDB":
+            dbData.values.clear()
+            return (b"+OK\r\n", db)
+        if cmd == b"INFO":
+            text = "# Keyspace\r\n" + "".join("db%d:keys=%d,expires=0,avg_ttl=0\r\n" % (n, len(d.values)) for n, d in sorted(server.dbs.items()) if len(d.values) > 0)
+            return (bulk(text.encode()), db)
+        if cmd == b"SCAN":
+            cursor = int(args[1])
+            count = 10
+            pattern = None
+            for i in range(2, len(args) - 1, 2):
+                if args[i].upper() == b"COUNT":
+                    count = int(args[i + 1])
+                elif args[i].upper() == b"MATCH":
+                    pattern = args[i + 1].decode("utf-8", "replace")
+            keys = list(dbData.values.keys())[cursor:cursor + count]
+            nextCursor = cursor + count if cursor + count < len(dbData.values) else 0
+            keys = [k for k in keys if pattern is None or fnmatch.fnmatchcase(k.decode("utf-8", "replace"), pattern)]
+            return (b"*2\r\n" + bulk(b"%d" % nextCursor) + b"*%d\r\n" % len(keys) + b"".join(bulk(k) for k in keys), db)
+        if cmd == b"PTTL":
+            item = dbData.get(args[1])
+            return (b":%d\r\n" % (-2 if item is None else -1 if item[1] is None else max(0, int(item[1] - time.time() * 1000))), db)
+        if cmd == b"DUMP":
+            item = dbData.get(args[1])
+            return (bulk(b"STANDIN" + item[0] if item else None), db)
+        if cmd == b"RESTORE":
+            if dbData.get(args[1]) is not None and not (len(args) > 4 and args[4].upper() == b"REPLACE"):
+                return (b"-BUSYKEY Target key name already exists.\r\n", db)
+            if not args[3].startswith(b"STANDIN"):
+                return (b"-ERR DUMP payload version or checksum are wrong\r\n", db)
+            ttl = int(args[2])
+            dbData.values[args[1]] = (args[3][len(b"STANDIN"):], time.time() * 1000 + ttl if ttl > 0 else None)
+            return (b"+OK\r\n", db)
+        return (b"-ERR unknown command '" + cmd + b"'\r\n", db)
+
+class StandInRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 511    # = redis-server tcp-backlog. With the default 5, a burst of unpooled connections waits for SYN retransmits (1s)
+
+    def __init__(self, password = None):
+        socketserver.ThreadingTCPServer.__init__(self, ("localhost", 0), StandInRedisHandler)
+        self.password = password
+        self.dbs = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target = self.serve_forever, daemon = True).start()
+        return {"host": "localhost", "port": self.server_address[1], "password": self.password, "db": 0, "ssl": False}
+
+# fills an empty db with 'nKeys' keys (some with expiry), backs it up, flushes the db, restores it, and compares the values
+def selftest(args, connParams):
+    testDb = connParams["db"]
+    conn = connect(connParams)
+    if conn.execute("DBSIZE") != 0:
+        sys.exit("SqRedisBackup: selftest needs an empty db (db %d has keys). It flushes the db." % testDb)
+    print("SqRedisBackup: selftest: writing %d keys of %d bytes into db %d..." % (args.nKeys, args.valueSize, testDb))
+    for start in range(0, args.nKeys, 1000):
+        commands = []
+        for i in range(start, min(start + 1000, args.nKeys)):
+            value = (b"%d:" % i) * (args.valueSize // 8 + 1)
+            commands.append(("SET", b"SqRedisBackupTest:%d" % i, value[:args.valueSize]) + (("PX", 3600 * 1000) if i % 10 == 0 else ()))
+        conn.pipeline(commands)
+    fileName = args.file or "SqRedisBackupSelftest.sqredis"
+    backup(connParams, fileName, [testDb], args.batchSize, args.workers, not args.noCompress)
+    conn.execute("FLUSHDB")
+    truncatedFileName = fileName + ".truncated"   # a truncated backup has to be refused before any key is written
+    with open(fileName, "rb") as file, open(truncatedFileName, "wb") as truncatedFile:
+        truncatedFile.write(file.read()[:os.path.getsize(fileName) * 3 // 4])
+    try:
+        restore(connParams, truncatedFileName, args.workers, False)
+        isTruncatedRefused = False
+    except Exception:     # EOFError (truncated gzip or record), or the footer check
+        isTruncatedRefused = conn.execute("DBSIZE") == 0
+    os.remove(truncatedFileName)
+    print("SqRedisBackup: selftest: the truncated backup file was %s." % ("refused, nothing restored" if isTruncatedRefused else "NOT refused"))
+    restore(connParams, fileName, args.workers, False)
+    nBad = 0
+    for start in range(0, args.nKeys, 1000):
+        indices = range(start, min(start + 1000, args.nKeys))
+        replies = conn.pipeline([("GET", b"SqRedisBackupTest:%d" % i) for i in indices])
+        nBad += sum(1 for i, r in zip(indices, replies) if r != ((b"%d:" % i) * (args.valueSize // 8 + 1))[:args.valueSize])
+    conn.execute("FLUSHDB")
+    conn.close()
+    os.remove(fileName)
+    print("SqRedisBackup: selftest %s: %d of %d keys restored with a wrong value." % ("OK" if nBad == 0 and isTruncatedRefused else "FAILED", nBad, args.nKeys))
+    return nBad == 0 and isTruncatedRefused
+
+def main():
+    parser = argparse.ArgumentParser(description = "Pipelined bulk backup/restore of Redis (SCAN + DUMP/PTTL, RESTORE).")
+    subparsers = parser.add_subparsers(dest = "command")
+    backupParser = subparsers.add_parser("backup")
+    backupParser.add_argument("file")
+    backupParser.add_argument("--dbs", help = "comma separated db numbers (default: all the non-empty dbs)")
+    backupParser.add_argument("--noCompress", action = "store_true", help = "don't gzip the stream")
+    restoreParser = subparsers.add_parser("restore")
+    restoreParser.add_argument("file")
+    restoreParser.add_argument("--replace", action = "store_true", help = "overwrite the existing keys (default: they are kept, and reported as errors)")
+    selftestParser = subparsers.add_parser("selftest")
+    selftestParser.add_argument("--file", help = "temporary backup file (default: SqRedisBackupSelftest.sqredis)")
+    selftestParser.add_argument("--nKeys", type = int, default = 100000)
+    selftestParser.add_argument("--valueSize", type = int, default = 200)
+    selftestParser.add_argument("--noCompress", action = "store_true")
+    for p in [backupParser, restoreParser, selftestParser]:
+        p.add_argument("--connString", help = "StackExchange.Redis connection string, e.g. 'localhost:6379,password=x' (default: ConnectionStrings:RedisDefault of RedisManager, selftest: in-process stand-in)")
+        p.add_argument("--batchSize", type = int, default = 1000, help = "keys per SCAN COUNT and per pipeline")
+        p.add_argument("--workers", type = int, default = 4, help = "parallel connections")
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        return
+
+    if args.connString:
+        connParams = SqDbConfig.parseRedisConnString(args.connString)
+    elif args.command == "selftest":
+        connParams = StandInRedisServer().start()
+    else:
+        connParams = SqDbConfig.parseRedisConnString(SqDbConfig.getConnectionString("RedisManager", "RedisDefault"))
+    if args.command == "backup":
+        dbs = [int(d) for d in args.dbs.split(",")] if args.dbs else None
+        backup(connParams, args.file, dbs, args.batchSize, args.workers, not args.noCompress)
+    elif args.command == "restore":
+        stats = restore(connParams, args.file, args.workers, args.replace)
+        if stats.nErrors > 0:
+            sys.exit(1)
+    elif args.command == "selftest":
+        if not selftest(args, connParams):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
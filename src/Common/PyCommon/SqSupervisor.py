@@ -0,0 +1,321 @@
+# Supervisor of the long running dev processes (watchers, dev servers) of PreDebugWatchDev.py.
+# Every child runs in its own process group (POSIX session, Windows process group), so a stop kills the whole tree (npx -> node -> tsc), not only the shell.
+# The output of the children is streamed line by line with a '[name]' prefix. A crashed child is restarted with exponential backoff.
+# A lazy child (a dev server) is started only when the first connection arrives on its public port, and it is stopped again after an idle period.
+# runUntilStopSignal() tears everything down on the message of PostDebugWatchDev.py (TCP port), on Ctrl-C/SIGTERM/SIGHUP, or when our parent process dies.
+# If the supervisor itself is killed (no chance to clean up), the children still die with it: on Linux by PR_SET_PDEATHSIG, on Windows by a kill-on-close Job Object.
+# (On macOS there is no such kernel feature: there the children of a SIGKILL-ed supervisor are orphaned.)
+
+import os
+import sys
+import time
+import signal
+import socket
+import platform
+import threading
+import subprocess
+
+isWindows = platform.system() == "Windows"
+initialBackoffSec = 1.0     # restart delay after the first crash. Doubled after every crash in a row...
+maxBackoffSec = 60.0        # ...up to this
+stableRunSec = 60.0         # a child that ran longer than this before it exited is not 'crashing in a loop': its backoff restarts from initialBackoffSec
+stopGraceSec = 5.0          # after SIGTERM, the children have this much time to exit before SIGKILL
+lazyStartTimeoutSec = 180.0 # a lazy child has this much time to open its backend port ('ng serve' compiles the app first)
+
+printLock = threading.Lock()    # the output lines of the children are not interleaved mid-line
+
+def printLine(line):
+    with printLock:
+        print(line, flush = True)
+
+# Linux: the kernel sends SIGTERM to the child if the supervisor dies, even by SIGKILL (when there is no chance to clean up).
+# It reaches only the direct child (the shell or the exec-ed tool), the others are still found by the process group kill of the next supervisor stop.
+# Not set in a Popen preexec_fn: that runs between fork and exec in a copy of our multi-threaded process, where a lock held by another thread (e.g. the import lock) can deadlock the child.
+# Instead, this launcher is the child: a fresh single-threaded Python sets the signal, checks that the supervisor didn't die before that, and exec-s the shell (same pid).
+pdeathsigLauncherSource = """
+import os, sys, ctypes, signal
+try:
+    ctypes.CDLL('libc.so.6', use_errno = True).prctl(1, signal.SIGTERM)    # 1 = PR_SET_PDEATHSIG
+except (OSError, AttributeError):
+    pass
+if os.getppid() != int(sys.argv[1]):
+    sys.exit('SqSupervisor: the supervisor died before the child started.')
+os.execv('/bin/sh', ['/bin/sh', '-c', sys.argv[2]])
+"""
+
+# Windows: every child is assigned to this Job Object. Its only handle is ours, and KILL_ON_JOB_CLOSE kills all the processes in it (the processes they start are in it too)
+# when the handle is closed, which the OS does when the supervisor exits in any way, e.g. killed by VsCode. A grandchild started in the microseconds between
+# CreateProcess and the assignment would escape it, but cmd.exe doesn't start anything that fast.
+def createKillOnCloseJob():
+    import ctypes
+    from ctypes import wintypes
+    class IO_COUNTERS(ctypes.Structure):
+        _fields_ = [(n, ctypes.c_ulonglong) for n in ["ReadOperationCount", "WriteOperationCount", "OtherOperationCount", "ReadTransferCount", "WriteTransferCount", "OtherTransferCount"]]
+    class JOBOBJECT_BASIC_LIMIT_INFORMATION(ctypes.Structure):
+        _fields_ = [("PerProcessUserTimeLimit", ctypes.c_int64), ("PerJobUserTimeLimit", ctypes.c_int64), ("LimitFlags", wintypes.DWORD), ("MinimumWorkingSetSize", ctypes.c_size_t),
+            ("MaximumWorkingSetSize", ctypes.c_size_t), ("ActiveProcessLimit", wintypes.DWORD), ("Affinity", ctypes.c_size_t), ("PriorityClass", wintypes.DWORD), ("SchedulingClass", wintypes.DWORD)]
+    class JOBOBJECT_EXTENDED_LIMIT_INFORMATION(ctypes.Structure):
+        _fields_ = [("BasicLimitInformation", JOBOBJECT_BASIC_LIMIT_INFORMATION), ("IoInfo", IO_COUNTERS), ("ProcessMemoryLimit", ctypes.c_size_t), ("JobMemoryLimit", ctypes.c_size_t),
+            ("PeakProcessMemoryUsed", ctypes.c_size_t), ("PeakJobMemoryUsed", ctypes.c_size_t)]
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error = True)
+    kernel32.CreateJobObjectW.restype = wintypes.HANDLE
+    job = kernel32.CreateJobObjectW(None, None)
+    info = JOBOBJECT_EXTENDED_LIMIT_INFORMATION()
+    info.BasicLimitInformation.LimitFlags = 0x2000     # JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
+    if not job or not kernel32.SetInformationJobObject(wintypes.HANDLE(job), 9, ctypes.byref(info), ctypes.sizeof(info)):    # 9 = JobObjectExtendedLimitInformation
+        printLine("SqBuild: CreateJobObject/SetInformationJobObject failed (error %d). The children are not killed if the supervisor is killed." % ctypes.get_last_error())
+        return None
+    return job
+
+def assignToJob(job, pid):
+    import ctypes
+    from ctypes import wintypes
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error = True)
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    processHandle = kernel32.OpenProcess(0x0100 | 0x0001, False, pid)     # PROCESS_SET_QUOTA | PROCESS_TERMINATE
+    if not processHandle or not kernel32.AssignProcessToJobObject(wintypes.HANDLE(job), wintypes.HANDLE(processHandle)):
+        printLine("SqBuild: AssignProcessToJobObject failed for pid %d (error %d)." % (pid, ctypes.get_last_error()))
+    if processHandle:
+        kernel32.CloseHandle(wintypes.HANDLE(processHandle))
+
+# Windows: there is no reparenting, a dead parent's pid can even be reused. A handle to the parent process keeps its identity, and is signaled when it exits.
+def openProcessHandle(pid):
+    import ctypes
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error = True)
+    kernel32.OpenProcess.restype = ctypes.c_void_p
+    return kernel32.OpenProcess(0x00100000, False, pid)    # SYNCHRONIZE. None if the parent is already gone, or not accessible
+
+def isProcessHandleSignaled(handle):
+    import ctypes
+    return ctypes.WinDLL("kernel32").WaitForSingleObject(ctypes.c_void_p(handle), 0) == 0     # WAIT_OBJECT_0: exited
+
+class SupervisedProcess:
+    def __init__(self, name, command, cwd = None, isRestarted = True):
+        self.name = name
+        self.command = command
+        self.cwd = cwd
+        self.isRestarted = isRestarted
+        self.process = None
+        self.startTime = 0.0
+        self.nCrashesInRow = 0
+        self.restartTime = None     # when an exited child is due to be restarted
+        self.isLazy = False
+        self.isStartRequested = False   # set by the proxy threads of a lazy child, the main thread starts the process
+        self.nActiveConnections = 0
+        self.lastActivityTime = 0.0
+        self.lock = threading.Lock()
+
+class Supervisor:
+    def __init__(self):
+        self.children = []
+        self.isStopping = False
+        self.outputListeners = []   # functions(child, line), called for every output line of the children (e.g. SqWatch.Watcher.onOutputLine)
+        self.job = createKillOnCloseJob() if isWindows else None
+
+    def add(self, name, command, cwd = None, isRestarted = True):
+        child = SupervisedProcess(name, command, cwd, isRestarted)
+        self.children.append(child)
+        self.start(child)
+        return child
+
+    # The child is not started now. A listener on 'publicPort' starts it on the first connection, and proxies all the connections to 'backendPort', where the child should listen.
+    # With no open connection for 'idleStopSec', the child is stopped. (The live-reload websocket of an open browser tab keeps it alive.)
+    def addLazy(self, name, command, publicPort, backendPort, idleStopSec, cwd = None):
+        child = SupervisedProcess(name, command, cwd, False)
+        child.isLazy = True
+        child.backendPort = backendPort
+        child.idleStopSec = idleStopSec
+        self.children.append(child)
+        listenSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if not isWindows:   # rebind over the TIME_WAIT connections of the previous debug session. (On Windows this flag would allow stealing a port in use)
+            listenSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listenSocket.bind(('localhost', publicPort))
+        listenSocket.listen(16)
+        threading.Thread(target = self.acceptLazyConnections, args = (child, listenSocket), daemon = True).start()
+        printLine("SqBuild: [" + child.name + "] Waiting for the first request on port %d to start it." % publicPort)
+        return child
+
+    def acceptLazyConnections(self, child, listenSocket):
+        while True:
+            clientSocket, address = listenSocket.accept()
+            with child.lock:
+                child.nActiveConnections += 1
+                child.lastActivityTime = time.time()
+            threading.Thread(target = self.proxyLazyConnection, args = (child, clientSocket), daemon = True).start()
+
+    # waits until the child (started on demand) listens on its backend port, then pipes the bytes both ways
+    def proxyLazyConnection(self, child, clientSocket):
+        try:
+            deadline = time.time() + lazyStartTimeoutSec
+            backendSocket = None
+            while backendSocket is None and time.time() < deadline and not self.isStopping:
+                process = child.process
+                if process is None or process.poll() is not None:
+                    child.isStartRequested = True
+                try:
+                    backendSocket = socket.create_connection(('localhost', child.backendPort), timeout = 1.0)
+                except OSError:
+                    time.sleep(0.5)
+            if backendSocket is None:
+                return
+            backendSocket.settimeout(None)
+            pipeThread = threading.Thread(target = self.pipeBytes, args = (child, backendSocket, clientSocket), daemon = True)
+            pipeThread.start()
+            self.pipeBytes(child, clientSocket, backendSocket)
+            pipeThread.join()
+            backendSocket.close()
+        finally:
+            clientSocket.close()
+            with child.lock:
+                child.nActiveConnections -= 1
+                child.lastActivityTime = time.time()
+
+    def pipeBytes(self, child, src, dst):
+        try:
+            for data in iter(lambda: src.recv(64 * 1024), b""):
+                dst.sendall(data)
+                child.lastActivityTime = time.time()
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass    # the other side reset the connection
+
+    # always called from the main thread: PR_SET_PDEATHSIG fires when the thread that created the child exits, not only the process
+    def start(self, child):
+        printLine("SqBuild: [" + child.name + "] Executing '" + child.command + "'")
+        if isWindows:
+            (args, isShell, groupArgs) = (child.command, True, {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP})
+        elif platform.system() == "Linux":
+            (args, isShell, groupArgs) = ([sys.executable, "-c", pdeathsigLauncherSource, str(os.getpid()), child.command], False, {"start_new_session": True})
+        else:
+            (args, isShell, groupArgs) = (child.command, True, {"start_new_session": True})
+        child.process = subprocess.Popen(args, shell = isShell, cwd = child.cwd, stdin = subprocess.DEVNULL, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True, errors = "replace", bufsize = 1, **groupArgs)
+        if self.job is not None:
+            assignToJob(self.job, child.process.pid)
+        child.startTime = time.time()
+        child.restartTime = None
+        threading.Thread(target = self.streamOutput, args = (child, child.process), daemon = True).start()
+
+    def streamOutput(self, child, process):
+        for line in process.stdout:
+            printLine("[" + child.name + "] " + line.rstrip())
+            for listener in self.outputListeners:
+                listener(child, line)
+
+    # called periodically: detects the exited children and restarts them when their backoff expires. Starts and stops the lazy children on demand.
+    def poll(self):
+        now = time.time()
+        for child in self.children:
+            if self.isStopping:
+                return
+            if child.isLazy:
+                self.pollLazy(child, now)
+                continue
+            if child.process is None or child.process.poll() is None:
+                continue
+            if child.restartTime is None:
+                if not child.isRestarted:
+                    printLine("SqBuild: [" + child.name + "] exited with code %d." % child.process.returncode)
+                    child.process = None
+                    continue
+                if now - child.startTime > stableRunSec:
+                    child.nCrashesInRow = 0
+                backoffSec = min(maxBackoffSec, initialBackoffSec * 2 ** child.nCrashesInRow)
+                child.nCrashesInRow += 1
+                child.restartTime = now + backoffSec
+                printLine("SqBuild: [" + child.name + "] exited with code %d. Restarting in %.1f seconds." % (child.process.returncode, backoffSec))
+            elif now >= child.restartTime:
+                self.start(child)
+
+    def pollLazy(self, child, now):
+        if child.process is not None and child.process.poll() is not None:
+            printLine("SqBuild: [" + child.name + "] exited with code %d. It is started again on the next request." % child.process.returncode)
+            child.process = None
+        if child.process is None:
+            if child.isStartRequested:
+                child.isStartRequested = False
+                self.start(child)
+        else:
+            child.isStartRequested = False  # a proxy thread may have requested it again, while the Popen() of this start was in progress
+            if child.nActiveConnections == 0 and now - child.lastActivityTime > child.idleStopSec:
+                printLine("SqBuild: [" + child.name + "] No request in the last %.0f seconds. Stopping it until the next request." % child.idleStopSec)
+                self.stopChildren([child])
+                child.process = None
+
+    def signalGroup(self, child, isForced):
+        try:
+            if isWindows:   # no SIGTERM for a process tree on Windows
+                subprocess.run("taskkill /F /T /PID " + str(child.process.pid), stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+            else:
+                os.killpg(child.process.pid, signal.SIGKILL if isForced else signal.SIGTERM)   # pgid == pid of the session leader
+        except (ProcessLookupError, PermissionError):
+            pass    # the group is already gone
+
+    # SIGTERM to every process group, then SIGKILL to what is still alive after the grace period. The group is killed even if the shell leader exited already.
+    def stopAll(self):
+        self.isStopping = True
+        self.stopChildren([c for c in self.children if c.process is not None])
+
+    def stopChildren(self, running):
+        for child in running:
+            printLine("SqBuild: [" + child.name + "] Stopping...")
+            self.signalGroup(child, False)
+        deadline = time.time() + stopGraceSec
+        while time.time() < deadline and any(c.process.poll() is None for c in running):
+            time.sleep(0.1)
+        if not isWindows:
+            for child in running:
+                self.signalGroup(child, True)   # the grandchildren may outlive the leader; killpg() reaches them too
+        for child in running:
+            child.process.wait()
+        printLine("SqBuild: %d supervised process(es) stopped." % len(running))
+
+# Blocks until a stop signal, meanwhile restarting the crashed children. Then stops all of them.
+# Stop signals: any message on 'stopPort' (PostDebugWatchDev.py), Ctrl-C, SIGTERM/SIGHUP, or the death of our parent (the VsCode terminal or the shell).
+# The stop message gets a 'stopped' reply after the teardown, so the sender can wait until the ports of the dev servers are free again.
+def runUntilStopSignal(supervisor, stopPort):
+    stopReasons = []
+    def onSignal(signum, frame):
+        stopReasons.append("signal %d" % signum)
+    for signame in ["SIGTERM", "SIGHUP", "SIGBREAK"]:
+        if hasattr(signal, signame):
+            signal.signal(getattr(signal, signame), onSignal)
+
+    # Named pipes are nothing but mechanisms that allow IPC communication through the use of file descriptors associated with special files
+    # Let's use the be basic socket, because it is platform-independent. (and it is not file based), and we can use it easily in C# interop to Python (even under Linux).
+    serverSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    serverSocket.bind(('localhost', stopPort))
+    serverSocket.listen(5)
+    serverSocket.settimeout(0.5)    # wake up regularly for the restarts and the parent check
+    parentPid = os.getppid()
+    parentHandle = openProcessHandle(parentPid) if isWindows else None
+    stopConnection = None
+    printLine("SqBuild: User can break (Control-C, or closing CMD) here manually. Or waiting for a message on TCP port %d (PostDebugWatchDev.py) to stop all the watchers." % stopPort)
+    try:
+        while len(stopReasons) == 0:
+            try:
+                connection, address = serverSocket.accept()
+                connection.settimeout(5.0)
+                buf = connection.recv(64)
+                if len(buf) > 0:
+                    stopReasons.append("socket message " + str(buf))
+                    stopConnection = connection
+                else:
+                    connection.close()
+            except socket.timeout:
+                pass
+            if not isWindows and os.getppid() != parentPid:   # reparented to init (or to a subreaper): our parent died
+                stopReasons.append("parent process %d died" % parentPid)
+            if parentHandle is not None and isProcessHandleSignaled(parentHandle):
+                stopReasons.append("parent process %d died" % parentPid)
+            supervisor.poll()
+    except KeyboardInterrupt:
+        stopReasons.append("Ctrl-C")
+    printLine("SqBuild: Stopping, because of " + stopReasons[0])
+    supervisor.stopAll()
+    serverSocket.close()
+    if stopConnection is not None:
+        try:
+            stopConnection.sendall(b"stopped")
+            stopConnection.close()
+        except OSError:
+            pass
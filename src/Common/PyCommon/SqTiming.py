@@ -0,0 +1,92 @@
+# Phase-level timing records of the build and deploy scripts, appended to a JSONL history file (one JSON object per line), and a report on them.
+# Usage in scripts: 'with SqTiming.PhaseTimer("Deploy", "upload", "SqCoreWeb") as timer: ...; timer.fields["bytes"] = nBytes'
+# Report: 'python SqTiming.py' shows the last run of every phase against the rolling median of the previous runs, and flags the regressions.
+
+import os
+import sys
+import json
+import time
+import datetime
+import threading
+import argparse
+import statistics
+
+historyFileName = os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/../../../logs/SqTimings.jsonl")     # the SqCore/logs folder (not in GitHub), next to the .sqlog files
+runId = datetime.datetime.now().strftime("%Y%m%dT%H%M%S") + "-" + str(os.getpid())     # groups the records of one script run
+historyLock = threading.Lock()  # build steps and deploy targets record from parallel threads
+
+def record(script, phase, sec, target = None, **fields):
+    rec = {"time": datetime.datetime.now().isoformat(timespec = "seconds"), "runId": runId, "script": script, "target": target, "phase": phase, "sec": round(sec, 3)}
+    rec.update(fields)
+    if rec.get("bytes") and sec > 0:
+        rec["MBps"] = round(rec["bytes"] / (1024 * 1024) / sec, 3)
+    with historyLock:
+        os.makedirs(os.path.dirname(historyFileName), exist_ok = True)
+        with open(historyFileName, "a") as file:
+            file.write(json.dumps(rec) + "\n")
+
+class PhaseTimer:
+    def __init__(self, script, phase, target = None):
+        self.script = script
+        self.phase = phase
+        self.target = target
+        self.fields = {}    # extra fields of the record, e.g. 'bytes', 'nFiles'
+
+    def __enter__(self):
+        self.startTime = time.time()
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        record(self.script, self.phase, time.time() - self.startTime, self.target, ok = (excType is None), **self.fields)
+        return False    # don't swallow the exception
+
+def readHistory(fileName):
+    records = []
+    if os.path.isfile(fileName):
+        with open(fileName, "r") as file:
+            for line in file:
+                line = line.strip()
+                if len(line) > 0:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        pass    # a line half-written by a killed script
+    return records
+
+# For every (script, target, phase): the last successful run compared to the median of the 'window' runs before it.
+# A regression is flagged if it is 'threshold' times slower than that median, and at least 'minDeltaSec' slower (so 0.01 -> 0.03 sec is not a regression).
+def report(fileName, window, threshold, minDeltaSec):
+    series = {}
+    for rec in readHistory(fileName):
+        if rec.get("ok", True) and not rec.get("cached", False):    # failed and cache-restored runs would distort the medians
+            series.setdefault((rec["script"], rec.get("target") or "", rec["phase"]), []).append(rec)
+
+    nRegressions = 0
+    print("%-45s %5s %9s %9s %8s %10s  %s" % ("script/target/phase", "runs", "last", "median", "change", "last MB/s", "trend (oldest..last)"))
+    for key in sorted(series.keys()):
+        recs = series[key]
+        last = recs[-1]
+        prevSecs = [r["sec"] for r in recs[-window - 1:-1]]
+        name = "/".join(k for k in key if k != "")
+        trend = " ".join("%.1f" % r["sec"] for r in recs[-8:])
+        if len(prevSecs) == 0:
+            print("%-45s %5d %8.2fs %9s %8s %10s  %s" % (name, len(recs), last["sec"], "-", "-", str(last.get("MBps", "")), trend))
+            continue
+        median = statistics.median(prevSecs)
+        change = (last["sec"] - median) / median * 100 if median > 0 else 0.0
+        isRegression = last["sec"] > median * threshold and last["sec"] - median >= minDeltaSec
+        if isRegression:
+            nRegressions += 1
+        print("%-45s %5d %8.2fs %8.2fs %+7.0f%% %10s  %s%s" % (name, len(recs), last["sec"], median, change, str(last.get("MBps", "")), trend, "  <-- REGRESSION" if isRegression else ""))
+    print("%d regression(s) against the rolling median of the previous %d runs (threshold: x%.2f)." % (nRegressions, window, threshold))
+    return nRegressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Timing report of the build and deploy phases.")
+    parser.add_argument("--file", default = historyFileName, help = "JSONL history file")
+    parser.add_argument("--window", type = int, default = 10, help = "number of previous runs in the rolling median")
+    parser.add_argument("--threshold", type = float, default = 1.25, help = "last/median ratio flagged as regression")
+    parser.add_argument("--minDeltaSec", type = float, default = 0.5, help = "minimum slowdown in seconds flagged as regression")
+    args = parser.parse_args()
+    nRegressions = report(args.file, args.window, args.threshold, args.minDeltaSec)
+    sys.exit(1 if nRegressions > 0 else 0)
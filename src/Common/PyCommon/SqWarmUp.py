@@ -0,0 +1,133 @@
+# Post-deploy warm-up of a restarted web server (SqCoreWeb), run on the server itself by SqDeploy.py, so the timings are the server's, not the network's.
+# 1. Polls the ping path until the server answers: the time to ready (after the restart command).
+# 2. The first request of the key paths: the cold time to first byte (JIT, MemDb, cold file system cache).
+# 3. Requests every static asset of the build manifest (wwwroot/assetManifest.json) in every precompressed encoding, on a few keep-alive connections in parallel: the time to warm.
+# 4. The key paths again: the warm time to first byte.
+# The server side is this same file: it is stdlib only (Python 3.5+), and SqDeploy.openHelperChannel() sends it with the command ('python3 -c').
+# stdin: JSON {"pingPath", "keyPaths": [path], "assets": [[path, acceptEncoding]]}. stdout: one JSON line with the results.
+
+import sys
+import ssl
+import json
+import time
+import threading
+import http.client
+import urllib.parse
+
+def openConnection(baseUrl, timeoutSec):
+    parts = urllib.parse.urlsplit(baseUrl)
+    if parts.scheme == "https":     # localhost: the certificate is for the public name (or it is the ASP.NET default certificate)
+        return http.client.HTTPSConnection(parts.hostname, parts.port or 443, timeout = timeoutSec, context = ssl._create_unverified_context())
+    return http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout = timeoutSec)
+
+# Returns (status, time to first byte ms, total ms, body bytes). A failed request on a kept-alive connection is retried once on a new connection.
+def request(conns, baseUrl, path, acceptEncoding, timeoutSec):
+    for attempt in range(2):
+        if conns[0] is None:
+            conns[0] = openConnection(baseUrl, timeoutSec)
+        try:
+            startTime = time.time()
+            conns[0].request("GET", path, headers = {"Accept-Encoding": acceptEncoding, "User-Agent": "SqWarmUp"})
+            response = conns[0].getresponse()     # returns after the status line and the headers: the first byte is in
+            firstByteTime = time.time()
+            nBytes = len(response.read())
+            return (response.status, (firstByteTime - startTime) * 1000.0, (time.time() - startTime) * 1000.0, nBytes)
+        except (OSError, http.client.HTTPException):
+            conns[0].close()
+            conns[0] = None
+            if attempt == 1:
+                raise
+
+def waitUntilReady(baseUrl, pingPath, readyTimeoutSec):
+    startTime = time.time()
+    while True:
+        conns = [None]
+        try:
+            request(conns, baseUrl, pingPath, "identity", 5.0)
+            return time.time() - startTime
+        except (OSError, http.client.HTTPException):
+            if time.time() - startTime > readyTimeoutSec:
+                return None
+            time.sleep(0.2)
+        finally:
+            if conns[0] is not None:
+                conns[0].close()
+
+def getMedian(values):
+    return sorted(values)[len(values) // 2] if len(values) > 0 else None
+
+def cmdWarm(baseUrl, readyTimeoutSec, nThreads):
+    config = json.loads(sys.stdin.read())
+    result = {"readySec": waitUntilReady(baseUrl, config["pingPath"], readyTimeoutSec)}
+    if result["readySec"] is None:
+        result["error"] = "the server did not answer %s%s in %.0f sec" % (baseUrl, config["pingPath"], readyTimeoutSec)
+        print(json.dumps(result))
+        return
+    conns = [None]
+    keyPathErrors = []
+    coldTtfbs = {}
+    for path in config["keyPaths"]:
+        try:
+            coldTtfbs[path] = round(request(conns, baseUrl, path, "br, gzip", 60.0)[1], 2)
+        except (OSError, http.client.HTTPException) as e:
+            coldTtfbs[path] = None
+            keyPathErrors.append("%s (cold): %s" % (path, e))
+    result["coldTtfbMs"] = coldTtfbs
+
+    warmStartTime = time.time()
+    assets = list(config["assets"])
+    lock = threading.Lock()
+    stats = {"nRequests": 0, "nErrors": 0, "bytes": 0, "ttfbs": [], "errors": []}
+    def warmLoop():
+        threadConns = [None]
+        while True:
+            with lock:
+                if len(assets) == 0:
+                    break
+                (path, acceptEncoding) = assets.pop()
+            try:
+                (status, ttfbMs, totalMs, nBytes) = request(threadConns, baseUrl, path, acceptEncoding, 30.0)
+                isError = status >= 400
+            except (OSError, http.client.HTTPException) as e:
+                (status, ttfbMs, nBytes, isError) = (str(e), None, 0, True)
+            with lock:
+                stats["nRequests"] += 1
+                stats["bytes"] += nBytes
+                if ttfbMs is not None:
+                    stats["ttfbs"].append(ttfbMs)
+                if isError:
+                    stats["nErrors"] += 1
+                    if len(stats["errors"]) < 10:
+                        stats["errors"].append("%s %s: %s" % (path, acceptEncoding, status))
+        if threadConns[0] is not None:
+            threadConns[0].close()
+    threads = [threading.Thread(target = warmLoop) for i in range(nThreads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result["warmSec"] = round(time.time() - warmStartTime, 3)
+    result.update({"nRequests": stats["nRequests"], "nErrors": stats["nErrors"], "bytes": stats["bytes"], "errors": stats["errors"],
+        "assetTtfbMedianMs": round(getMedian(stats["ttfbs"]), 2) if len(stats["ttfbs"]) > 0 else None, "assetTtfbMaxMs": round(max(stats["ttfbs"]), 2) if len(stats["ttfbs"]) > 0 else None})
+
+    warmTtfbs = {}
+    for path in config["keyPaths"]:
+        try:
+            warmTtfbs[path] = round(request(conns, baseUrl, path, "br, gzip", 60.0)[1], 2)
+        except (OSError, http.client.HTTPException) as e:
+            warmTtfbs[path] = None
+            keyPathErrors.append("%s (warm): %s" % (path, e))
+    result["warmTtfbMs"] = warmTtfbs
+    result["errors"] = keyPathErrors + result["errors"]
+    if conns[0] is not None:
+        conns[0].close()
+    print(json.dumps(result))
+
+def main():
+    if len(sys.argv) >= 5 and sys.argv[1] == "warm":
+        cmdWarm(sys.argv[2], float(sys.argv[3]), int(sys.argv[4]))
+    else:
+        sys.exit("Usage (on the server, run by SqDeploy.py): 'warm <baseUrl> <readyTimeoutSec> <nThreads>'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# One file watcher for all the client side builds of the debug session.
+# Linux: inotify (via ctypes, no package needed), one watch per folder of the union of the route roots. Other OSes: one polling scanner of the same folders.
+# The change events are debounced per route, and each change batch runs only the build of the affected route (e.g. 'tsc --incremental' instead of a resident 'tsc --watch').
+# Bundlers without a persistent cache keep their in-memory incremental watcher ('ng serve', webpack 4 '--watch': a one-shot build would rebuild the whole bundle), so their route has no command:
+# the watcher only measures their rebuild from their output.
+# Every batch reports the edit-to-output latency (first change event -> build finished) and records it in SqTiming history ('SqWatch' script).
+
+import os
+import time
+import struct
+import select
+import signal
+import platform
+import threading
+import subprocess
+import SqTiming
+
+debounceSec = 0.3       # a route is built when no change arrived to it in this period (an editor 'Save All', a git checkout is one batch)
+pollIntervalSec = 1.0   # non-Linux fallback scanner
+skippedDirNames = set(["node_modules", "obj", "bin", ".git", ".vs", ".vscode", ".angular", "__pycache__"])
+
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+inotifyMask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE   # not IN_MODIFY: that fires for every write() of a save, IN_CLOSE_WRITE once
+
+# One watched build. 'roots' are folders relative to the project folder, 'fileExts' (e.g. [".ts"]) filters the files, so the outputs written next to the sources don't trigger the build again.
+# 'command' is run for every change batch (it should be incremental, e.g. 'tsc --incremental'). With command=None the route is built by an external watcher (ng serve): 'outputChildName' is its supervisor name,
+# and the lines matching 'okOutputs'/'failedOutputs' finish the batch.
+class WatchRoute:
+    def __init__(self, name, roots, fileExts, command = None, isBuiltAtStart = True, outputChildName = None, okOutputs = None, failedOutputs = None):
+        self.name = name
+        self.roots = [r.rstrip("/") + "/" for r in roots]
+        self.fileExts = fileExts
+        self.command = command
+        self.isBuiltAtStart = isBuiltAtStart
+        self.outputChildName = outputChildName
+        self.okOutputs = okOutputs or []
+        self.failedOutputs = failedOutputs or []
+        self.changedFiles = set()
+        self.firstChangeTime = None     # of the batch being collected
+        self.lastChangeTime = None
+        self.awaitedBatch = None        # command=None routes: (firstChangeTime, nFiles) of the batch waiting for the external build output
+        self.process = None
+
+    def isMatching(self, relPath):
+        return any(relPath.startswith(r) for r in self.roots) and (self.fileExts is None or os.path.splitext(relPath)[1].lower() in self.fileExts)
+
+class InotifyScanner:
+    def __init__(self, projectDir, rootDirs):
+        import ctypes
+        self.libc = ctypes.CDLL("libc.so.6", use_errno = True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init() failed")
+        self.projectDir = projectDir
+        self.dirsByWd = {}
+        for rootDir in rootDirs:
+            self.addTree(projectDir + "/" + rootDir)
+
+    def addTree(self, dirPath):
+        for root, dirs, files in os.walk(dirPath):
+            dirs[:] = [d for d in dirs if d not in skippedDirNames]
+            wd = self.libc.inotify_add_watch(self.fd, root.encode("utf-8"), inotifyMask)
+            if wd >= 0:
+                self.dirsByWd[wd] = root
+
+    # Returns the changed files (relative paths), or None if the kernel queue overflowed (everything has to be considered changed)
+    def getChanges(self, timeoutSec):
+        if len(select.select([self.fd], [], [], timeoutSec)[0]) == 0:
+            return []
+        buf = os.read(self.fd, 256 * 1024)
+        changes = []
+        offset = 0
+        while offset < len(buf):
+            wd, mask, cookie, nameLen = struct.unpack_from("iIII", buf, offset)
+            name = buf[offset + 16 : offset + 16 + nameLen].rstrip(b"\0").decode("utf-8", "replace")
+            offset += 16 + nameLen
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self.dirsByWd.pop(wd, None)     # the folder was deleted
+                continue
+            dirPath = self.dirsByWd.get(wd)
+            if dirPath is None or name == "":
+                continue
+            path = dirPath + "/" + name
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and name not in skippedDirNames:
+                    self.addTree(path)  # a new folder: watch it, and report the files that were created in it before the watch was set
+                    changes += [os.path.relpath(os.path.join(r, f), self.projectDir).replace(os.path.sep, "/") for r, d, fs in os.walk(path) for f in fs]
+                continue
+            changes.append(os.path.relpath(path, self.projectDir).replace(os.path.sep, "/"))
+        return changes
+
+# fallback for Windows/Mac: one scan of the union of the roots every pollIntervalSec, comparing the (mtime, size) of the files
+class PollingScanner:
+    def __init__(self, projectDir, rootDirs):
+        self.projectDir = projectDir
+        self.rootDirs = rootDirs
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for rootDir in self.rootDirs:
+            for root, dirs, files in os.walk(self.projectDir + "/" + rootDir):
+                dirs[:] = [d for d in dirs if d not in skippedDirNames]
+                for f in files:
+                    try:
+                        st = os.stat(os.path.join(root, f))
+                    except OSError:
+                        continue    # deleted during the scan
+                    snapshot[os.path.relpath(os.path.join(root, f), self.projectDir).replace(os.path.sep, "/")] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def getChanges(self, timeoutSec):
+        time.sleep(max(timeoutSec, pollIntervalSec))
+        newSnapshot = self.scan()
+        changes = [f for f, st in newSnapshot.items() if self.snapshot.get(f) != st] + [f for f in self.snapshot if f not in newSnapshot]
+        self.snapshot = newSnapshot
+        return changes
+
+class Watcher:
+    def __init__(self, projectDir, routes, printFunc = print):
+        self.projectDir = projectDir.replace(os.path.sep, "/")
+        self.routes = routes
+        self.printFunc = printFunc
+        self.isStopping = False
+        self.lock = threading.Lock()
+        self.buildRequests = {r.name: threading.Event() for r in routes}
+        allRoots = sorted(set(r.rstrip("/") for route in routes for r in route.roots))
+        self.rootDirs = [r for r in allRoots if not any(r.startswith(o + "/") for o in allRoots)]  # a nested root is watched only once, by its ancestor
+
+    def start(self):
+        if platform.system() == "Linux":
+            self.scanner = InotifyScanner(self.projectDir, self.rootDirs)
+        else:
+            self.scanner = PollingScanner(self.projectDir, self.rootDirs)
+        self.printFunc("SqBuild: [SqWatch] Watching %s with %s, %d routes." % (", ".join(self.rootDirs), type(self.scanner).__name__, len(self.routes)))
+        threading.Thread(target = self.eventLoop, daemon = True).start()
+        for route in self.routes:
+            if route.command is not None:
+                threading.Thread(target = self.buildLoop, args = (route,), daemon = True).start()
+                if route.isBuiltAtStart:
+                    with self.lock:
+                        route.firstChangeTime = time.time()     # the initial build is reported as a batch too, 0 files changed
+                    self.buildRequests[route.name].set()
+
+    def stop(self):
+        self.isStopping = True
+        for route in self.routes:
+            process = route.process
+            if process is not None and process.poll() is None:
+                try:
+                    if platform.system() == "Windows":
+                        subprocess.run("taskkill /F /T /PID " + str(process.pid), stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+                    else:
+                        os.killpg(process.pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+
+    # routes the change events, and releases the debounced batches
+    def eventLoop(self):
+        while not self.isStopping:
+            changes = self.scanner.getChanges(debounceSec / 3)
+            now = time.time()
+            with self.lock:
+                for route in self.routes:
+                    matching = [f for f in changes if route.isMatching(f)] if changes is not None else ["*"]
+                    if len(matching) > 0:
+                        route.changedFiles.update(matching)
+                        route.lastChangeTime = now
+                        if route.firstChangeTime is None:
+                            route.firstChangeTime = now
+                    if route.lastChangeTime is not None and now - route.lastChangeTime >= debounceSec and len(route.changedFiles) > 0:
+                        if route.command is not None:
+                            self.buildRequests[route.name].set()
+                        elif route.awaitedBatch is None:
+                            route.awaitedBatch = (route.firstChangeTime, len(route.changedFiles))
+                            route.changedFiles = set()
+                            route.firstChangeTime = None
+
+    # one build at a time per route. Changes arriving during a build are collected into the next batch.
+    def buildLoop(self, route):
+        event = self.buildRequests[route.name]
+        while not self.isStopping:
+            event.wait()
+            event.clear()
+            with self.lock:
+                changedFiles = route.changedFiles
+                firstChangeTime = route.firstChangeTime
+                route.changedFiles = set()
+                route.firstChangeTime = None
+            if firstChangeTime is None:
+                continue
+            startTime = time.time()
+            route.process = subprocess.Popen(route.command, shell = True, cwd = self.projectDir, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True, errors = "replace", start_new_session = (platform.system() != "Windows"))
+            for line in route.process.stdout:
+                self.printFunc("[" + route.name + "] " + line.rstrip())
+            isOk = (route.process.wait() == 0)
+            if self.isStopping:
+                break
+            self.reportBatch(route, firstChangeTime, len(changedFiles), isOk, time.time() - startTime)
+
+    def reportBatch(self, route, firstChangeTime, nFiles, isOk, buildSec):
+        latencySec = time.time() - firstChangeTime
+        buildInfo = " in %.2fs" % buildSec if buildSec is not None else ""
+        self.printFunc("SqBuild: [SqWatch] %s: %d changed file(s) -> build %s%s, edit-to-output %.2fs" % (route.name, nFiles, "OK" if isOk else "FAILED", buildInfo, latencySec))
+        SqTiming.record("SqWatch", route.name, latencySec, ok = isOk, buildSec = round(buildSec, 3) if buildSec is not None else None, nFiles = nFiles)
+
+    # Output listener of the supervisor: finishes the batch of a command=None route when its external watcher reports the rebuild
+    def onOutputLine(self, child, line):
+        for route in self.routes:
+            if route.outputChildName != child.name:
+                continue
+            isOk = any(p in line for p in route.okOutputs)
+            if not isOk and not any(p in line for p in route.failedOutputs):
+                continue
+            with self.lock:
+                batch = route.awaitedBatch
+                route.awaitedBatch = None
+            if batch is not None and batch[0] >= child.startTime:    # a change before a (lazy) start is compiled by the initial build, that is not an edit-to-refresh time
+                self.reportBatch(route, batch[0], batch[1], isOk, None)
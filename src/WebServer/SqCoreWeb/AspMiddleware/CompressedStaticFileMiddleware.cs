@@ -10,10 +10,20 @@ using System;
 using System.Collections.Generic;
 using System.IO;
 using System.Linq;
+using System.Text.Json;
 using System.Threading.Tasks;
 
 namespace SqCoreWeb
 {
+    // an entry of wwwroot/assetManifest.json, written by BuildAllProd.py (SqBuild.fingerprintAssets()) into the published wwwroot
+    public class StaticAsset
+    {
+        public string ServedPath { get; set; } = string.Empty;     // content-hashed path, e.g. '/images/logo.1a2b3c4d5e.png', or the logical path if the file is not renamed (HTML)
+        public long Size { get; set; }
+        public Dictionary<string, long> Encodings { get; set; } = new Dictionary<string, long>();   // "br", "gzip" -> size of the precompressed variant
+        public bool IsImmutable { get; set; }    // requested by its content-hashed path: that URL never changes content
+    }
+
     public class CompressedStaticFileMiddleware
     {
         private static Dictionary<string, string> compressionTypes =
@@ -21,10 +31,14 @@ namespace SqCoreWeb
             {
                 { "gzip", ".gz" }, {"br", ".br" }
             };
+        public const string AssetManifestFileName = "assetManifest.json";
+        private const string ImmutableItemKey = "SqImmutableStaticAsset";
 
         private readonly IOptions<StaticFileOptions> _staticFileOptions;
         private readonly StaticFileMiddleware _base;
         private readonly ILogger _logger;
+        // Request path -> asset. Both the logical and the content-hashed paths are keys. Loaded once at startup. If there is no manifest (Development), the compressed variants are probed on the file system per request.
+        private readonly Dictionary<string, StaticAsset>? _assets;
 
         public CompressedStaticFileMiddleware(RequestDelegate next, IWebHostEnvironment hostingEnv, IOptions<StaticFileOptions> staticFileOptions, ILoggerFactory loggerFactory)
         {
@@ -48,6 +62,7 @@ namespace SqCoreWeb
 
             this._staticFileOptions = staticFileOptions ?? throw new ArgumentNullException(nameof(staticFileOptions));
             InitializeStaticFileOptions(hostingEnv, staticFileOptions);
+            _assets = LoadAssetManifest(staticFileOptions.Value.FileProvider);
 
             _base = new StaticFileMiddleware(next, hostingEnv, staticFileOptions, loggerFactory);
         }
@@ -80,11 +95,44 @@ namespace SqCoreWeb
                             ctx.File.PhysicalPath.Length - fileExtension.Length, fileExtension.Length), out contentType))
                             ctx.Context.Response.ContentType = contentType;
                         ctx.Context.Response.Headers.Add("Content-Encoding", new[] { compressionType });
+                        ctx.Context.Response.Headers[Microsoft.Net.Http.Headers.HeaderNames.Vary] = "Accept-Encoding";
                     }
                 }
+                // a content-hashed URL never changes content: the browser can cache it forever, and doesn't even revalidate it on reload. (Overwrites the Cache-Control of the Startup.cs middleware)
+                if (ctx.Context.Items.ContainsKey(ImmutableItemKey))
+                    ctx.Context.Response.Headers[Microsoft.Net.Http.Headers.HeaderNames.CacheControl] = "public, max-age=31536000, immutable";
             };
         }
 
+        private Dictionary<string, StaticAsset>? LoadAssetManifest(IFileProvider fileProvider)
+        {
+            var manifestFile = fileProvider.GetFileInfo(AssetManifestFileName);
+            if (!manifestFile.Exists)
+                return null;
+            try
+            {
+                var assets = new Dictionary<string, StaticAsset>(StringComparer.OrdinalIgnoreCase);
+                using var stream = manifestFile.CreateReadStream();
+                using var doc = JsonDocument.Parse(stream);
+                foreach (var assetJson in doc.RootElement.GetProperty("assets").EnumerateObject())
+                {
+                    var asset = new StaticAsset() { ServedPath = assetJson.Value.GetProperty("path").GetString() ?? assetJson.Name, Size = assetJson.Value.GetProperty("size").GetInt64() };
+                    foreach (var encodingJson in assetJson.Value.GetProperty("encodings").EnumerateObject())
+                        asset.Encodings[encodingJson.Name] = encodingJson.Value.GetInt64();
+                    assets[assetJson.Name] = asset;
+                    if (asset.ServedPath != assetJson.Name)
+                        assets[asset.ServedPath] = new StaticAsset() { ServedPath = asset.ServedPath, Size = asset.Size, Encodings = asset.Encodings, IsImmutable = true };
+                }
+                Console.WriteLine($"CompressedStaticFileMiddleware: {AssetManifestFileName} is loaded with {assets.Count} request paths.");
+                return assets;
+            }
+            catch (Exception e)
+            {
+                _logger.LogError(e, $"CompressedStaticFileMiddleware: {AssetManifestFileName} cannot be loaded. Probing the compressed files per request.");
+                return null;
+            }
+        }
+
         public Task Invoke(HttpContext context)
         {
             if (context.Request.Path.HasValue)
@@ -96,6 +144,11 @@ namespace SqCoreWeb
 
         private void ProcessRequest(HttpContext context)
         {
+            if (_assets != null)
+            {
+                ProcessRequestByManifest(context, _assets);
+                return;
+            }
             var fileSystem = _staticFileOptions.Value.FileProvider;
             var originalFile = fileSystem.GetFileInfo(context.Request.Path);
 
@@ -131,6 +184,28 @@ namespace SqCoreWeb
             }
         }
 
+        // no file system access: the served path and the smallest supported variant come from the manifest.
+        // A path that is not in the manifest is passed to StaticFileMiddleware as it is (not a static file, or a file added after the build).
+        private void ProcessRequestByManifest(HttpContext context, Dictionary<string, StaticAsset> assets)
+        {
+            if (!assets.TryGetValue(context.Request.Path.Value, out StaticAsset? asset))
+                return;
+
+            string servedPath = asset.ServedPath;
+            long servedSize = asset.Size;
+            foreach (var compressionType in GetSupportedEncodings(context))
+            {
+                if (asset.Encodings.TryGetValue(compressionType, out long size) && size < servedSize)
+                {
+                    servedPath = asset.ServedPath + compressionTypes[compressionType];
+                    servedSize = size;
+                }
+            }
+            if (asset.IsImmutable)
+                context.Items[ImmutableItemKey] = true;
+            context.Request.Path = new PathString(servedPath);
+        }
+
         /// <summary>
         /// Find the encodings that are supported by the browser and by this middleware
         /// </summary>
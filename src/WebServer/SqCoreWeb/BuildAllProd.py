@@ -1,66 +1,72 @@
 import os
-import subprocess
 import platform
 import sys
-from pathlib import Path
-import fileinput
+import shutil
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../Common/PyCommon")
+import SqBuild
 
-print("SqBuild: Python ver: " + platform.python_version() + " (" + platform.architecture()[0] + "), CWD:'" + os. getcwd() + "'")
-if (os.getcwd().endswith("SqCore")) : # VsCode's context menu 'Run Python file in Terminal' runs it from the workspace folder. VsCode F5 runs it from the project folder. We change it to the project folder
-    os.chdir(os.getcwd() + "/src/WebServer/SqCoreWeb")
-
-# 1. Basic checks: Ensure Node.js is installed. If node_modules folder is empty, it should restore Npm packages.
-nodeTouchFile = os.getcwd() + "/node_modules/.install-stamp"
-if os.path.isfile(nodeTouchFile):
-    print ("SqBuild: /node_modules/ exist")
-else:
-    nodeRetCode = os.system("node --version")   # don't want to run 'node --version' all the times. If stamp file exists, assume node.exe is installed
-    if (nodeRetCode != 0) :
-        sys.exit("SqBuild: Node.js is required to build and run this project. To continue, please install Node.js from https://nodejs.org/")
-    angularRetCode = os.system("ng --version")
-    if (angularRetCode != 0) :
-        sys.exit("SqBuild: NodeJs's AngularCLI is required to build and run this project. To continue, please install 'npm install -g @angular/cli@9.0.0-rc.10' on (2020-01-29) ")
-    os.system("npm install")
-    Path(nodeTouchFile).touch()
-
-# 2.1. Non-Webpack webapps in ./wwwroot/webapps should be transpiled from TS to JS
-print("\nSqBuild: Executing 'tsc.exe'")
-os.system("tsc")    # works like normal, loads ./tsconfig.json, which contains "include": ["wwwroot"]. 
-
-# 2.2. Webpack webapps in ./webapps should be packed (TS, CSS, HTML)
-# npm install -D clean-webpack-plugin css-loader html-webpack-plugin mini-css-extract-plugin ts-loader typescript webpack webpack-cli
-# Webpack: 'Multiple output files' are not possible and out of scope of webpack. You can use a build system.
-print("\nSqBuild: Executing 'npx webpack --mode=production'")
-os.system("npx webpack --config webapps/ExampleCsServerPushInRealtime/webpack.config.js --mode=production")
-
-# 2.3. Angular webapps in  ./Angular should be built
-print("\nSqBuild: Executing Angular 'ng build...'")
-os.system("ng build HealthMonitor --prod --output-path=wwwroot/webapps/HealthMonitor --base-href ./")
-os.system("ng build MarketDashboard --prod --output-path=wwwroot/webapps/MarketDashboard --base-href ./")
+# NLog.config: fileName="${basedir}/../../../../../../logs/SqCoreWeb.${date:format=yyyy-MM-dd}.sqlog" should be changed to fileName="${basedir}/../logs/SqCoreWeb.${date:format=yyyy-MM-dd}.sqlog"
+# This should not be done in the local Debug or Release folders, only the Publish folder.
+# (not with fileinput inplace=True: that redirects sys.stdout, which would catch the prints of the parallel build steps)
+def modifyPublishedNLogConfig():
+    print("SqBuild: Modifying NLog.config for Linux logs folder.")
+    nlogConfigFileName = "bin/Release/netcoreapp3.1/publish/NLog.config"
+    with open(nlogConfigFileName, "r") as file:
+        content = file.read()
+    shutil.copyfile(nlogConfigFileName, nlogConfigFileName + ".bak")
+    with open(nlogConfigFileName, "w") as file:
+        file.write(content.replace("{basedir}/../../../../../../logs", "{basedir}/../logs"))
 
-# 3. Brotli-ing text (HTML, JS, CSS) files in wwwroot.
-print ("\nSqBuild: !!!!!!!!!!!! Brotli-ing text files... (brotli(x64).exe runs only in Python x64) !!!!!!!!!!")
-for dir in os.walk("wwwroot"):
-    # print("directory: " + dir[0])
-    for file in dir[2]:
-        fileName = os.path.splitext(file)
-        fileExt = fileName[1]
-        # normal (non-debug) user should not downoald TS, MAP files, so don't increase the footprint by brotling them.
-        if (fileExt == ".html" or fileExt == ".js" or fileExt == ".css" or fileExt == ".json" or fileExt == ".xml" or fileExt == ".txt"):
-            print("SqBuild: Brotli-ing: " + dir[0] + "\\" + fileName[0] + fileExt)
-            os.system("c:/windows/system32/brotli.exe " +dir[0]+ "/" + file + ' --best --force --verbose')
+# the guard is needed, because the workers of the compression process pool import this script again on Windows. Without it, they would rerun the whole build.
+if __name__ == "__main__":
+    print("SqBuild: Python ver: " + platform.python_version() + " (" + platform.architecture()[0] + "), CWD:'" + os. getcwd() + "'")
+    if (os.getcwd().endswith("SqCore")) : # VsCode's context menu 'Run Python file in Terminal' runs it from the workspace folder. VsCode F5 runs it from the project folder. We change it to the project folder
+        os.chdir(os.getcwd() + "/src/WebServer/SqCoreWeb")
 
-# 4. DotNet (C#) build RELEASE and Publish
-print("\nSqBuild: Executing 'dotnet publish...'")
-os.system("dotnet publish --configuration Release SqCoreWeb.csproj /property:GenerateFullPaths=true")
+    # 1. Basic checks: Ensure Node.js and AngularCLI are installed, and node_modules matches package-lock.json ('npm ci' only if the lock file or the tool versions changed).
+    SqBuild.ensureNodeModules({"node": "SqBuild: Node.js is required to build and run this project. To continue, please install Node.js from https://nodejs.org/",
+        "ng": "SqBuild: NodeJs's AngularCLI is required to build and run this project. To continue, please install 'npm install -g @angular/cli@9.0.0-rc.10' on (2020-01-29) "}, "BuildAllProd")
 
-# 5. Postprocess the published folder. (before deploying to Linux)
-# NLog.config: fileName="${basedir}/../../../../../../logs/SqCoreWeb.${date:format=yyyy-MM-dd}.sqlog" should be changed to fileName="${basedir}/../logs/SqCoreWeb.${date:format=yyyy-MM-dd}.sqlog"
-# This should not be done in the local Debug or Release folders, only the Publish folder.
-print("\nSqBuild: Modifying NLog.config for Linux logs folder.")
-with fileinput.FileInput("bin/Release/netcoreapp3.1/publish/NLog.config", inplace=True, backup='.bak') as file:
-    for line in file:
-        print(line.replace("{basedir}/../../../../../../logs", "{basedir}/../logs"), end='')
+    # 2. The build steps as a DAG. Independent steps run in parallel (tsc, webpack, the Angular builds and the C# build), compression waits for all the wwwroot outputs, publish waits for everything.
+    # The output of each step is captured into obj/SqBuild/logs/<step>.log. The first failing step stops the build.
+    # Steps with inputs/outputs are skipped (outputs restored from obj/SqBuild/cache) if their input files, config files and tool versions didn't change. ('*' in a pattern matches across folders)
+    npmInputs = ["package-lock.json", "tsconfig.json"]
+    ngInputs = npmInputs + ["angular.json", "node_modules/@angular/cli/package.json", "node_modules/@angular/compiler-cli/package.json", "projects/sq-ng-common/*"]
+    angularOutputDirs = ["wwwroot/webapps/HealthMonitor/*", "wwwroot/webapps/MarketDashboard/*", "wwwroot/webapps/ExampleCsServerPushInRealtime/*"]
+    buildSteps = [
+        # 2.1. Non-Webpack webapps in ./wwwroot/webapps should be transpiled from TS to JS
+        SqBuild.BuildStep("tsc", command = "tsc", inputs = npmInputs + ["node_modules/typescript/package.json", "wwwroot/*.ts"],
+            outputs = ["wwwroot/*.js", "wwwroot/*.js.map"] + ["!" + d for d in angularOutputDirs]),    # works like normal, loads ./tsconfig.json, which contains "include": ["wwwroot"]. 
+        # 2.2. Webpack webapps in ./webapps should be packed (TS, CSS, HTML)
+        # npm install -D clean-webpack-plugin css-loader html-webpack-plugin mini-css-extract-plugin ts-loader typescript webpack webpack-cli
+        # Webpack: 'Multiple output files' are not possible and out of scope of webpack. You can use a build system.
+        SqBuild.BuildStep("webpack", command = "npx webpack --config webapps/ExampleCsServerPushInRealtime/webpack.config.js --mode=production", memMB = 800,
+            inputs = npmInputs + ["node_modules/webpack/package.json", "node_modules/typescript/package.json", "webapps/ExampleCsServerPushInRealtime/*"], outputs = ["wwwroot/webapps/ExampleCsServerPushInRealtime/*"]),
+        # 2.3. Angular webapps in  ./Angular should be built. ngcc (Ivy compatibility compiler) runs once before them, otherwise the two parallel 'ng build' would both process (and lock) node_modules.
+        SqBuild.BuildStep("ngcc", command = "npx ngcc --properties es2015 browser module main --first-only", memMB = 800),
+        SqBuild.BuildStep("ngHealthMonitor", command = "ng build HealthMonitor --prod --output-path=wwwroot/webapps/HealthMonitor --base-href ./", dependsOn = ["ngcc"], memMB = 1500,
+            inputs = ngInputs + ["projects/HealthMonitor/*"], outputs = ["wwwroot/webapps/HealthMonitor/*"]),
+        SqBuild.BuildStep("ngMarketDashboard", command = "ng build MarketDashboard --prod --output-path=wwwroot/webapps/MarketDashboard --base-href ./", dependsOn = ["ngcc"], memMB = 1500,
+            inputs = ngInputs + ["projects/MarketDashboard/*"], outputs = ["wwwroot/webapps/MarketDashboard/*"]),
+        # 3. Brotli-ing and gzip-ing text (HTML, JS, CSS) files in wwwroot. On all cores, in-process, only the files that changed since the last build.
+        # normal (non-debug) user should not downoald TS, MAP files, so don't increase the footprint by compressing them.
+        SqBuild.BuildStep("compress", func = lambda: SqBuild.compressStaticFiles("wwwroot", set([".html", ".js", ".css", ".json", ".xml", ".txt"]), "obj/SqBuild/compressCache.json"),
+            dependsOn = ["tsc", "webpack", "ngHealthMonitor", "ngMarketDashboard"], memMB = 1000),
+        # 4. DotNet (C#) build RELEASE and Publish. The C# compilation doesn't need wwwroot, so it runs parallel with the webapps. Publish (copying wwwroot) only after the compression.
+        SqBuild.BuildStep("dotnetBuild", command = "dotnet build --configuration Release SqCoreWeb.csproj /property:GenerateFullPaths=true", memMB = 1000, versionCommand = "dotnet --version",
+            inputs = ["*.cs", "*.cshtml", "*.csproj", "*.json", "!wwwroot/*", "!node_modules/*", "!projects/*.json", "NLog.config", "../../Common/*.cs", "../../Common/*.csproj"],
+            outputs = ["bin/Release/netcoreapp3.1/*", "!bin/Release/netcoreapp3.1/publish/*", "obj/Release/*"]),
+        SqBuild.BuildStep("dotnetPublish", command = "dotnet publish --no-build --configuration Release SqCoreWeb.csproj /property:GenerateFullPaths=true", dependsOn = ["dotnetBuild", "compress"]),
+        # 5. Postprocess the published folder. (before deploying to Linux)
+        SqBuild.BuildStep("nlogConfig", func = modifyPublishedNLogConfig, dependsOn = ["dotnetPublish"], memMB = 0),
+        # content-hashed names for the static assets of the published wwwroot (the source wwwroot keeps the stable names for debugging), and the asset manifest for CompressedStaticFileMiddleware.
+        # The Angular and webpack outputs are already hashed by their bundlers.
+        SqBuild.BuildStep("fingerprint", func = lambda: SqBuild.fingerprintAssets("bin/Release/netcoreapp3.1/publish/wwwroot", set([".js", ".css", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".woff", ".woff2", ".ttf"]),
+            ["webapps/HealthMonitor", "webapps/MarketDashboard", "webapps/ExampleCsServerPushInRealtime"], "bin/Release/netcoreapp3.1/publish/wwwroot/assetManifest.json"), dependsOn = ["dotnetPublish"], memMB = 0),
+    ]
+    isBuildOk = SqBuild.runBuildSteps(buildSteps, timingScript = "BuildAllProd")
 
-print("\nScroll up to check that all build parts were succesful! We pause to prevent VsCode tasks.json to close the CMD.")
-os.system("pause")  # To prevent tasks.json to close the CMD window. This will generate a pause and will ask user to press any key to continue.
\ No newline at end of file
+    print("\nScroll up to check that all build parts were succesful! We pause to prevent VsCode tasks.json to close the CMD.")
+    os.system("pause")  # To prevent tasks.json to close the CMD window. This will generate a pause and will ask user to press any key to continue.
+    if not isBuildOk:
+        sys.exit("SqBuild: Build FAILED.")
\ No newline at end of file
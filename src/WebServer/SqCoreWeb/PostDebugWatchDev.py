@@ -1,13 +1,23 @@
 import os
 import platform
-import time
 import socket
 
 print("SqBuild: Python ver: " + platform.python_version() + " (" + platform.architecture()[0] + "), CWD:'" + os. getcwd() + "'")
 if (os.getcwd().endswith("SqCore")) : # VsCode's context menu 'Run Python file in Terminal' runs it from the workspace folder. VsCode F5 runs it from the project folder. We change it to the project folder
     os.chdir(os.getcwd() + "/src/WebServer/SqCoreWeb")
 
-print("SqBuild: KILL the PreDebug (F5) Watch process manually now. Later this Python code will try to send a message to the other Python processes (file polling or IP port) to terminate themselves.")
+# Ask PreDebugWatchDev.py to stop its watchers, and wait for its 'stopped' reply, so the ports of the 'ng serve' processes are free again for the next F5.
 clientsocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-clientsocket.connect(('localhost', 8389))
-clientsocket.send(bytes('hello', 'UTF-8'))
\ No newline at end of file
+try:
+    clientsocket.connect(('localhost', 8389))
+except ConnectionRefusedError:
+    print("SqBuild: PreDebugWatchDev.py is not running. Nothing to stop.")
+    quit()
+clientsocket.settimeout(30.0)
+clientsocket.send(bytes('hello', 'UTF-8'))
+try:
+    reply = clientsocket.recv(64)
+    print("SqBuild: PreDebugWatchDev.py " + ("stopped all watchers." if reply == b"stopped" else "closed the connection."))
+except socket.timeout:
+    print("SqBuild: PreDebugWatchDev.py didn't confirm the stop in time. KILL the PreDebug (F5) Watch process manually.")
+clientsocket.close()
\ No newline at end of file
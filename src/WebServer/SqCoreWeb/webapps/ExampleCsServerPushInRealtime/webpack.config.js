@@ -41,6 +41,9 @@ module.exports = {
         new HtmlWebpackInlineSourcePlugin(HtmlWebpackPlugin),
         new MiniCssExtractPlugin({
             filename: "./css/[name].[chunkhash].css"
-        })
+        }),
+        {   // one status line per (re)compilation: the 'webpack --watch' of PreDebugWatchDev.py is measured by SqWatch from these lines (the stats output has no end marker)
+            apply: (compiler) => compiler.hooks.done.tap("SqWatchStatus", (stats) => console.log(stats.hasErrors() ? "SqWatch: webpack failed to compile." : "SqWatch: webpack compiled successfully."))
+        }
     ]
 };
\ No newline at end of file